@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import json
+import threading
+
+from cloud_storage import cloud_storage as cs
+
+# # brotli is optional, without it we only publish gzip
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi as brotli
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        brotli = None
+        BROTLI_AVAILABLE = False
+
+# # our prebuilt api responses live in the bucket under this prefix, next to a manifest of their etags
+API_PAYLOAD_PREFIX = 'api/'
+API_MANIFEST_FILENAME = API_PAYLOAD_PREFIX + 'manifest.json'
+
+# # the file extension each content encoding is stored under, in the order we prefer to serve them
+ENCODING_EXTENSION_DICT = {
+    'br': '.json.br',
+    'gzip': '.json.gz'
+}
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# # one api response, its json body in every encoding we have and the etag all of them share
+class ApiPayload:
+
+    def __init__(self, etag, body_dict):
+        self.etag = etag
+        self.body_dict = body_dict
+        self._lock = threading.Lock()
+
+    # # the plain json is only decompressed for the rare client that doesn't accept gzip
+    def get_body(self, encoding):
+
+        if encoding == 'identity':
+            with self._lock:
+                if 'identity' not in self.body_dict:
+                    self.body_dict['identity'] = gzip.decompress(self.body_dict['gzip'])
+
+        return self.body_dict[encoding]
+
+    # # br over gzip over plain json, accept_encodings is werkzeug's request.accept_encodings
+    def choose_encoding(self, accept_encodings):
+
+        for encoding in ENCODING_EXTENSION_DICT:
+            if encoding in self.body_dict and accept_encodings[encoding] > 0:
+                return encoding
+
+        return 'identity'
+
+def get_etag(json_bytes):
+    return hashlib.sha256(json_bytes).hexdigest()[:32]
+
+# # compresses a json body once so serving it costs nothing, mtime=0 keeps the gzip bytes the same for the same json
+def encode_payload(json_bytes):
+
+    body_dict = {'gzip': gzip.compress(json_bytes, compresslevel=GZIP_LEVEL, mtime=0)}
+
+    if BROTLI_AVAILABLE:
+        body_dict['br'] = brotli.compress(json_bytes, quality=BROTLI_QUALITY)
+
+    return ApiPayload(get_etag(json_bytes), body_dict)
+
+def get_payload_filename(payload_name, encoding):
+    return API_PAYLOAD_PREFIX + payload_name + ENCODING_EXTENSION_DICT[encoding]
+
+# # uploads every encoding of every payload and then the manifest, so a reader never finds a manifest pointing at bodies that aren't there yet
+def write_payloads_to_cloud_storage(payload_dict, bucketname):
+
+    manifest_dict = {}
+
+    for payload_name, payload in payload_dict.items():
+        for encoding, body in payload.body_dict.items():
+            if encoding == 'identity':
+                continue
+
+            cs.write_bytes_to_cloud_storage(body, get_payload_filename(payload_name, encoding), bucketname, content_type='application/json')
+
+        manifest_dict[payload_name] = {
+            'etag': payload.etag,
+            'encodings': [encoding for encoding in payload.body_dict if encoding != 'identity']
+        }
+
+    cs.write_bytes_to_cloud_storage(json.dumps(manifest_dict).encode('utf-8'), API_MANIFEST_FILENAME, bucketname, content_type='application/json')
+
+    return manifest_dict
+
+# # reads one published payload back, raises cs.StorageNotFoundError if it was never published
+def read_payload_from_cloud_storage(payload_name, bucketname):
+
+    manifest_dict = json.loads(cs.read_bytes_from_cloud_storage(API_MANIFEST_FILENAME, bucketname))
+
+    if payload_name not in manifest_dict:
+        raise cs.StorageNotFoundError(f"{payload_name} is not in {API_MANIFEST_FILENAME}")
+
+    body_dict = {encoding: cs.read_bytes_from_cloud_storage(get_payload_filename(payload_name, encoding), bucketname) for encoding in manifest_dict[payload_name]['encodings']}
+
+    return ApiPayload(manifest_dict[payload_name]['etag'], body_dict)
@@ -0,0 +1,72 @@
+import io
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_utils import best_time, load_main_functions, print_table
+from bench_tvl_schema import make_synthetic_merged_csv
+
+# # (pools, days) in a published super_fest file
+SIZE_LIST = [(50, 365), (200, 365)]
+
+def main():
+
+    # # get_incentive_combo_list reads protocol_incentive_history.csv from our working directory
+    os.chdir(tempfile.mkdtemp())
+
+    get_pool_tvl_response_json, get_incentive_combo_list = load_main_functions('get_pool_tvl_response_json', 'get_incentive_combo_list')
+
+    import main
+    from api_payload import api_payload
+
+    row_list = []
+
+    for pools, days in SIZE_LIST:
+        # # how the pool endpoint reads super_fest.zip, every column as strings
+        df = pd.read_csv(io.StringIO(make_synthetic_merged_csv(pools, days)), dtype=str)
+
+        for column in ['tvl_to_incentive_roi_percentage', 'adjusted_token_usd_amount', 'adjusted_raw_change_in_usd', 'adjusted_incentives_per_day_usd', 'adjusted_percentage_change_in_usd', 'adjusted_tvl_to_incentive_roi_percentage']:
+            df[column] = df['token_usd_amount']
+
+        # # every pool has incentives so all of them get served
+        df[['chain', 'protocol', 'token', 'pool_type']].drop_duplicates().rename(columns={'protocol': 'protocol_slug'}).to_csv('protocol_incentive_history.csv', index=False)
+        get_incentive_combo_list.cache_clear()
+
+        # # what every request used to cost
+        def build_response():
+            return get_pool_tvl_response_json(df) + b'\n'
+
+        json_bytes = build_response()
+        payload = api_payload.encode_payload(json_bytes)
+
+        # # what a request costs now, serve_api_payload with the published payload already loaded
+        main.get_api_payload = lambda payload_name: payload
+
+        def serve_response():
+            with main.app.test_request_context(headers={'Accept-Encoding': 'gzip, deflate, br'}):
+                return main.serve_api_payload(main.POOL_TVL_PAYLOAD_NAME)
+
+        build_time = best_time(build_response)
+        serve_time = best_time(serve_response, repeat=20)
+        encode_time = best_time(lambda: api_payload.encode_payload(json_bytes))
+
+        row_list.append((
+            pools * days,
+            f"{len(json_bytes) / 1024:.0f}",
+            f"{len(payload.body_dict['gzip']) / 1024:.0f}",
+            f"{build_time * 1000:.1f}",
+            f"{serve_time * 1000:.3f}",
+            f"{encode_time * 1000:.1f}",
+            f"{build_time / serve_time:.0f}x"
+        ))
+
+    print_table(row_list, ['rows', 'json_kb', 'gzip_kb', 'per_request_before_ms', 'per_request_now_ms', 'publish_encode_ms', 'speedup'])
+
+    return
+
+if __name__ == '__main__':
+    main()
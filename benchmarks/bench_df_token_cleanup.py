@@ -0,0 +1,87 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_utils import load_main_functions, best_time, print_table
+
+# # (config rows, days of history) we benchmark at
+SIZE_LIST = [(4, 90), (40, 90), (40, 365), (200, 365)]
+
+# # the triple nested loop df_token_cleanup used before it became a semi-join
+def legacy_df_token_cleanup(protocol_df, df):
+
+    unique_slugs = protocol_df['protocol_slug'].unique()
+
+    df_list = []
+
+    for unique_slug in unique_slugs:
+
+        temp_config_df = protocol_df.loc[protocol_df['protocol_slug'] == unique_slug]
+
+        unique_tokens = temp_config_df['token'].unique()
+
+        for token in unique_tokens:
+            temp_temp_config_df = temp_config_df.loc[temp_config_df['token'] == token]
+
+            unique_pool_types = temp_temp_config_df['pool_type'].unique()
+
+            for unique_pool in unique_pool_types:
+                temp_df = df.loc[(df['protocol'] == unique_slug) & (df['token'] == token)  & (df['pool_type'] == unique_pool)]
+
+                if len(temp_df) > 0:
+                    df_list.append(temp_df)
+
+    df = pd.concat(df_list)
+
+    return df
+
+# # makes a protocol_pool.csv style config and a tvl history that also holds tokens we don't track
+def make_synthetic_data(config_rows, days, seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    slug_count = max(1, config_rows // 4)
+    slug_list = [f"protocol-{i}" for i in range(slug_count)]
+    token_list = [f"TOKEN{i}" for i in range(8)]
+    pool_type_list = ['supply', 'borrow']
+
+    protocol_df = pd.DataFrame({
+        'protocol_slug': rng.choice(slug_list, config_rows),
+        'token': rng.choice(token_list[:4], config_rows),
+        'pool_type': rng.choice(pool_type_list, config_rows)
+    })
+
+    date_list = pd.date_range('2024-07-08', periods=days).date
+
+    df = pd.MultiIndex.from_product([date_list, slug_list, token_list, pool_type_list], names=['date', 'protocol', 'token', 'pool_type']).to_frame(index=False)
+    df['token_usd_amount'] = rng.random(len(df)) * 1e6
+
+    return protocol_df, df
+
+def main():
+
+    df_token_cleanup, = load_main_functions('df_token_cleanup')
+
+    row_list = []
+
+    for config_rows, days in SIZE_LIST:
+        protocol_df, df = make_synthetic_data(config_rows, days)
+
+        pd.testing.assert_frame_equal(legacy_df_token_cleanup(protocol_df, df), df_token_cleanup(protocol_df, df))
+
+        # # run_all calls df_token_cleanup once per config row
+        legacy_time = best_time(lambda: legacy_df_token_cleanup(protocol_df, df))
+        new_time = best_time(lambda: df_token_cleanup(protocol_df, df))
+
+        row_list.append((config_rows, days, len(df), f"{legacy_time * 1000:.2f}", f"{new_time * 1000:.2f}", f"{legacy_time / new_time:.1f}x"))
+
+    print_table(row_list, ['config_rows', 'days', 'df_rows', 'legacy_ms', 'semi_join_ms', 'speedup'])
+
+    return
+
+if __name__ == '__main__':
+    main()
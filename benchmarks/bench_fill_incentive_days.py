@@ -0,0 +1,84 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_utils import load_main_functions, best_time, print_table
+
+# # number of epoch rows in protocol_incentive_history.csv we benchmark at
+SIZE_LIST = [8, 100, 1000, 5000]
+
+# Function to create new rows with incremented dates
+def expand_rows(row):
+    new_rows = [row.copy() for _ in range(7)]  # Create 7 copies (original + 6 new)
+    for i in range(1, 7):
+        new_rows[i]['date'] = row['date'] + pd.Timedelta(days=i)
+    return pd.DataFrame(new_rows)
+
+# # the iterrows version fill_incentive_days used before it was vectorized
+def legacy_fill_incentive_days(df):
+    df['incentives_per_day'] = df['epoch_token_incentives'] / 7
+
+    df['date'] = pd.to_datetime(df['date'])
+
+    # Apply the function to each row and concatenate the results
+    expanded_df = pd.concat([expand_rows(row) for _, row in df.iterrows()], ignore_index=True)
+
+    # Sort the dataframe by date and other relevant columns if needed
+    expanded_df = expanded_df.sort_values(['date', 'chain', 'platform', 'token', 'pool_type'])
+
+    # Reset the index
+    expanded_df = expanded_df.reset_index(drop=True)
+
+    df = expanded_df
+    
+    return df
+
+# # makes a protocol_incentive_history.csv style frame with one row per pool per two week epoch
+def make_synthetic_incentive_df(rows, seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    pool_count = max(1, rows // 10)
+
+    df = pd.DataFrame({
+        'chain': rng.choice(['Base', 'Optimism', 'Mode', 'Fraxtal'], pool_count),
+        'platform': [f"Platform{i}" for i in range(pool_count)],
+        'segment': 'Lending',
+        'partner': [f"Partner{i}" for i in range(pool_count)],
+        'token': rng.choice(['WETH', 'USDC', 'WEETH.BASE'], pool_count),
+        'pool_type': rng.choice(['supply', 'borrow'], pool_count),
+        'protocol_slug': [f"protocol-{i}" for i in range(pool_count)]
+    })
+
+    df = df.loc[df.index.repeat(int(np.ceil(rows / pool_count)))].head(rows).reset_index(drop=True)
+    df['date'] = (pd.Timestamp('2024-07-09') + pd.to_timedelta(df.groupby('protocol_slug').cumcount() * 14, unit='D')).dt.strftime('%Y-%m-%d')
+    df['epoch_token_incentives'] = rng.integers(1000, 50000, len(df))
+
+    return df
+
+def main():
+
+    fill_incentive_days, = load_main_functions('fill_incentive_days')
+
+    row_list = []
+
+    for rows in SIZE_LIST:
+        df = make_synthetic_incentive_df(rows)
+
+        pd.testing.assert_frame_equal(legacy_fill_incentive_days(df.copy()), fill_incentive_days(df.copy()), check_dtype=False)
+
+        legacy_time = best_time(lambda: legacy_fill_incentive_days(df.copy()))
+        new_time = best_time(lambda: fill_incentive_days(df.copy()))
+
+        row_list.append((rows, rows * 7, f"{legacy_time * 1000:.2f}", f"{new_time * 1000:.2f}", f"{legacy_time / new_time:.1f}x"))
+
+    print_table(row_list, ['epoch_rows', 'expanded_rows', 'iterrows_ms', 'vectorized_ms', 'speedup'])
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_utils import ROOT_DIR, print_table
+
+# # what a fresh serving instance imports before it can answer anything
+MODULE_LIST = ['cloud_storage.cloud_storage', 'llama_client.llama_client', 'main']
+# # imports that should only happen once we actually talk to gcs / web3
+LAZY_MODULE_LIST = ['google.cloud.storage', 'web3']
+REPEAT = 5
+TOP_IMPORTS = 15
+
+# # imports module in a new interpreter with python -X importtime
+# # returns the wall time of the whole process, {module: (self_us, cumulative_us)} and whether any LAZY_MODULE_LIST module got loaded
+def run_cold_import(module):
+
+    code = f"import sys; import {module}; print(any(name in sys.modules for name in {LAZY_MODULE_LIST!r}))"
+
+    start_time = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    wall_time = time.perf_counter() - start_time
+
+    import_time_dict = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        import_time_dict[name.strip()] = (int(self_us), int(cumulative_us))
+
+    return wall_time, import_time_dict, result.stdout.strip() == 'True'
+
+def main():
+
+    row_list = []
+    report_dict = {}
+
+    for module in MODULE_LIST:
+        run_list = [run_cold_import(module) for _ in range(REPEAT)]
+        wall_time_list = sorted(wall_time for wall_time, _, _ in run_list)
+        import_time_dict = run_list[0][1]
+
+        median_wall_time = wall_time_list[len(wall_time_list) // 2]
+        cumulative_ms = import_time_dict[module][1] / 1000
+        lazy_loaded = run_list[0][2]
+
+        row_list.append((module, f"{median_wall_time * 1000:.0f}", f"{cumulative_ms:.0f}", lazy_loaded))
+        report_dict[module] = {'wall_ms': round(median_wall_time * 1000, 1), 'import_ms': round(cumulative_ms, 1), 'lazy_modules_loaded': lazy_loaded}
+
+    print_table(row_list, ['module', 'process_ms', 'import_ms', 'lazy_modules_loaded'])
+    print()
+
+    # # where main's cold start goes, by cumulative time of each package it pulls in
+    _, import_time_dict, _ = run_cold_import('main')
+    top_list = sorted(((name, cumulative_us) for name, (_, cumulative_us) in import_time_dict.items() if '.' not in name), key=lambda item: -item[1])[:TOP_IMPORTS]
+
+    print_table([(name, f"{cumulative_us / 1000:.1f}") for name, cumulative_us in top_list], ['package', 'cumulative_ms'])
+
+    # # python benchmarks/bench_import_time.py report.json keeps the numbers around to compare cold starts over time
+    if len(sys.argv) > 1:
+        report_dict['top_imports_ms'] = {name: round(cumulative_us / 1000, 1) for name, cumulative_us in top_list}
+
+        with open(sys.argv[1], 'w') as file:
+            json.dump(report_dict, file, indent=2)
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import io
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_utils import best_time, load_main_functions, print_table
+from bench_tvl_schema import make_synthetic_merged_csv
+
+# # (pools, days) in a published super_fest file
+SIZE_LIST = [(50, 365), (200, 365)]
+
+def make_pool_tvl_df(pools, days, columns):
+
+    # # how the pool endpoint reads super_fest.zip, every column as strings
+    df = pd.read_csv(io.StringIO(make_synthetic_merged_csv(pools, days)), dtype=str)
+
+    for column in columns:
+        if column not in df.columns:
+            df[column] = df['token_usd_amount']
+
+    return df[columns]
+
+# # how super_fest.parquet reads back, numbers as floats and dates as datetimes
+def to_parquet_types(df, key_column_list):
+
+    df = df.copy()
+
+    for column in df.columns:
+        if column == 'date':
+            df[column] = pd.to_datetime(df[column])
+        elif column not in key_column_list:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+
+    return df
+
+def main():
+
+    # # get_incentive_combo_list reads protocol_incentive_history.csv from our working directory
+    os.chdir(tempfile.mkdtemp())
+
+    get_incentive_pool_tvl_df, get_pool_tvl_response_json, get_incentive_combo_list = load_main_functions('get_incentive_pool_tvl_df', 'get_pool_tvl_response_json', 'get_incentive_combo_list')
+
+    import main
+    from fast_json import fast_json
+
+    # # the pool tvl response the way it used to be built, a dictionary per row and jsonify walking all of them
+    def build_pool_tvl_response_before(df):
+        df = get_incentive_pool_tvl_df(df)
+        df = df.sort_values('date')
+        df['date'] = df['date'].dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+        result = {}
+        for name, group in df.groupby(main.POOL_TVL_GROUP_COLUMN_LIST):
+            result[main.get_pool_tvl_series_key(*name)] = group.drop(main.POOL_TVL_GROUP_COLUMN_LIST, axis=1).to_dict('records')
+
+        return main.app.json.response(result).get_data()
+
+    def dumps_records_before(df):
+        if pd.api.types.is_datetime64_any_dtype(df['date']):
+            df = df.assign(date=df['date'].dt.strftime('%Y-%m-%d'))
+
+        return main.app.json.response(df.to_dict('records')).get_data()
+
+    print(f"orjson available: {fast_json.is_orjson_available()}\n")
+
+    row_list = []
+
+    for pools, days in SIZE_LIST:
+        csv_df = make_pool_tvl_df(pools, days, main.POOL_TVL_COLUMN_LIST)
+
+        # # every pool has incentives so all of them get served
+        csv_df[['chain', 'protocol', 'token', 'pool_type']].drop_duplicates().rename(columns={'protocol': 'protocol_slug'}).to_csv('protocol_incentive_history.csv', index=False)
+        get_incentive_combo_list.cache_clear()
+
+        for storage_format, df in [('csv_zip', csv_df), ('parquet', to_parquet_types(csv_df, main.POOL_TVL_GROUP_COLUMN_LIST))]:
+            with main.app.app_context():
+                for path, before_function, after_function in [
+                    ('records', dumps_records_before, lambda df: fast_json.dumps_records(df, main.AGGREGATE_DATE_FORMAT)),
+                    ('pool_tvl', build_pool_tvl_response_before, get_pool_tvl_response_json)
+                ]:
+                    before_time = best_time(lambda: before_function(df))
+                    after_time = best_time(lambda: after_function(df))
+
+                    row_list.append((
+                        len(df),
+                        storage_format,
+                        path,
+                        f"{len(df) / before_time:,.0f}",
+                        f"{len(df) / after_time:,.0f}",
+                        f"{before_time / after_time:.1f}x"
+                    ))
+
+    print_table(row_list, ['rows', 'format', 'path', 'to_dict_jsonify_rows/s', 'fast_json_rows/s', 'speedup'])
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_utils import ROOT_DIR, print_table
+
+# # multiples of today's protocol_pool.csv
+SCALE_LIST = [10, 100, 1000]
+# # days of history and tokens per chain in every synthetic /protocol payload
+DAYS = 365
+TOKENS = 10
+# # days per scale when --days isn't given, a year of 1000x doesn't fit in memory on our benchmark machine (~8GB) so it gets 60 days
+# # these are the runs our baselines are stored for
+SCALE_DAYS_DICT = {10: 365, 100: 365, 1000: 60}
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'bench_pipeline.json')
+
+# # runs one full refresh against synthetic DefiLlama payloads, in its own process so peak rss is only this scale's
+# # returns the result dictionary the parent process reads back
+def run_scale(scale, days, tokens):
+
+    work_dir = tempfile.mkdtemp(prefix=f"bench_pipeline_{scale}x_")
+
+    # # nothing leaves this machine, our bucket lives in memory and the price store in a throwaway sqlite file
+    os.environ['STORAGE_BACKEND'] = 'memory'
+    os.environ['PRICE_STORE_PATH'] = os.path.join(work_dir, 'token_prices.sqlite')
+    os.environ['LLAMA_CACHE_ENABLED'] = '0'
+    os.environ['LLAMA_REQUESTS_PER_SECOND'] = '1000000'
+    os.environ['LLAMA_BURST_SIZE'] = '1000000'
+    os.environ['INCREMENTAL_REFRESH'] = '0'
+
+    import logging
+
+    import llama_fixtures
+
+    protocol_pool_df = llama_fixtures.write_config_csvs(work_dir, scale, days)
+
+    # # main.py reads its config csvs from its working directory
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT_DIR)
+
+    import main
+    from cloud_storage import cloud_storage as cs
+
+    logging.disable(logging.CRITICAL)
+
+    fixtures = llama_fixtures.LlamaFixtures(protocol_pool_df, days, tokens)
+    llama_fixtures.mount_fixtures(main.lc.get_session(), fixtures)
+
+    start_time = time.perf_counter()
+
+    with main.app.app_context():
+        main.run_all(False)
+
+    seconds = time.perf_counter() - start_time
+    stage_dict = main.get_stage_time_summary()
+
+    merged_rows = len(cs.read_from_cloud_storage_in_format(main.CLOUD_DATA_FILENAME, main.CLOUD_BUCKET_NAME))
+
+    # # and the refresh that follows it, on top of what we just published (read_published and only the new days)
+    start_time = time.perf_counter()
+
+    with main.app.app_context():
+        main.run_all(True)
+
+    incremental_seconds = time.perf_counter() - start_time
+
+    result_dict = {
+        'scale': scale,
+        'days': days,
+        'tokens': tokens,
+        'pools': len(protocol_pool_df),
+        'requests': fixtures.requests_served,
+        'payload_mb': round(fixtures.bytes_served / 1024 / 1024, 1),
+        'merged_rows': merged_rows,
+        'seconds': round(seconds, 3),
+        'pools_per_second': round(len(protocol_pool_df) / seconds, 2),
+        'rows_per_second': round(merged_rows / seconds, 1),
+        # # kilobytes on linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': stage_dict,
+        'incremental_seconds': round(incremental_seconds, 3),
+        'incremental_stages': main.get_stage_time_summary()
+    }
+
+    return result_dict
+
+def run_scale_in_subprocess(scale, days, tokens):
+
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-scale', str(scale), '--days', str(days), '--tokens', str(tokens)],
+        capture_output=True,
+        text=True
+    )
+
+    # # e.g. killed for running out of memory (returncode -9), the other scales still run
+    if result.returncode != 0:
+        print(f"{scale}x failed with returncode {result.returncode}:\n{result.stderr[-2000:]}")
+        return None
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+# # baselines are kept per scale and payload size, so runs are only ever compared like for like
+def get_baseline_key(scale, days, tokens):
+    return f"{scale}x/{days}d/{tokens}t"
+
+def read_baseline_dict():
+
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+
+    with open(BASELINE_PATH, 'r') as file:
+        baseline_dict = json.load(file)
+
+    return baseline_dict.get('scales', {})
+
+# # scales we didn't run this time keep their old baseline
+def write_baseline_dict(result_dict_list):
+
+    os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+
+    scale_dict = read_baseline_dict()
+    scale_dict.update({get_baseline_key(result_dict['scale'], result_dict['days'], result_dict['tokens']): result_dict for result_dict in result_dict_list})
+
+    baseline_dict = {
+        'machine': f"{platform.system()} {platform.machine()}, python {platform.python_version()}, {os.cpu_count()} cpus",
+        'scales': dict(sorted(scale_dict.items(), key=lambda item: (item[1]['scale'], item[1]['days'], item[1]['tokens'])))
+    }
+
+    with open(BASELINE_PATH, 'w') as file:
+        json.dump(baseline_dict, file, indent=2)
+
+    return
+
+# # +12.3% style change against the baseline, blank if we have no comparable baseline
+def get_change(value, baseline_value):
+
+    if baseline_value is None or baseline_value == 0:
+        return ''
+
+    return f"{(value - baseline_value) / baseline_value * 100:+.1f}%"
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Times a full refresh against synthetic DefiLlama payloads at multiples of our protocol_pool.csv')
+    parser.add_argument('--scales', default=','.join(str(scale) for scale in SCALE_LIST), help='comma separated multiples of protocol_pool.csv, e.g. 10,100')
+    parser.add_argument('--days', type=int, help=f"days of history per payload, by default {', '.join(f'{days} for {scale}x' for scale, days in SCALE_DAYS_DICT.items())} and {DAYS} otherwise")
+    parser.add_argument('--tokens', type=int, default=TOKENS)
+    parser.add_argument('--update-baseline', action='store_true', help=f"store these results in {os.path.relpath(BASELINE_PATH, ROOT_DIR)}")
+    parser.add_argument('--run-scale', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale is not None:
+        print(json.dumps(run_scale(args.run_scale, args.days, args.tokens)))
+        return
+
+    baseline_dict = read_baseline_dict()
+
+    result_dict_list = []
+    row_list = []
+
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        days = args.days if args.days is not None else SCALE_DAYS_DICT.get(scale, DAYS)
+        result_dict = run_scale_in_subprocess(scale, days, args.tokens)
+
+        if result_dict is None:
+            continue
+
+        result_dict_list.append(result_dict)
+
+        baseline = baseline_dict.get(get_baseline_key(scale, days, args.tokens), {})
+
+        row_list.append((
+            f"{scale}x/{days}d",
+            result_dict['pools'],
+            result_dict['payload_mb'],
+            result_dict['merged_rows'],
+            f"{result_dict['seconds']:.2f}",
+            get_change(result_dict['seconds'], baseline.get('seconds')),
+            result_dict['pools_per_second'],
+            result_dict['rows_per_second'],
+            result_dict['peak_rss_mb'],
+            get_change(result_dict['peak_rss_mb'], baseline.get('peak_rss_mb')),
+            f"{result_dict['incremental_seconds']:.2f}",
+            get_change(result_dict['incremental_seconds'], baseline.get('incremental_seconds'))
+        ))
+
+    print_table(row_list, ['scale', 'pools', 'payload_mb', 'merged_rows', 'seconds', 'vs_baseline', 'pools/s', 'rows/s', 'peak_rss_mb', 'vs_baseline', 'incremental_seconds', 'vs_baseline'])
+
+    # # where each scale's time went, in the full refresh and in the incremental one after it
+    for stage_key in ['stages', 'incremental_stages']:
+        stage_list = list(dict.fromkeys(stage for result_dict in result_dict_list for stage in result_dict[stage_key]))
+        print(f"\n{stage_key}")
+        print_table([[f"{result_dict['scale']}x/{result_dict['days']}d"] + [f"{result_dict[stage_key].get(stage, 0):.2f}" for stage in stage_list] for result_dict in result_dict_list], ['scale'] + stage_list)
+
+    if args.update_baseline:
+        write_baseline_dict(result_dict_list)
+        print(f"\nBaseline written to {BASELINE_PATH}")
+
+    return
+
+if __name__ == '__main__':
+    main()
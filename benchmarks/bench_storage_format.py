@@ -0,0 +1,71 @@
+import io
+import os
+import sys
+import zipfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_utils import best_time, print_table
+from bench_tvl_schema import make_synthetic_merged_csv, read_schema_df
+from tvl_schema import tvl_schema
+
+# # (pools, days) in a published super_fest file
+SIZE_LIST = [(200, 365), (1000, 365)]
+
+# # the columns our pool tvl api reads
+API_COLUMN_LIST = ['date', 'chain', 'protocol', 'token', 'pool_type', 'token_usd_amount', 'raw_change_in_usd', 'percentage_change_in_usd', 'incentives_per_day_usd', 'weth_change_in_price_percentage']
+
+# # the bytes cloud_storage.df_write_to_cloud_storage_as_zip uploads
+def write_zip_csv(df):
+
+    zip_buffer = io.BytesIO()
+
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('super_fest.csv', df.to_csv(index=False))
+
+    return zip_buffer.getvalue()
+
+def read_zip_csv(content, dtype=str):
+
+    with zipfile.ZipFile(io.BytesIO(content), 'r') as zip_ref:
+        with zip_ref.open(zip_ref.namelist()[0]) as csv_file:
+            df = pd.read_csv(csv_file, dtype=dtype)
+
+    return df
+
+def write_parquet(df, compression):
+
+    parquet_buffer = io.BytesIO()
+    df.to_parquet(parquet_buffer, index=False, compression=compression)
+
+    return parquet_buffer.getvalue()
+
+def main():
+
+    row_list = []
+
+    for pools, days in SIZE_LIST:
+        df = read_schema_df(make_synthetic_merged_csv(pools, days))
+        rows = len(df)
+
+        zip_content = write_zip_csv(df)
+
+        row_list.append((rows, 'csv_zip (str)', f"{len(zip_content) / 1024 / 1024:.2f}", f"{best_time(lambda: read_zip_csv(zip_content)) * 1000:.1f}"))
+        row_list.append((rows, 'csv_zip (schema)', f"{len(zip_content) / 1024 / 1024:.2f}", f"{best_time(lambda: read_zip_csv(zip_content, tvl_schema.get_csv_dtype_dict())) * 1000:.1f}"))
+
+        for compression in ['zstd', 'snappy']:
+            parquet_content = write_parquet(df, compression)
+            size_mb = f"{len(parquet_content) / 1024 / 1024:.2f}"
+
+            row_list.append((rows, f"parquet {compression}", size_mb, f"{best_time(lambda: pd.read_parquet(io.BytesIO(parquet_content))) * 1000:.1f}"))
+            row_list.append((rows, f"parquet {compression} (api columns)", size_mb, f"{best_time(lambda: pd.read_parquet(io.BytesIO(parquet_content), columns=API_COLUMN_LIST)) * 1000:.1f}"))
+
+    print_table(row_list, ['rows', 'format', 'size_mb', 'read_ms'])
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_utils import load_main_functions, best_time, print_table
+
+# # (days of history, tokens per day) on the supply and borrow side of one chain
+SIZE_LIST = [(120, 10), (365, 100), (1000, 300)]
+
+# # makes a /protocol payload with supply and borrow histories for one chain, borrow only lists half of the tokens
+def make_synthetic_protocol_json(days, tokens, seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    token_list = [f"TOKEN{i}" for i in range(tokens)]
+    start_unix = 1704067200
+
+    def make_entry_list(token_list):
+        amount_array = rng.random((days, len(token_list))) * 1e6
+        return [{'date': start_unix + day * 86400, 'tokens': dict(zip(token_list, amount_array[day].tolist()))} for day in range(days)]
+
+    data = {
+        'chainTvls': {
+            'Base': {'tokensInUsd': make_entry_list(token_list), 'tokens': []},
+            'Base-borrowed': {'tokensInUsd': make_entry_list(token_list[::2]), 'tokens': []}
+        }
+    }
+
+    return data
+
+def main():
+
+    function_name_list = ['get_historic_protocol_tvl_df', 'add_dataframes', 'transpose_df', 'get_token_entry_list', 'build_long_token_df']
+    get_historic_protocol_tvl_df, add_dataframes, transpose_df, get_token_entry_list, build_long_token_df = load_main_functions(*function_name_list)
+
+    # # what get_pool_type_df + transpose_df did for a supply pool before
+    def legacy_supply_df(data):
+        df = add_dataframes(get_historic_protocol_tvl_df(data, 'Base', 'tokensInUsd'), get_historic_protocol_tvl_df(data, 'Base-borrowed', 'tokensInUsd'))
+        df['pool_type'] = 'supply'
+        return transpose_df(df)
+
+    def long_supply_df(data):
+        df = build_long_token_df([get_token_entry_list(data, 'Base', 'tokensInUsd'), get_token_entry_list(data, 'Base-borrowed', 'tokensInUsd')])
+        df['pool_type'] = 'supply'
+        return df
+
+    row_list = []
+
+    for days, tokens in SIZE_LIST:
+        data = make_synthetic_protocol_json(days, tokens)
+
+        legacy_df = legacy_supply_df(data)
+        long_df = long_supply_df(data).astype({'token': object})
+        pd.testing.assert_frame_equal(legacy_df, long_df, check_dtype=False)
+
+        legacy_time = best_time(lambda: legacy_supply_df(data))
+        long_time = best_time(lambda: long_supply_df(data))
+
+        row_list.append((days, tokens, len(long_df), f"{legacy_time * 1000:.2f}", f"{long_time * 1000:.2f}", f"{legacy_time / long_time:.1f}x"))
+
+    print_table(row_list, ['days', 'tokens', 'rows', 'wide_melt_ms', 'long_builder_ms', 'speedup'])
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_utils import best_time, print_table
+from tvl_schema import tvl_schema
+
+# # (pools, days) in a published super_fest.csv style file
+SIZE_LIST = [(50, 120), (200, 365), (1000, 365)]
+
+METRIC_COLUMN_LIST = ['token_usd_amount', 'start_token_usd_amount', 'raw_change_in_usd', 'percentage_change_in_usd', 'daily_tvl', 'incentives_per_day_usd', 'weth_price', 'weth_change_in_price_percentage']
+
+# # makes the csv text of a published merged file with one row per pool per day
+def make_synthetic_merged_csv(pools, days, seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    pool_index = np.repeat(np.arange(pools), days)
+    day_index = np.tile(np.arange(days), pools)
+    date_series = pd.Timestamp('2024-07-08') + pd.to_timedelta(day_index, unit='D')
+
+    df = pd.DataFrame({
+        'date': date_series.strftime('%Y-%m-%d'),
+        'timestamp': (date_series.astype('int64') // 10**9).astype(float),
+        'chain': np.array(['Base', 'Optimism', 'Mode', 'Fraxtal'])[pool_index % 4],
+        'token': np.array(['WETH', 'USDC', 'WEETH.BASE', 'OP', 'USDT'])[pool_index % 5],
+        'pool_type': np.array(['supply', 'borrow'])[pool_index % 2],
+        'protocol': np.array([f"protocol-{i}" for i in range(pools // 2 + 1)])[pool_index // 2]
+    })
+
+    for column in METRIC_COLUMN_LIST:
+        df[column] = rng.random(len(df)) * 1e6
+
+    return df.to_csv(index=False)
+
+# # how our published files were read before, everything as strings and cast to float where it was needed
+def read_legacy_df(csv_text):
+
+    df = pd.read_csv(io.StringIO(csv_text), dtype=str)
+    df[METRIC_COLUMN_LIST] = df[METRIC_COLUMN_LIST].astype(float)
+    df['date'] = pd.to_datetime(df['date'])
+
+    return df
+
+def read_schema_df(csv_text):
+
+    df = pd.read_csv(io.StringIO(csv_text), dtype=tvl_schema.get_csv_dtype_dict())
+    df = tvl_schema.apply_schema(df)
+
+    return df
+
+# # the two groupbys our aggregate and per pool roi spend most of their time in
+def run_groupbys(df):
+
+    df.groupby('date')[METRIC_COLUMN_LIST].sum()
+    df.groupby(['protocol', 'token', 'pool_type', 'chain'], observed=True)['incentives_per_day_usd'].cumsum()
+
+    return
+
+def main():
+
+    row_list = []
+
+    for pools, days in SIZE_LIST:
+        csv_text = make_synthetic_merged_csv(pools, days)
+
+        legacy_df = read_legacy_df(csv_text)
+        schema_df = read_schema_df(csv_text)
+        # # what TVL_FLOAT32=1 gives us
+        tvl_schema.METRIC_DTYPE = np.float32
+        float32_df = tvl_schema.apply_schema(schema_df.copy())
+        tvl_schema.METRIC_DTYPE = np.float64
+
+        for name, df in [('str', legacy_df), ('schema', schema_df), ('schema_float32', float32_df)]:
+            memory_mb = df.memory_usage(deep=True).sum() / 1024 / 1024
+            groupby_time = best_time(lambda: run_groupbys(df))
+
+            row_list.append((pools * days, name, f"{memory_mb:.1f}", f"{groupby_time * 1000:.2f}"))
+
+    print_table(row_list, ['rows', 'dtypes', 'memory_mb', 'groupby_ms'])
+
+    return
+
+if __name__ == '__main__':
+    main()
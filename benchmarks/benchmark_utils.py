@@ -0,0 +1,44 @@
+import importlib
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# # importing main.py no longer kicks off a refresh, so we benchmark its functions as they are
+def load_main_functions(*function_names):
+
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    main = importlib.import_module('main')
+
+    missing_list = [function_name for function_name in function_names if not hasattr(main, function_name)]
+
+    if len(missing_list) > 0:
+        raise KeyError(f"main.py has no function(s) named {sorted(missing_list)}")
+
+    return [getattr(main, function_name) for function_name in function_names]
+
+# # runs function repeat times and returns the fastest wall time in seconds
+def best_time(function, repeat=3):
+
+    time_list = []
+
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        time_list.append(time.perf_counter() - start_time)
+
+    return min(time_list)
+
+def print_table(row_list, column_list):
+
+    width_list = [max(len(str(column)), *(len(str(row[i])) for row in row_list)) for i, column in enumerate(column_list)]
+
+    print('  '.join(str(column).rjust(width) for column, width in zip(column_list, width_list)))
+
+    for row in row_list:
+        print('  '.join(str(value).rjust(width) for value, width in zip(row, width_list)))
+
+    return
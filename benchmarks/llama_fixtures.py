@@ -0,0 +1,215 @@
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import urllib3
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DAY_SECONDS = 86400
+START_UNIX = int(datetime(2024, 7, 8, tzinfo=timezone.utc).timestamp())
+
+# # chains a real /protocol payload carries that none of our pools read, they only cost parsing time
+EXTRA_CHAIN_LIST = ['Ethereum', 'Arbitrum', 'Polygon']
+
+# # our protocol_pool.csv copied scale times over, each copy gets its own protocol slugs so every payload is a separate download
+# # amm_pools adds that many AMM rows per copy so the yields /chart endpoint gets exercised as well
+def make_protocol_pool_df(scale, amm_pools=1):
+
+    base_df = pd.read_csv(os.path.join(ROOT_DIR, 'protocol_pool.csv'))
+
+    df_list = []
+
+    for i in range(scale):
+        df = base_df.copy()
+        df['protocol_slug'] = df['protocol_slug'] + f"-{i}"
+        df_list.append(df)
+
+        for j in range(amm_pools):
+            df_list.append(pd.DataFrame([{'chain': 'Base', 'platform': 'Dex', 'segment': 'DEX', 'partner': 'Dex', 'token': 'WETH-USDC', 'pool_type': 'AMM', 'protocol_slug': f"dex-{i}-{j}"}]))
+
+    return pd.concat(df_list, ignore_index=True)
+
+# # one 7 day epoch every other week per pool since START_DATE, like our protocol_incentive_history.csv
+def make_incentive_history_df(protocol_pool_df, days):
+
+    epoch_date_list = pd.date_range(pd.Timestamp(START_UNIX, unit='s'), periods=max(days // 14, 1), freq='14D').strftime('%Y-%m-%d')
+
+    df = protocol_pool_df.loc[protocol_pool_df['pool_type'] != 'AMM'].merge(pd.DataFrame({'date': epoch_date_list}), how='cross')
+    df['epoch_token_incentives'] = (np.arange(len(df)) % 50 + 1) * 100
+
+    return df
+
+def make_dex_pool_config_df(protocol_pool_df):
+
+    df = protocol_pool_df.loc[protocol_pool_df['pool_type'] == 'AMM', ['chain', 'protocol_slug']].copy()
+    df['pool_id'] = [f"pool-{protocol_slug}" for protocol_slug in df['protocol_slug']]
+
+    return df
+
+# # writes the csvs main.py reads from its working directory
+def write_config_csvs(directory, scale, days, amm_pools=1):
+
+    protocol_pool_df = make_protocol_pool_df(scale, amm_pools)
+
+    protocol_pool_df.to_csv(os.path.join(directory, 'protocol_pool.csv'), index=False)
+    make_incentive_history_df(protocol_pool_df, days).to_csv(os.path.join(directory, 'protocol_incentive_history.csv'), index=False)
+    make_dex_pool_config_df(protocol_pool_df).to_csv(os.path.join(directory, 'dex_pool_config.csv'), index=False)
+
+    return protocol_pool_df
+
+# # synthetic DefiLlama payloads, seeded so the same url always gets the same body
+# # protocols with the same chains and tokens share one body, so generating payloads doesn't show up in what we time
+class LlamaFixtures:
+
+    def __init__(self, protocol_pool_df, days, tokens):
+
+        self.days = days
+        self.tokens = tokens
+        self.bytes_served = 0
+        self.requests_served = 0
+        self.body_dict = {}
+
+        self.chain_dict = {}
+        self.token_dict = {}
+
+        for protocol_slug, chain, token in zip(protocol_pool_df['protocol_slug'], protocol_pool_df['chain'], protocol_pool_df['token']):
+            self.chain_dict.setdefault(protocol_slug, set()).add(chain)
+            self.token_dict.setdefault(protocol_slug, set()).add(token)
+
+    def get_rng(self, seed_key):
+        return np.random.default_rng(zlib.crc32(repr(seed_key).encode()))
+
+    def get_date_list(self):
+        return [START_UNIX + day * DAY_SECONDS for day in range(self.days)]
+
+    # # days x tokens of usd amounts, every pool's own tokens plus filler ones up to self.tokens
+    def make_token_entry_list(self, rng, token_list, scale):
+
+        amount_array = scale * (1 + 0.3 * rng.random((self.days, len(token_list))))
+
+        return [{'date': date, 'tokens': dict(zip(token_list, amount_array[day].tolist()))} for day, date in enumerate(self.get_date_list())]
+
+    def get_protocol_layout(self, protocol_slug):
+        return tuple(sorted(self.chain_dict.get(protocol_slug, set()))), tuple(sorted(self.token_dict.get(protocol_slug, set())))
+
+    def make_protocol_payload(self, protocol_layout):
+
+        rng = self.get_rng(protocol_layout)
+
+        chain_list, pool_token_list = protocol_layout
+        token_list = list(pool_token_list) + [f"TOKEN{i}" for i in range(max(self.tokens - len(pool_token_list), 0))]
+
+        chain_tvl_dict = {}
+
+        for chain in list(chain_list) + EXTRA_CHAIN_LIST:
+            for suffix, scale in [('', 1e6), ('-borrowed', 4e5)]:
+                chain_tvl_dict[chain + suffix] = {
+                    'tvl': [{'date': date, 'totalLiquidityUSD': scale * len(token_list)} for date in self.get_date_list()],
+                    'tokensInUsd': self.make_token_entry_list(rng, token_list, scale),
+                    'tokens': self.make_token_entry_list(rng, token_list, scale / 3000)
+                }
+
+        return {'chainTvls': chain_tvl_dict, 'tvl': []}
+
+    def make_chart_payload(self):
+
+        rng = self.get_rng('chart')
+        tvl_array = 5e6 * (1 + 0.3 * rng.random(self.days))
+
+        data_list = [{
+            'timestamp': datetime.fromtimestamp(date, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'tvlUsd': tvl,
+            'apy': 5.0
+        } for date, tvl in zip(self.get_date_list(), tvl_array.tolist())]
+
+        return {'status': 'success', 'data': data_list}
+
+    # # a price for every coin and timestamp asked for, op ends in 42 and everything else is priced like weth
+    def make_batch_historical_payload(self, url):
+
+        coin_dict = json.loads(parse_qs(urlparse(url).query)['coins'][0])
+
+        price_dict = {}
+
+        for coin, timestamp_list in coin_dict.items():
+            symbol, base_price = ('op', 1.8) if coin.lower().endswith('42') else ('WETH', 3300)
+
+            price_dict[coin] = {
+                'symbol': symbol,
+                'prices': [{'timestamp': int(timestamp) + 60, 'price': base_price * (1 + (int(timestamp) // DAY_SECONDS % 7) / 100), 'confidence': 0.99} for timestamp in timestamp_list]
+            }
+
+        return {'coins': price_dict}
+
+    # # returns (status_code, body) for a DefiLlama url
+    def get_response(self, url):
+
+        path = urlparse(url).path
+
+        if path.startswith('/protocol/'):
+            protocol_layout = self.get_protocol_layout(path.rsplit('/', 1)[1])
+
+            if protocol_layout not in self.body_dict:
+                self.body_dict[protocol_layout] = json.dumps(self.make_protocol_payload(protocol_layout)).encode()
+
+            body = self.body_dict[protocol_layout]
+
+        elif path.startswith('/chart/'):
+            if 'chart' not in self.body_dict:
+                self.body_dict['chart'] = json.dumps(self.make_chart_payload()).encode()
+
+            body = self.body_dict['chart']
+
+        elif path.startswith('/batchHistorical'):
+            body = json.dumps(self.make_batch_historical_payload(url)).encode()
+
+        else:
+            return 404, b'{"error": "not found"}'
+
+        self.bytes_served += len(body)
+        self.requests_served += 1
+
+        return 200, body
+
+# # a requests transport adapter that answers from LlamaFixtures instead of the network
+# # mounted on llama_client's session everything above it (rate limiting, streaming, the response cache) runs as it does for real
+class LlamaFixtureAdapter(BaseAdapter):
+
+    def __init__(self, fixtures):
+        super().__init__()
+        self.fixtures = fixtures
+        self._response_builder = HTTPAdapter()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+
+        status_code, body = self.fixtures.get_response(request.url)
+
+        raw = urllib3.HTTPResponse(
+            body=io.BytesIO(body),
+            headers={'Content-Type': 'application/json', 'Content-Length': str(len(body))},
+            status=status_code,
+            preload_content=False
+        )
+
+        return self._response_builder.build_response(request, raw)
+
+    def close(self):
+        return
+
+LLAMA_URL_PREFIX_LIST = ['https://api.llama.fi/', 'https://yields.llama.fi/', 'https://coins.llama.fi/']
+
+def mount_fixtures(session, fixtures):
+
+    adapter = LlamaFixtureAdapter(fixtures)
+
+    for url_prefix in LLAMA_URL_PREFIX_LIST:
+        session.mount(url_prefix, adapter)
+
+    return adapter
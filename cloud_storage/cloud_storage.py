@@ -1,6 +1,3 @@
-from flask import Flask, request, jsonify
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
 import pandas as pd
 import json
 # from functools import cache
@@ -10,31 +7,34 @@ import time
 import datetime
 from concurrent.futures import ThreadPoolExecutor
 # import gcs_updater
-from google.cloud import storage
-import google.cloud.storage
 import os
 import sys
 import io
 from io import BytesIO
 import zipfile
+from cloud_storage import storage_backend
 
 # PATH = os.path.join(os.getcwd(), 'fast-web-419215-35d284e06546.json')
 
 # STORAGE_CLIENT = storage.Client(PATH)
 
-# Assuming the key file is in your user's home directory
-HOME_DIR = os.path.expanduser('~')
-PATH = os.path.join(HOME_DIR, 'fast-web-419215-35d284e06546.json')
-STORAGE_CLIENT = storage.Client.from_service_account_json(PATH)
+# # our files live wherever storage_backend.STORAGE_BACKEND points (our gcs bucket by default)
+# # the gcs client is only built the first time we read or write, so importing this module needs no credentials
+StorageNotFoundError = storage_backend.StorageNotFoundError
+
+# # how our dataframes are stored in the bucket, 'csv_zip' (zipped csv) or 'parquet' which needs pyarrow installed
+STORAGE_FORMAT = os.environ.get('STORAGE_FORMAT', 'csv_zip')
+# # any codec pyarrow supports, e.g. 'zstd', 'snappy', 'gzip' or 'none'
+PARQUET_COMPRESSION = os.environ.get('PARQUET_COMPRESSION', 'zstd')
 
 # @cache
 def read_from_cloud_storage(filename, bucketname):
     # storage_client = storage.Client(PATH)
-    bucket = STORAGE_CLIENT.get_bucket(bucketname)
+    content = storage_backend.get_storage_backend().read_bytes(bucketname, filename)
 
     df = pd.read_csv(
     io.BytesIO(
-                 bucket.blob(blob_name = filename).download_as_string()
+                 content
               ) ,
                  encoding='UTF-8',
                  sep=',',
@@ -45,22 +45,16 @@ def read_from_cloud_storage(filename, bucketname):
 # # writes our dataframe to our desired filename
 def df_write_to_cloud_storage(df, filename, bucketname):
 
-    # storage_client = storage.Client(PATH)
-    bucket = STORAGE_CLIENT.get_bucket(bucketname)
-
     csv_string = df.to_csv(index=False)  # Omit index for cleaner output
-    blob = bucket.blob(filename)
-    blob.upload_from_string(csv_string)
+    storage_backend.get_storage_backend().write_bytes(bucketname, filename, csv_string.encode('utf-8'), content_type='text/csv')
 
     return
 
 
-def read_zip_csv_from_cloud_storage(filename, bucketname):
-    # storage_client = storage.Client(PATH)
-    bucket = STORAGE_CLIENT.get_bucket(bucketname)
-    
+# # dtype is handed to pd.read_csv, by default everything comes back as strings
+def read_zip_csv_from_cloud_storage(filename, bucketname, dtype=str):
     # Download the zip file content
-    zip_content = bucket.blob(blob_name=filename).download_as_bytes()
+    zip_content = storage_backend.get_storage_backend().read_bytes(bucketname, filename)
     
     # Create a BytesIO object from the zip content
     zip_buffer = io.BytesIO(zip_content)
@@ -76,7 +70,7 @@ def read_zip_csv_from_cloud_storage(filename, bucketname):
                 csv_file,
                 encoding='UTF-8',
                 sep=',',
-                dtype=str
+                dtype=dtype
             )
     
     df = df.dropna()
@@ -97,45 +91,116 @@ def df_write_to_cloud_storage_as_zip(df, filename, bucketname):
         temp_filename = temp_filename[0]
         zip_file.writestr(f"{temp_filename}.csv", csv_string)
     
-    # Move the buffer's pointer to the beginning
-    zip_buffer.seek(0)
-
-    # Get the bucket
-    bucket = STORAGE_CLIENT.get_bucket(bucketname)
-
-    # Create a new blob and upload the zip file's content
+    # Upload the zip file's content
     zip_filename = f"{filename}"
-    blob = bucket.blob(zip_filename)
-    blob.upload_from_file(zip_buffer, content_type='application/zip')
+    storage_backend.get_storage_backend().write_bytes(bucketname, zip_filename, zip_buffer.getvalue(), content_type='application/zip')
 
     return f"Uploaded {zip_filename} to {bucketname}"
 
+# # writes our dataframe as parquet, our column types (categories, datetimes, floats) are stored with it
+def df_write_to_cloud_storage_as_parquet(df, filename, bucketname, compression=None):
+
+    if compression is None:
+        compression = PARQUET_COMPRESSION
+
+    if compression == 'none':
+        compression = None
+
+    # # same as our zipped csvs, incomplete rows never get published
+    df = df.dropna()
+
+    parquet_buffer = io.BytesIO()
+    df.to_parquet(parquet_buffer, index=False, compression=compression)
+
+    storage_backend.get_storage_backend().write_bytes(bucketname, filename, parquet_buffer.getvalue(), content_type='application/vnd.apache.parquet')
+
+    return f"Uploaded {filename} to {bucketname}"
+
+# # columns limits what gets read, parquet is columnar so the rest never gets decoded
+def read_parquet_from_cloud_storage(filename, bucketname, columns=None):
+    parquet_content = storage_backend.get_storage_backend().read_bytes(bucketname, filename)
+
+    df = pd.read_parquet(io.BytesIO(parquet_content), columns=columns)
+
+    return df
+
+# # our filenames are written as .zip, this swaps in the extension of the STORAGE_FORMAT we are using
+def get_format_filename(filename, storage_format=None):
+
+    if storage_format is None:
+        storage_format = STORAGE_FORMAT
+
+    if storage_format == 'parquet':
+        filename = os.path.splitext(filename)[0] + '.parquet'
+
+    return filename
+
+# # writes df in our STORAGE_FORMAT
+def df_write_to_cloud_storage_in_format(df, filename, bucketname, storage_format=None):
+
+    if storage_format is None:
+        storage_format = STORAGE_FORMAT
+
+    filename = get_format_filename(filename, storage_format)
+
+    if storage_format == 'parquet':
+        return df_write_to_cloud_storage_as_parquet(df, filename, bucketname)
+
+    return df_write_to_cloud_storage_as_zip(df, filename, bucketname)
+
+# # reads a dataframe written by df_write_to_cloud_storage_in_format
+# # dtype only applies to csvs, parquet files come back with the types they were written with
+def read_from_cloud_storage_in_format(filename, bucketname, columns=None, dtype=str, storage_format=None):
+
+    if storage_format is None:
+        storage_format = STORAGE_FORMAT
+
+    filename = get_format_filename(filename, storage_format)
+
+    if storage_format == 'parquet':
+        return read_parquet_from_cloud_storage(filename, bucketname, columns)
+
+    df = read_zip_csv_from_cloud_storage(filename, bucketname, dtype)
+
+    if columns is not None:
+        df = df[columns]
+
+    return df
+
+# # raw bytes in and out, for files we build ourselves (e.g. our precompressed api payloads)
+def write_bytes_to_cloud_storage(content, filename, bucketname, content_type=None):
+
+    storage_backend.get_storage_backend().write_bytes(bucketname, filename, content, content_type=content_type)
+
+    return f"Uploaded {filename} to {bucketname}"
+
+def read_bytes_from_cloud_storage(filename, bucketname):
+    return storage_backend.get_storage_backend().read_bytes(bucketname, filename)
+
 # # will return a list of all the files with 'revenue' in their name from our GCP bucket
 def get_all_revenue_files(bucket_name):
     """Lists all the blobs in the bucket that begin with the prefix."""
-    bucket = STORAGE_CLIENT.get_bucket(bucket_name)
-
-    # List blobs with the given prefix
-    blobs = bucket.list_blobs()
+    filename_list = storage_backend.get_storage_backend().list_filenames(bucket_name)
 
     file_list = []
-    for blob in blobs:
-        if 'revenue' in blob.name.lower():
-            file_list.append(blob.name)
+    for filename in filename_list:
+        if 'revenue' in filename.lower():
+            file_list.append(filename)
 
     return file_list
 
 # # will return a list of all the files with 'revenue' in their name from our GCP bucket
 def get_all_prefix_files(bucket_name, prefix):
     """Lists all the blobs in the bucket that begin with the prefix."""
-    bucket = STORAGE_CLIENT.get_bucket(bucket_name)
-
-    # List blobs with the given prefix
-    blobs = bucket.list_blobs()
+    filename_list = storage_backend.get_storage_backend().list_filenames(bucket_name)
 
     file_list = []
-    for blob in blobs:
-        if prefix in blob.name.lower():
-            file_list.append(blob.name)
+    for filename in filename_list:
+        if prefix in filename.lower():
+            file_list.append(filename)
+
+    return file_list
 
-    return file_list
\ No newline at end of file
+# # returns the generation of a blob so callers can tell if it changed without downloading it, None if it doesn't exist
+def get_blob_generation(filename, bucketname):
+    return storage_backend.get_storage_backend().get_generation(bucketname, filename)
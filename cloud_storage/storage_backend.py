@@ -0,0 +1,227 @@
+import abc
+import os
+import threading
+
+# # where cloud_storage keeps its files, every backend stores whole files (bytes) under a bucket name and a filename
+# # 'gcs' is our google cloud bucket, 'local' a directory on disk (e.g. a shared volume) and 'memory' a dictionary for tests and benchmarks
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'gcs')
+
+HOME_DIR = os.path.expanduser('~')
+# # the service account our gcs backend authenticates with
+GCS_CREDENTIALS_PATH = os.environ.get('GCS_CREDENTIALS_PATH', os.path.join(HOME_DIR, 'fast-web-419215-35d284e06546.json'))
+# # the local backend keeps each bucket as a sub directory of this
+LOCAL_STORAGE_DIR = os.environ.get('LOCAL_STORAGE_DIR', os.path.join(HOME_DIR, '.cache', 'defillama_tvl', 'buckets'))
+
+class StorageNotFoundError(Exception):
+    pass
+
+# # what every backend implements
+# # generations change whenever a file is rewritten, so callers can tell if it changed without reading it
+class StorageBackend(abc.ABC):
+
+    @abc.abstractmethod
+    def read_bytes(self, bucketname, filename):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def write_bytes(self, bucketname, filename, content, content_type=None):
+        raise NotImplementedError
+
+    # # None if the file doesn't exist
+    @abc.abstractmethod
+    def get_generation(self, bucketname, filename):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_filenames(self, bucketname):
+        raise NotImplementedError
+
+class GcsStorageBackend(StorageBackend):
+
+    def __init__(self, credentials_path=None):
+
+        if credentials_path is None:
+            credentials_path = GCS_CREDENTIALS_PATH
+
+        self.credentials_path = credentials_path
+        self._client = None
+        self._lock = threading.Lock()
+
+    # # the client (and google.cloud itself) is only loaded once we actually talk to gcs
+    def get_client(self):
+
+        with self._lock:
+            if self._client is None:
+                from google.cloud import storage
+
+                self._client = storage.Client.from_service_account_json(self.credentials_path)
+
+        return self._client
+
+    def read_bytes(self, bucketname, filename):
+        from google.cloud.exceptions import NotFound
+
+        bucket = self.get_client().get_bucket(bucketname)
+
+        try:
+            content = bucket.blob(blob_name=filename).download_as_bytes()
+        except NotFound:
+            raise StorageNotFoundError(f"{filename} not found in {bucketname}")
+
+        return content
+
+    def write_bytes(self, bucketname, filename, content, content_type=None):
+        bucket = self.get_client().get_bucket(bucketname)
+
+        blob = bucket.blob(filename)
+        blob.upload_from_string(content, content_type=content_type)
+
+        return
+
+    def get_generation(self, bucketname, filename):
+        bucket = self.get_client().get_bucket(bucketname)
+
+        blob = bucket.get_blob(filename)
+
+        if blob is None:
+            return None
+
+        return blob.generation
+
+    def list_filenames(self, bucketname):
+        bucket = self.get_client().get_bucket(bucketname)
+
+        return [blob.name for blob in bucket.list_blobs()]
+
+class LocalStorageBackend(StorageBackend):
+
+    def __init__(self, root_dir=None):
+
+        if root_dir is None:
+            root_dir = LOCAL_STORAGE_DIR
+
+        self.root_dir = root_dir
+
+    def _get_path(self, bucketname, filename):
+        return os.path.join(self.root_dir, bucketname, filename)
+
+    def read_bytes(self, bucketname, filename):
+
+        try:
+            with open(self._get_path(bucketname, filename), 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            raise StorageNotFoundError(f"{filename} not found in {bucketname}")
+
+        return content
+
+    # # writes to a temp file first so a reader on the same volume never sees a half written file
+    def write_bytes(self, bucketname, filename, content, content_type=None):
+
+        path = self._get_path(bucketname, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(temp_path, 'wb') as file:
+            file.write(content)
+
+        os.replace(temp_path, path)
+
+        return
+
+    # # the modified time in nanoseconds, it changes every time we replace the file
+    def get_generation(self, bucketname, filename):
+
+        try:
+            generation = os.stat(self._get_path(bucketname, filename)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        return generation
+
+    def list_filenames(self, bucketname):
+
+        bucket_dir = os.path.join(self.root_dir, bucketname)
+
+        if not os.path.isdir(bucket_dir):
+            return []
+
+        return sorted(filename for filename in os.listdir(bucket_dir) if not filename.endswith('.tmp'))
+
+class MemoryStorageBackend(StorageBackend):
+
+    def __init__(self):
+        self.file_dict = {}
+        self.generation_count = 0
+        self._lock = threading.Lock()
+
+    def read_bytes(self, bucketname, filename):
+
+        with self._lock:
+            if (bucketname, filename) not in self.file_dict:
+                raise StorageNotFoundError(f"{filename} not found in {bucketname}")
+
+            content, _ = self.file_dict[(bucketname, filename)]
+
+        return content
+
+    def write_bytes(self, bucketname, filename, content, content_type=None):
+
+        with self._lock:
+            self.generation_count += 1
+            self.file_dict[(bucketname, filename)] = (bytes(content), self.generation_count)
+
+        return
+
+    def get_generation(self, bucketname, filename):
+
+        with self._lock:
+            if (bucketname, filename) not in self.file_dict:
+                return None
+
+            _, generation = self.file_dict[(bucketname, filename)]
+
+        return generation
+
+    def list_filenames(self, bucketname):
+
+        with self._lock:
+            filename_list = sorted(filename for file_bucketname, filename in self.file_dict if file_bucketname == bucketname)
+
+        return filename_list
+
+_BACKEND_CLASS_DICT = {
+    'gcs': GcsStorageBackend,
+    'local': LocalStorageBackend,
+    'memory': MemoryStorageBackend
+}
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+def make_storage_backend(backend_name):
+
+    if backend_name not in _BACKEND_CLASS_DICT:
+        raise ValueError(f"unknown STORAGE_BACKEND {backend_name}, expected one of {sorted(_BACKEND_CLASS_DICT)}")
+
+    return _BACKEND_CLASS_DICT[backend_name]()
+
+# # the backend cloud_storage reads and writes through, built from STORAGE_BACKEND the first time it is needed
+def get_storage_backend():
+    global _BACKEND
+
+    with _BACKEND_LOCK:
+        if _BACKEND is None:
+            _BACKEND = make_storage_backend(STORAGE_BACKEND)
+
+    return _BACKEND
+
+# # swaps the backend out, e.g. for a MemoryStorageBackend in a benchmark
+def set_storage_backend(backend):
+    global _BACKEND
+
+    with _BACKEND_LOCK:
+        _BACKEND = backend
+
+    return backend
@@ -0,0 +1,226 @@
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# # how often a cached dataset asks storage whether it changed, the check (and any reload) runs in the background
+CHECK_INTERVAL_SECONDS = float(os.environ.get('DATASET_CACHE_CHECK_INTERVAL_SECONDS', 60))
+# # datasets nobody asked for in this long get dropped
+TTL_SECONDS = float(os.environ.get('DATASET_CACHE_TTL_SECONDS', 6 * 60 * 60))
+# # least recently used datasets get dropped once everything cached adds up to more than this
+MAX_BYTES = int(os.environ.get('DATASET_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+# # with 0 the checks and reloads happen on the calling thread instead, e.g. for scripts
+BACKGROUND_REFRESH = os.environ.get('DATASET_CACHE_BACKGROUND_REFRESH', '1') != '0'
+
+# # roughly how much memory a cached value holds
+def get_value_size(value):
+
+    if hasattr(value, 'memory_usage') and hasattr(value, 'columns'):
+        return int(value.memory_usage(deep=True).sum())
+
+    # # e.g. api_payload.ApiPayload
+    if hasattr(value, 'body_dict'):
+        return sum(len(body) for body in value.body_dict.values())
+
+    # # e.g. pool_query.SeriesIndex
+    if hasattr(value, 'get_size'):
+        return value.get_size()
+
+    return sys.getsizeof(value)
+
+# # one loaded version of a dataset, never changed once it is made, a reload makes a new one
+class Snapshot:
+
+    def __init__(self, value, generation, size):
+        self.value = value
+        self.generation = generation
+        self.size = size
+        self.loaded_at = time.time()
+
+class CacheEntry:
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.last_access = time.time()
+        self.last_check = time.time()
+        self.refreshing = False
+
+# # keeps datasets we serve from storage in memory
+# # readers always get the latest complete snapshot straight away, a newer generation in storage gets loaded in the background and swapped in whole
+class DatasetCache:
+
+    def __init__(self, check_interval_seconds=None, ttl_seconds=None, max_bytes=None, background_refresh=None, max_workers=2):
+
+        self.check_interval_seconds = CHECK_INTERVAL_SECONDS if check_interval_seconds is None else check_interval_seconds
+        self.ttl_seconds = TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        self.background_refresh = BACKGROUND_REFRESH if background_refresh is None else background_refresh
+        self.max_workers = max_workers
+
+        self.entry_dict = {}
+        self.stat_dict = {'hits': 0, 'misses': 0, 'reloads': 0, 'evictions': 0, 'check_errors': 0}
+
+        self._lock = threading.Lock()
+        # # when get last swept out idle datasets, a warmed up server never loads again so evict can't wait for _load
+        self._last_sweep = time.time()
+        # # one lock per key so a dataset is only ever loaded once at a time
+        self._load_lock_dict = {}
+        self._executor = None
+
+    def _get_load_lock(self, key):
+
+        with self._lock:
+            return self._load_lock_dict.setdefault(key, threading.Lock())
+
+    def _get_executor(self):
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dataset_cache')
+
+        return self._executor
+
+    # # returns the cached value for key, loading it on the calling thread only the very first time
+    # # generation_function returns something that changes whenever the dataset in storage does (e.g. a blob generation)
+    def get(self, key, load_function, generation_function=None):
+
+        now = time.time()
+
+        with self._lock:
+            entry = self.entry_dict.get(key)
+
+            # # nobody asked for it in ttl_seconds, it may be long out of date so it counts as a miss
+            if entry is not None and now - entry.last_access > self.ttl_seconds:
+                del self.entry_dict[key]
+                self.stat_dict['evictions'] += 1
+                entry = None
+
+            sweep_due = now - self._last_sweep >= self.check_interval_seconds
+
+            if sweep_due:
+                self._last_sweep = now
+
+            if entry is not None:
+                entry.last_access = now
+                self.stat_dict['hits'] += 1
+
+                check_due = generation_function is not None and not entry.refreshing and now - entry.last_check >= self.check_interval_seconds
+
+                if check_due:
+                    entry.refreshing = True
+
+        if sweep_due:
+            self.evict()
+
+        if entry is None:
+            return self._load(key, load_function, generation_function).value
+
+        if check_due:
+            if self.background_refresh:
+                self._get_executor().submit(self._check_and_reload, key, entry, load_function, generation_function)
+            else:
+                self._check_and_reload(key, entry, load_function, generation_function)
+
+        # # whatever snapshot is current, a reload running right now swaps in a new one without touching this one
+        return entry.snapshot.value
+
+    def _load(self, key, load_function, generation_function):
+
+        with self._get_load_lock(key):
+            # # someone else may have loaded it while we waited
+            with self._lock:
+                entry = self.entry_dict.get(key)
+
+            if entry is not None:
+                return entry.snapshot
+
+            # # the generation is read before the load so a publish landing in between is picked up by the next check
+            generation = generation_function() if generation_function is not None else None
+            value = load_function()
+            snapshot = Snapshot(value, generation, get_value_size(value))
+
+            with self._lock:
+                self.entry_dict[key] = CacheEntry(snapshot)
+                self.stat_dict['misses'] += 1
+
+            self.evict()
+
+        return snapshot
+
+    def _check_and_reload(self, key, entry, load_function, generation_function):
+
+        try:
+            generation = generation_function()
+
+            if generation != entry.snapshot.generation:
+                with self._get_load_lock(key):
+                    value = load_function()
+
+                # # swapping the reference is atomic, readers see the old snapshot or the new one and never a mix
+                entry.snapshot = Snapshot(value, generation, get_value_size(value))
+
+                with self._lock:
+                    self.stat_dict['reloads'] += 1
+
+                logging.info('dataset cache reloaded %s at generation %s', key, generation)
+
+                self.evict()
+
+        except Exception as e:
+            # # storage hiccups keep us serving what we have
+            with self._lock:
+                self.stat_dict['check_errors'] += 1
+
+            logging.warning('dataset cache could not refresh %s: %s', key, e)
+
+        finally:
+            entry.last_check = time.time()
+            entry.refreshing = False
+
+        return
+
+    # # drops datasets idle for longer than ttl_seconds, then the least recently used ones until we fit in max_bytes
+    def evict(self):
+
+        now = time.time()
+
+        with self._lock:
+            for key, entry in list(self.entry_dict.items()):
+                if now - entry.last_access > self.ttl_seconds:
+                    del self.entry_dict[key]
+                    self.stat_dict['evictions'] += 1
+
+            total_size = sum(entry.snapshot.size for entry in self.entry_dict.values())
+
+            for key, entry in sorted(self.entry_dict.items(), key=lambda item: item[1].last_access):
+                # # the dataset we just loaded always stays, even on its own it is more than max_bytes
+                if total_size <= self.max_bytes or len(self.entry_dict) <= 1:
+                    break
+
+                del self.entry_dict[key]
+                total_size -= entry.snapshot.size
+                self.stat_dict['evictions'] += 1
+
+        return
+
+    # # drops one key, or everything when key is None, e.g. right after we published new files ourselves
+    def invalidate(self, key=None):
+
+        with self._lock:
+            if key is None:
+                self.entry_dict.clear()
+            else:
+                self.entry_dict.pop(key, None)
+
+        return
+
+    def get_stats(self):
+
+        with self._lock:
+            stat_dict = dict(self.stat_dict)
+            stat_dict['entries'] = len(self.entry_dict)
+            stat_dict['bytes'] = sum(entry.snapshot.size for entry in self.entry_dict.values())
+
+        return stat_dict
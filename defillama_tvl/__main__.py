@@ -0,0 +1,4 @@
+import main
+
+# # python -m defillama_tvl refresh|fetch|compute|publish|prices, run from the repo root like main.py
+main.main()
@@ -0,0 +1,96 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+# # orjson is optional, without it we encode with the standard library the same way, just slower
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# # what datetime columns are written as unless the caller says otherwise
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+def is_orjson_available():
+    return orjson is not None
+
+# # numpy scalars, timestamps and the like, whatever json doesn't know natively
+def _default(value):
+
+    if value is pd.NA or value is pd.NaT:
+        return None
+
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return None if pd.isna(value) else pd.Timestamp(value).strftime(DATE_FORMAT)
+
+    if hasattr(value, 'item'):
+        return value.item()
+
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+
+    raise TypeError(f"{type(value)} is not json serializable")
+
+# # NaN and infinity aren't json, orjson writes them as null and so do we
+def _replace_nan(data):
+
+    if isinstance(data, float):
+        return None if math.isnan(data) or math.isinf(data) else data
+
+    if isinstance(data, dict):
+        return {key: _replace_nan(value) for key, value in data.items()}
+
+    if isinstance(data, (list, tuple)):
+        return [_replace_nan(value) for value in data]
+
+    return data
+
+# # utf-8 json bytes with sorted keys, compact separators and NaN as null (orjson writes non ascii as is, the fallback escapes it)
+def dumps(data):
+
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+    # # escapes non ascii (e.g. USD₮0) like jsonify did, so without orjson our payloads keep their bytes and etags
+    return json.dumps(_replace_nan(data), default=_default, sort_keys=True, separators=(',', ':'), ensure_ascii=True, allow_nan=False).encode('utf-8')
+
+def loads(content):
+
+    if orjson is not None:
+        return orjson.loads(content)
+
+    return json.loads(content)
+
+# # every value of one column as its json text
+def _get_value_json_list(series, date_format):
+
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        series = series.dt.strftime(date_format)
+
+    # # numeric columns go to json as one array in a single call, numbers never contain a comma so splitting it apart is safe
+    # # nullable extension columns (e.g. Int64) go the slow way so their missing values stay null instead of turning them into floats
+    if orjson is not None and isinstance(series.dtype, np.dtype) and series.dtype.kind in 'fiu' and len(series) > 0:
+        return orjson.dumps(series.to_numpy(), option=orjson.OPT_SERIALIZE_NUMPY)[1:-1].split(b',')
+
+    return [dumps(value) for value in series.tolist()]
+
+# # the json object of every row of df, sorted keys like dumps, built a column at a time instead of through a dictionary per row
+# # datetime columns are written with date_format, NaN and NaT as null
+def get_record_json_list(df, date_format=DATE_FORMAT):
+
+    part_list = []
+
+    for column in sorted(df.columns):
+        key_json = dumps(str(column)) + b':'
+        part_list.append([key_json + value_json for value_json in _get_value_json_list(df[column], date_format)])
+
+    if len(part_list) == 0:
+        return [b'{}'] * len(df)
+
+    return [b'{' + b','.join(row) + b'}' for row in zip(*part_list)]
+
+# # df as the json array of its records, what to_dict('records') and jsonify used to give us
+def dumps_records(df, date_format=DATE_FORMAT):
+    return b'[' + b','.join(get_record_json_list(df, date_format)) + b']'
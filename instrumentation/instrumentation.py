@@ -0,0 +1,199 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# # every @instrument call records its wall time and row counts, set INSTRUMENTATION_ENABLED=0 to skip even that
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1') != '0'
+# # peak memory per call needs tracemalloc, which slows everything down a few times over, so it is opt in
+TRACE_MEMORY = os.environ.get('INSTRUMENTATION_TRACE_MEMORY', '0') == '1'
+# # where write_run_report puts its json when it isn't given a path, nothing gets written if this is empty
+RUN_REPORT_PATH = os.environ.get('RUN_REPORT_PATH', '')
+
+_CALL_LIST = []
+_CALL_LOCK = threading.Lock()
+
+# # the peak memory of each call we are currently inside of, per thread, so nested calls don't lose their parent's peak
+_LOCAL = threading.local()
+
+# # rows in a dataframe argument or result, None for anything else
+def get_row_count(value):
+
+    if hasattr(value, 'shape') and hasattr(value, 'columns'):
+        return len(value)
+
+    # # functions like compute_tvl_dfs return a tuple of dataframes
+    if isinstance(value, tuple):
+        row_count_list = [get_row_count(item) for item in value]
+        row_count_list = [row_count for row_count in row_count_list if row_count is not None]
+
+        if len(row_count_list) > 0:
+            return sum(row_count_list)
+
+    return None
+
+def _get_rows_in(args, kwargs):
+
+    row_count_list = [get_row_count(value) for value in list(args) + list(kwargs.values())]
+    row_count_list = [row_count for row_count in row_count_list if row_count is not None]
+
+    if len(row_count_list) < 1:
+        return None
+
+    return sum(row_count_list)
+
+def set_trace_memory(trace_memory):
+    global TRACE_MEMORY
+
+    TRACE_MEMORY = trace_memory
+
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    return
+
+def _get_peak_stack():
+
+    if not hasattr(_LOCAL, 'peak_stack'):
+        _LOCAL.peak_stack = []
+
+    return _LOCAL.peak_stack
+
+def record_call(record):
+
+    with _CALL_LOCK:
+        _CALL_LIST.append(record)
+
+    logging.debug('instrumented call: %s', json.dumps(record))
+
+    return
+
+# # records how long each call takes, how many rows go in and come out and (with TRACE_MEMORY) how much memory it peaked at
+def instrument(function):
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+
+        if not INSTRUMENTATION_ENABLED:
+            return function(*args, **kwargs)
+
+        trace_memory = TRACE_MEMORY and tracemalloc.is_tracing()
+
+        if trace_memory:
+            peak_stack = _get_peak_stack()
+            start_memory, start_peak = tracemalloc.get_traced_memory()
+
+            # # tracemalloc only has one peak, so our parent's peak so far is saved before we reset it
+            if len(peak_stack) > 0:
+                peak_stack[-1] = max(peak_stack[-1], start_peak)
+
+            tracemalloc.reset_peak()
+            peak_stack.append(start_memory)
+
+        start_time = time.perf_counter()
+
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start_time
+
+            peak_memory_bytes = None
+
+            if trace_memory:
+                peak = max(peak_stack.pop(), tracemalloc.get_traced_memory()[1])
+                peak_memory_bytes = peak - start_memory
+
+                # # our peak is also our parent's
+                if len(peak_stack) > 0:
+                    peak_stack[-1] = max(peak_stack[-1], peak)
+
+        record_call({
+            'function': function.__name__,
+            'seconds': round(seconds, 6),
+            'rows_in': _get_rows_in(args, kwargs),
+            'rows_out': get_row_count(result),
+            'peak_memory_bytes': peak_memory_bytes
+        })
+
+        return result
+
+    return wrapper
+
+def reset_calls():
+
+    with _CALL_LOCK:
+        _CALL_LIST.clear()
+
+    return
+
+def get_call_list():
+
+    with _CALL_LOCK:
+        call_list = list(_CALL_LIST)
+
+    return call_list
+
+# # rolls our calls up per function, in the order each function was first called
+def get_call_summary():
+
+    summary_dict = {}
+
+    for call in get_call_list():
+        function_summary = summary_dict.setdefault(call['function'], {
+            'calls': 0,
+            'total_seconds': 0.0,
+            'max_seconds': 0.0,
+            'rows_in': 0,
+            'rows_out': 0,
+            'max_peak_memory_bytes': None
+        })
+
+        function_summary['calls'] += 1
+        function_summary['total_seconds'] += call['seconds']
+        function_summary['max_seconds'] = max(function_summary['max_seconds'], call['seconds'])
+        function_summary['rows_in'] += call['rows_in'] or 0
+        function_summary['rows_out'] += call['rows_out'] or 0
+
+        if call['peak_memory_bytes'] is not None:
+            function_summary['max_peak_memory_bytes'] = max(function_summary['max_peak_memory_bytes'] or 0, call['peak_memory_bytes'])
+
+    for function_summary in summary_dict.values():
+        function_summary['total_seconds'] = round(function_summary['total_seconds'], 6)
+
+    return summary_dict
+
+# # writes one json report for the run, section_dict adds anything else worth comparing run over run (stage timings, request metrics)
+# # returns the path it wrote to, or None if neither path nor RUN_REPORT_PATH is set
+def write_run_report(path=None, section_dict=None):
+
+    if path is None:
+        path = RUN_REPORT_PATH
+
+    if not path:
+        return None
+
+    report_dict = {
+        'finished_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'trace_memory': TRACE_MEMORY,
+        'functions': get_call_summary()
+    }
+
+    if section_dict is not None:
+        report_dict.update(section_dict)
+
+    directory = os.path.dirname(path)
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, 'w') as file:
+        json.dump(report_dict, file, indent=2)
+
+    return path
+
+if TRACE_MEMORY:
+    set_trace_memory(True)
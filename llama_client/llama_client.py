@@ -0,0 +1,520 @@
+import requests
+import json
+import random
+import threading
+import time
+import os
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from llama_client import response_cache
+
+# # urllib3 only decodes brotli responses when one of these is installed, so we only ask for br when it can
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        BROTLI_AVAILABLE = False
+
+# # requests per second we allow against each DefiLlama host and how many we can burst at once
+# # can be overridden with environment variables without touching the code
+REQUESTS_PER_SECOND = float(os.environ.get('LLAMA_REQUESTS_PER_SECOND', 2))
+BURST_SIZE = int(os.environ.get('LLAMA_BURST_SIZE', 4))
+MAX_WORKERS = int(os.environ.get('LLAMA_MAX_WORKERS', 4))
+
+# # how many times we try a request before giving up and how long we back off between tries
+MAX_ATTEMPTS = int(os.environ.get('LLAMA_MAX_ATTEMPTS', 4))
+BACKOFF_BASE_SECONDS = float(os.environ.get('LLAMA_BACKOFF_BASE_SECONDS', 1))
+BACKOFF_MAX_SECONDS = float(os.environ.get('LLAMA_BACKOFF_MAX_SECONDS', 30))
+# # after this many failures in a row we stop calling a host for CIRCUIT_BREAKER_COOLDOWN_SECONDS
+CIRCUIT_BREAKER_THRESHOLD = int(os.environ.get('LLAMA_CIRCUIT_BREAKER_THRESHOLD', 5))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('LLAMA_CIRCUIT_BREAKER_COOLDOWN_SECONDS', 60))
+# # the most time a single refresh run may spend talking to DefiLlama
+RUN_DEADLINE_SECONDS = float(os.environ.get('LLAMA_RUN_DEADLINE_SECONDS', 30 * 60))
+# # (connect, read) timeouts per host, /protocol payloads can be tens of MB so api.llama.fi gets the longest read timeout
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get('LLAMA_CONNECT_TIMEOUT_SECONDS', 5))
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get('LLAMA_REQUEST_TIMEOUT_SECONDS', 60))
+HOST_TIMEOUT_DICT = {
+    'api.llama.fi': (CONNECT_TIMEOUT_SECONDS, 120),
+    'yields.llama.fi': (CONNECT_TIMEOUT_SECONDS, 60),
+    'coins.llama.fi': (CONNECT_TIMEOUT_SECONDS, 30)
+}
+
+# # statuses that are worth trying again, anything else is returned to the caller as is
+RETRY_STATUS_CODE_LIST = [429, 500, 502, 503, 504]
+# # errors that are worth trying again, e.g. a connection dropped halfway through a body, anything else is raised as is
+RETRY_EXCEPTION_TUPLE = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+
+class LlamaRequestError(Exception):
+    pass
+
+# # the host has failed too many times in a row and is in its cooldown
+class CircuitOpenError(LlamaRequestError):
+    pass
+
+# # the run has used up its RUN_DEADLINE_SECONDS
+class DeadlineExceededError(LlamaRequestError):
+    pass
+
+# # classic token bucket, tokens refill continuously at rate per second up to capacity
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    # # blocks until a token is available and then consumes it
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait_time = (1 - self.tokens) / self.rate
+
+            time.sleep(wait_time)
+
+_BUCKETS = {}
+_BUCKETS_LOCK = threading.Lock()
+
+# # each host (api.llama.fi, yields.llama.fi, coins.llama.fi) has its own limit so each gets its own bucket
+def get_host_bucket(url):
+    host = urlparse(url).netloc
+
+    with _BUCKETS_LOCK:
+        if host not in _BUCKETS:
+            _BUCKETS[host] = TokenBucket(REQUESTS_PER_SECOND, BURST_SIZE)
+
+        bucket = _BUCKETS[host]
+
+    return bucket
+
+# # changes the limits for every host, existing buckets are replaced
+def configure_rate_limit(requests_per_second, burst_size=None):
+    global REQUESTS_PER_SECOND, BURST_SIZE
+
+    REQUESTS_PER_SECOND = float(requests_per_second)
+
+    if burst_size is not None:
+        BURST_SIZE = int(burst_size)
+
+    with _BUCKETS_LOCK:
+        _BUCKETS.clear()
+
+    return
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+# # one shared session so every thread reuses keep-alive connections instead of a new TCP+TLS handshake per request
+def get_session():
+    global _SESSION
+
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max(MAX_WORKERS, 4))
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+            if BROTLI_AVAILABLE:
+                session.headers['Accept-Encoding'] = 'gzip, deflate, br'
+            else:
+                session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+            session.headers['Connection'] = 'keep-alive'
+
+            _SESSION = session
+
+    return _SESSION
+
+# # returns the (connect, read) timeout we use for a url's host
+def get_host_timeout(url):
+
+    host = urlparse(url).netloc
+
+    return HOST_TIMEOUT_DICT.get(host, (CONNECT_TIMEOUT_SECONDS, REQUEST_TIMEOUT_SECONDS))
+
+_METRIC_LIST = []
+_METRIC_LOCK = threading.Lock()
+
+# # keeps one record per attempt so we can see latency, size and status per host
+def record_request_metric(url, status_code, latency_seconds, response_bytes, from_cache=False):
+
+    with _METRIC_LOCK:
+        _METRIC_LIST.append({
+            'host': urlparse(url).netloc,
+            'path': urlparse(url).path,
+            'status_code': status_code,
+            'latency_seconds': latency_seconds,
+            'bytes': response_bytes,
+            'from_cache': from_cache
+        })
+
+    return
+
+def reset_request_metrics():
+
+    with _METRIC_LOCK:
+        _METRIC_LIST.clear()
+
+    return
+
+def get_request_metric_list():
+
+    with _METRIC_LOCK:
+        metric_list = list(_METRIC_LIST)
+
+    return metric_list
+
+# # rolls our request metrics up per host
+def get_request_metrics_summary():
+
+    summary_dict = {}
+
+    for metric in get_request_metric_list():
+        host_summary = summary_dict.setdefault(metric['host'], {
+            'requests': 0,
+            'cache_hits': 0,
+            'errors': 0,
+            'bytes': 0,
+            'total_latency_seconds': 0.0,
+            'max_latency_seconds': 0.0,
+            'status_codes': {}
+        })
+
+        host_summary['requests'] += 1
+        host_summary['bytes'] += metric['bytes']
+        host_summary['total_latency_seconds'] += metric['latency_seconds']
+        host_summary['max_latency_seconds'] = max(host_summary['max_latency_seconds'], metric['latency_seconds'])
+
+        if metric['from_cache']:
+            host_summary['cache_hits'] += 1
+
+        if metric['status_code'] is None or metric['status_code'] >= 400:
+            host_summary['errors'] += 1
+
+        status_key = str(metric['status_code'])
+        host_summary['status_codes'][status_key] = host_summary['status_codes'].get(status_key, 0) + 1
+
+    for host_summary in summary_dict.values():
+        host_summary['mean_latency_seconds'] = host_summary['total_latency_seconds'] / host_summary['requests']
+
+    return summary_dict
+
+# # per host circuit breaker
+# # closed: requests go through, open: requests fail fast until the cooldown passes, then one trial request decides which way it goes
+class CircuitBreaker:
+
+    def __init__(self, threshold, cooldown_seconds):
+        self.threshold = threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.failure_count = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    # # raises CircuitOpenError if we shouldn't call this host right now
+    def before_request(self, host):
+        with self.lock:
+            if self.opened_at is None:
+                return
+
+            if time.monotonic() - self.opened_at < self.cooldown_seconds or self.trial_in_flight:
+                raise CircuitOpenError(f"{host} failed {self.failure_count} times in a row, not calling it for now")
+
+            self.trial_in_flight = True
+
+        return
+
+    def record_success(self):
+        with self.lock:
+            self.failure_count = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+        return
+
+    def record_failure(self):
+        with self.lock:
+            self.failure_count += 1
+            self.trial_in_flight = False
+
+            if self.failure_count >= self.threshold:
+                self.opened_at = time.monotonic()
+
+        return
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+def get_host_breaker(url):
+    host = urlparse(url).netloc
+
+    with _BREAKERS_LOCK:
+        if host not in _BREAKERS:
+            _BREAKERS[host] = CircuitBreaker(CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN_SECONDS)
+
+        breaker = _BREAKERS[host]
+
+    return breaker
+
+_RUN_DEADLINE = None
+
+# # starts the clock on a refresh run, every request after the deadline fails with DeadlineExceededError
+def start_run_deadline(deadline_seconds=None):
+    global _RUN_DEADLINE
+
+    if deadline_seconds is None:
+        deadline_seconds = RUN_DEADLINE_SECONDS
+
+    _RUN_DEADLINE = time.monotonic() + deadline_seconds
+
+    with _BREAKERS_LOCK:
+        _BREAKERS.clear()
+
+    return
+
+# # seconds left before our run deadline, None if no run has started
+def get_remaining_run_seconds():
+
+    if _RUN_DEADLINE is None:
+        return None
+
+    return _RUN_DEADLINE - time.monotonic()
+
+def _check_run_deadline(url):
+
+    remaining_seconds = get_remaining_run_seconds()
+
+    if remaining_seconds is not None and remaining_seconds <= 0:
+        raise DeadlineExceededError(f"run deadline passed before we could fetch {url}")
+
+    return remaining_seconds
+
+# # full jitter exponential backoff, honours Retry-After when DefiLlama sends one
+def get_backoff_seconds(attempt, response=None):
+
+    backoff_seconds = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    if response is not None:
+        try:
+            backoff_seconds = max(backoff_seconds, min(BACKOFF_MAX_SECONDS, float(response.headers.get('Retry-After'))))
+        except (TypeError, ValueError):
+            pass
+
+    return backoff_seconds
+
+# # waits for our host's rate limiter and then sends the GET request
+# # connection errors, timeouts, broken bodies, 429s and 5xxs are retried up to MAX_ATTEMPTS times with jittered backoff
+# # gives back the last response once we run out of attempts, or raises if we never got one
+def rate_limited_get(url, **kwargs):
+
+    host = urlparse(url).netloc
+    breaker = get_host_breaker(url)
+
+    response = None
+    last_error = None
+    request_timeout = kwargs.pop('timeout', get_host_timeout(url))
+
+    for attempt in range(MAX_ATTEMPTS):
+        remaining_seconds = _check_run_deadline(url)
+        breaker.before_request(host)
+
+        get_host_bucket(url).acquire()
+
+        timeout = request_timeout
+
+        # # never let a single attempt run past our run deadline
+        if remaining_seconds is not None:
+            if isinstance(timeout, tuple):
+                timeout = tuple(max(0.1, min(part, remaining_seconds)) for part in timeout)
+            else:
+                timeout = max(0.1, min(timeout, remaining_seconds))
+
+        start_time = time.perf_counter()
+
+        try:
+            response = get_session().get(url, timeout=timeout, **kwargs)
+        except RETRY_EXCEPTION_TUPLE as e:
+            response = None
+            last_error = e
+        except Exception:
+            # # still counts against the host, otherwise a half open trial never ends and the breaker stays open until the next run
+            breaker.record_failure()
+            raise
+
+        if response is None:
+            record_request_metric(url, None, time.perf_counter() - start_time, 0)
+        elif kwargs.get('stream'):
+            record_request_metric(url, response.status_code, time.perf_counter() - start_time, int(response.headers.get('Content-Length', 0)))
+        else:
+            record_request_metric(url, response.status_code, time.perf_counter() - start_time, len(response.content))
+
+        if response is not None and response.status_code not in RETRY_STATUS_CODE_LIST:
+            breaker.record_success()
+            return response
+
+        breaker.record_failure()
+
+        if attempt + 1 >= MAX_ATTEMPTS:
+            break
+
+        # # hands a streamed connection back to the pool before we try again
+        if response is not None:
+            response.close()
+
+        backoff_seconds = get_backoff_seconds(attempt, response)
+        remaining_seconds = get_remaining_run_seconds()
+
+        if remaining_seconds is not None:
+            backoff_seconds = min(backoff_seconds, max(0, remaining_seconds))
+
+        print(f"Retrying {url} in {backoff_seconds:.1f}s (attempt {attempt + 1} of {MAX_ATTEMPTS} failed)")
+        time.sleep(backoff_seconds)
+
+    if response is None:
+        raise LlamaRequestError(f"{url} failed after {MAX_ATTEMPTS} attempts") from last_error
+
+    return response
+
+# # stands in for a requests response when the body comes out of our response cache
+class CachedResponse:
+
+    def __init__(self, url, content):
+        self.url = url
+        self.status_code = 200
+        self.content = content
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+# # GET that goes through our on-disk response cache
+# # fresh entries never touch the network, stale ones are revalidated with If-None-Match/If-Modified-Since
+def cached_get(url, **kwargs):
+
+    if not response_cache.CACHE_ENABLED:
+        return rate_limited_get(url, **kwargs)
+
+    entry = response_cache.get_entry(url)
+
+    if entry is not None and response_cache.is_fresh(entry):
+        content = response_cache.read_body(entry)
+
+        if content is not None:
+            record_request_metric(url, 200, 0.0, len(content), from_cache=True)
+            return CachedResponse(url, content)
+
+    if response_cache.CACHE_OFFLINE:
+        raise LookupError(f"{url} is not in the response cache and LLAMA_CACHE_OFFLINE is set")
+
+    headers = dict(kwargs.pop('headers', {}) or {})
+    headers.update(response_cache.get_conditional_headers(entry))
+
+    response = rate_limited_get(url, headers=headers, **kwargs)
+
+    if response.status_code == 304 and entry is not None:
+        content = response_cache.read_body(entry)
+
+        if content is not None:
+            response_cache.touch(entry)
+            return CachedResponse(url, content)
+
+        # # our body went missing underneath us so we ask again without the conditional headers
+        response = rate_limited_get(url, **kwargs)
+
+    if response.status_code == 200:
+        response_cache.store(url, response.content, response.headers)
+
+    return response
+
+# # opens a url's body as a binary file object without holding the whole payload in memory
+# # with the response cache on the body is streamed to disk first and read back from there
+# # raises LlamaRequestError if DefiLlama doesn't answer with a 200
+def open_stream(url):
+
+    if not response_cache.CACHE_ENABLED:
+        response = rate_limited_get(url, stream=True)
+
+        if response.status_code != 200:
+            response.close()
+            raise LlamaRequestError(f"{url} failed with status code: {response.status_code}")
+
+        response.raw.decode_content = True
+
+        return response.raw
+
+    entry = response_cache.get_entry(url)
+
+    if entry is not None and response_cache.is_fresh(entry):
+        file = response_cache.open_body(entry)
+
+        if file is not None:
+            record_request_metric(url, 200, 0.0, entry['size'], from_cache=True)
+            return file
+
+    if response_cache.CACHE_OFFLINE:
+        raise LookupError(f"{url} is not in the response cache and LLAMA_CACHE_OFFLINE is set")
+
+    response = rate_limited_get(url, headers=response_cache.get_conditional_headers(entry), stream=True)
+
+    if response.status_code == 304 and entry is not None:
+        response.close()
+        file = response_cache.open_body(entry)
+
+        if file is not None:
+            response_cache.touch(entry)
+            return file
+
+        # # our body went missing underneath us so we ask again without the conditional headers
+        response = rate_limited_get(url, stream=True)
+
+    if response.status_code != 200:
+        response.close()
+        raise LlamaRequestError(f"{url} failed with status code: {response.status_code}")
+
+    try:
+        entry = response_cache.store_stream(url, response.iter_content(chunk_size=64 * 1024), response.headers)
+    finally:
+        response.close()
+
+    return response_cache.open_body(entry)
+
+# # runs fetch_function over every key with bounded concurrency
+# # the rate limiter inside each fetch decides how fast we actually go, the workers only bound how many are in flight
+# # returns a dictionary of key -> result
+def fetch_all(key_list, fetch_function, max_workers=None):
+
+    if max_workers is None:
+        max_workers = MAX_WORKERS
+
+    key_list = list(key_list)
+
+    if len(key_list) < 1:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        result_list = list(executor.map(fetch_function, key_list))
+
+    return dict(zip(key_list, result_list))
@@ -0,0 +1,42 @@
+# # ijson is optional, without it we fall back to parsing the whole /protocol payload
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# # the chainTvls categories get_historic_protocol_tvl_df reads, tokens is its fallback when tokensInUsd is empty
+PROTOCOL_CATEGORY_LIST = ['tokensInUsd', 'tokens']
+# # get_historic_dex_tvl_df reads the tvl of every chain, so we keep it for all of them
+ALL_CHAIN_CATEGORY_LIST = ['tvl']
+
+def is_streaming_available():
+    return ijson is not None
+
+# # drops the entries before start_unix, except the last one so a series that has ended still counts as present
+def _trim_entry_list(entry_list, start_unix):
+
+    trimmed_entry_list = [entry for entry in entry_list if entry.get('date', 0) >= start_unix]
+
+    if len(trimmed_entry_list) < 1 and len(entry_list) > 0:
+        trimmed_entry_list = [entry_list[-1]]
+
+    return trimmed_entry_list
+
+# # walks an api.llama.fi/protocol payload one chain at a time and only keeps chainTvls[<chain>][<category>] for the chains we need
+# # ijson builds each chain in C, so this is about as fast as json.loads while only ever holding a single chain's history in memory
+# # returns a dictionary shaped like the original payload, {'chainTvls': {chain: {category: [entries]}}}
+def extract_protocol_chain_tvls(file_obj, chain_list, start_unix):
+
+    chain_set = set(chain_list)
+    chain_tvls = {}
+
+    for chain, chain_data in ijson.kvitems(file_obj, 'chainTvls', use_float=True):
+
+        category_list = list(ALL_CHAIN_CATEGORY_LIST)
+
+        if chain in chain_set:
+            category_list += PROTOCOL_CATEGORY_LIST
+
+        chain_tvls[chain] = {category: _trim_entry_list(chain_data[category], start_unix) for category in category_list if category in chain_data}
+
+    return {'chainTvls': chain_tvls}
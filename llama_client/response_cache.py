@@ -0,0 +1,233 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+# # on-disk cache for DefiLlama responses
+# # bodies are gzipped and stored under the sha256 of their content, so identical payloads are only kept once
+# # each url gets a small metadata file (keyed by the sha256 of the url) pointing at its body along with the etag/last-modified we need to revalidate it
+HOME_DIR = os.path.expanduser('~')
+CACHE_DIR = os.environ.get('LLAMA_CACHE_DIR', os.path.join(HOME_DIR, '.cache', 'defillama_tvl'))
+CACHE_ENABLED = os.environ.get('LLAMA_CACHE_ENABLED', '1') != '0'
+# # how long a response is served without asking DefiLlama again
+CACHE_TTL_SECONDS = int(os.environ.get('LLAMA_CACHE_TTL_SECONDS', 6 * 60 * 60))
+# # once the bodies take up more than this we evict the least recently used urls
+CACHE_MAX_BYTES = int(os.environ.get('LLAMA_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# # serves whatever is cached no matter how old it is and never touches the network
+CACHE_OFFLINE = os.environ.get('LLAMA_CACHE_OFFLINE', '0') == '1'
+
+_EVICTION_LOCK = threading.Lock()
+
+def get_url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+def _get_meta_path(url_key):
+    return os.path.join(CACHE_DIR, 'meta', url_key + '.json')
+
+def _get_body_path(body_key):
+    return os.path.join(CACHE_DIR, 'body', body_key + '.gz')
+
+# # writes to a temp file first so a reader never sees a half written entry
+def _atomic_write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    with open(temp_path, 'wb') as file:
+        file.write(content)
+
+    os.replace(temp_path, path)
+
+    return
+
+# # returns the metadata dictionary for a url or None if we have never cached it
+def get_entry(url):
+
+    try:
+        with open(_get_meta_path(get_url_key(url)), 'r') as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        entry = None
+
+    return entry
+
+# # returns the raw (decompressed) body for a cache entry or None if it has gone missing
+def read_body(entry):
+
+    file = open_body(entry)
+
+    if file is None:
+        return None
+
+    try:
+        with file:
+            content = file.read()
+    except (OSError, EOFError):
+        return None
+
+    return content
+
+def is_fresh(entry):
+    return CACHE_OFFLINE or time.time() - entry['fetched_at'] < CACHE_TTL_SECONDS
+
+# # opens the gzipped body for a cache entry as a file object, None if it has gone missing
+def open_body(entry):
+
+    try:
+        file = gzip.open(_get_body_path(entry['body_key']), 'rb')
+    except OSError:
+        return None
+
+    # # bumps the access time that our lru eviction works off of
+    try:
+        os.utime(_get_meta_path(get_url_key(entry['url'])))
+    except OSError:
+        pass
+
+    return file
+
+# # stores a response body and the headers we need for conditional requests
+def store(url, content, headers=None):
+
+    body_key = hashlib.sha256(content).hexdigest()
+    body_path = _get_body_path(body_key)
+
+    if not os.path.exists(body_path):
+        _atomic_write(body_path, gzip.compress(content))
+
+    return _write_entry(url, body_key, headers)
+
+# # same as store but for a body that arrives in chunks, we compress and hash as we go so it never sits in memory whole
+def store_stream(url, chunk_iterable, headers=None):
+
+    os.makedirs(os.path.join(CACHE_DIR, 'body'), exist_ok=True)
+
+    temp_path = os.path.join(CACHE_DIR, 'body', f"stream.{os.getpid()}.{threading.get_ident()}.tmp")
+    body_hash = hashlib.sha256()
+
+    try:
+        with gzip.open(temp_path, 'wb') as file:
+            for chunk in chunk_iterable:
+                body_hash.update(chunk)
+                file.write(chunk)
+
+        body_key = body_hash.hexdigest()
+        body_path = _get_body_path(body_key)
+
+        if os.path.exists(body_path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, body_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return _write_entry(url, body_key, headers)
+
+def _write_entry(url, body_key, headers=None):
+
+    if headers is None:
+        headers = {}
+
+    body_path = _get_body_path(body_key)
+
+    entry = {
+        'url': url,
+        'body_key': body_key,
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'fetched_at': time.time(),
+        'size': os.path.getsize(body_path)
+    }
+
+    _atomic_write(_get_meta_path(get_url_key(url)), json.dumps(entry).encode('utf-8'))
+
+    evict()
+
+    return entry
+
+# # a 304 means our copy is still good, so we just restart its ttl
+def touch(entry):
+
+    entry = dict(entry)
+    entry['fetched_at'] = time.time()
+
+    _atomic_write(_get_meta_path(get_url_key(entry['url'])), json.dumps(entry).encode('utf-8'))
+
+    return entry
+
+# # headers that let DefiLlama answer with a 304 instead of resending the whole payload
+def get_conditional_headers(entry):
+
+    headers = {}
+
+    if entry is None:
+        return headers
+
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    return headers
+
+# # drops the least recently used urls until our bodies fit inside CACHE_MAX_BYTES
+def evict():
+
+    meta_dir = os.path.join(CACHE_DIR, 'meta')
+
+    with _EVICTION_LOCK:
+        entry_list = []
+
+        for filename in os.listdir(meta_dir):
+            if not filename.endswith('.json'):
+                continue
+
+            meta_path = os.path.join(meta_dir, filename)
+
+            try:
+                with open(meta_path, 'r') as file:
+                    entry = json.load(file)
+                entry_list.append((os.path.getmtime(meta_path), meta_path, entry))
+            except (OSError, ValueError):
+                continue
+
+        # # bodies can be shared by several urls so we count each one once
+        body_size_dict = {entry['body_key']: entry['size'] for _, _, entry in entry_list}
+        total_size = sum(body_size_dict.values())
+
+        if total_size <= CACHE_MAX_BYTES:
+            return
+
+        entry_list = sorted(entry_list, key=lambda x: x[0])
+        body_reference_count = {}
+
+        for _, _, entry in entry_list:
+            body_reference_count[entry['body_key']] = body_reference_count.get(entry['body_key'], 0) + 1
+
+        for _, meta_path, entry in entry_list:
+            if total_size <= CACHE_MAX_BYTES:
+                break
+
+            body_key = entry['body_key']
+
+            try:
+                os.remove(meta_path)
+            except OSError:
+                continue
+
+            body_reference_count[body_key] -= 1
+
+            if body_reference_count[body_key] < 1:
+                try:
+                    os.remove(_get_body_path(body_key))
+                except OSError:
+                    pass
+
+                total_size -= body_size_dict[body_key]
+
+    return
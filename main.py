@@ -1,20 +1,24 @@
 import pandas as pd
-import requests
 from datetime import datetime as dt, date, timezone
 import time
 from pandas import json_normalize
 import numpy as np
 import json
 from cloud_storage import cloud_storage as cs
-from flask import Flask, send_from_directory, send_file, make_response, jsonify, url_for, Response, stream_with_context
+from price_store import price_store as ps
+from tvl_schema import tvl_schema
+from instrumentation import instrumentation
+from api_payload import api_payload
+from dataset_cache import dataset_cache
+from pool_query import pool_query
+from fast_json import fast_json
+from llama_client import llama_client as lc
+from llama_client import protocol_stream
+from flask import Flask, send_from_directory, send_file, make_response, jsonify, url_for, Response, stream_with_context, request, has_request_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
-from google.cloud import storage
-from google.cloud.exceptions import NotFound
-from google.auth import default
-from google.oauth2 import service_account
 import pandas as pd
 import io
 from io import BytesIO
@@ -23,19 +27,39 @@ import time
 import zipfile
 import csv
 from functools import lru_cache
+from contextlib import contextmanager
+import argparse
 from typing import List, Dict
+from urllib.parse import quote
 
-COOLDOWN_TIME = 5
 START_DATE = '2024-07-08'
 PRICE_BLOCKCHAIN = 'optimism'
 OPTIMISM_TOKEN_ADDRESS = '0x4200000000000000000000000000000000000042'
 WETH_TOKEN_ADDRESS = '0x4200000000000000000000000000000000000006'
+# # every token our incentives are paid out in, their prices get fetched alongside weth's
+INCENTIVE_TOKEN_ADDRESS_LIST = [OPTIMISM_TOKEN_ADDRESS]
+
+# # batchHistorical takes many coins and timestamps per request, these keep each url within what the api accepts
+PRICE_BATCH_MAX_URL_LENGTH = 4000
+PRICE_BATCH_MAX_TIMESTAMPS = 100
 
 CLOUD_BUCKET_NAME = 'cooldowns2'
 CLOUD_PRICE_FILENAME = 'token_prices.zip'
 CLOUD_DATA_FILENAME = 'super_fest.zip'
 CLOUD_AGGREGATE_FILENAME = 'super_fest_aggregate.zip'
 
+# # when set, run_all only fetches and recomputes the days after what we have already published
+INCREMENTAL_REFRESH = os.environ.get('INCREMENTAL_REFRESH', '0') == '1'
+
+# # compute leaves its outputs here for publish to upload
+COMPUTE_OUTPUT_DIR = os.environ.get('COMPUTE_OUTPUT_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'defillama_tvl', 'output'))
+
+# # seconds spent in each stage of the current refresh, see time_stage
+STAGE_TIME_DICT = {}
+
+# # how many days each incentive epoch in protocol_incentive_history.csv is spread across
+INCENTIVE_EPOCH_DAYS = 7
+
 # logging.basicConfig(level=logging.DEBUG)
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -65,8 +89,8 @@ def get_historic_protocol_pool_tvl_and_yield(pool_id):
     
     url = "https://yields.llama.fi/chart/" + pool_id
 
-    # Send a GET request to the URL
-    response = requests.get(url)
+    # Send a rate limited GET request to the URL, served from our response cache when we can
+    response = lc.cached_get(url)
 
     # Check if the request was successful
     if response.status_code == 200:
@@ -80,11 +104,21 @@ def get_historic_protocol_pool_tvl_and_yield(pool_id):
     return data
 
 
-def get_historic_protocol_tvl_json(protocol_slug):
+# # chain_list limits the payload to the chains we actually read
+# # with ijson installed those are streamed out of the response instead of parsing every chain's full history
+def get_historic_protocol_tvl_json(protocol_slug, chain_list=None):
     url = "https://api.llama.fi/protocol/" + protocol_slug
 
-    # Send a GET request to the URL
-    response = requests.get(url)
+    if chain_list is not None and protocol_stream.is_streaming_available():
+        start_unix = int(date_to_unix_timestamp(START_DATE))
+
+        with lc.open_stream(url) as file_obj:
+            data = protocol_stream.extract_protocol_chain_tvls(file_obj, chain_list, start_unix)
+
+        return data
+
+    # Send a rate limited GET request to the URL, served from our response cache when we can
+    response = lc.cached_get(url)
 
     # Check if the request was successful
     if response.status_code == 200:
@@ -102,8 +136,8 @@ def get_historic_dex_tvl_json(pool_id):
 
     url = "https://yields.llama.fi/chart/" + pool_id
 
-    # Send a GET request to the URL
-    response = requests.get(url)
+    # Send a rate limited GET request to the URL, served from our response cache when we can
+    response = lc.cached_get(url)
 
     # Check if the request was successful
     if response.status_code == 200:
@@ -154,6 +188,129 @@ def get_historic_protocol_tvl_df(data, blockchain, category):
 
     return df
 
+# # the chainTvls entries behind get_historic_protocol_tvl_df, falling back to token quantities when there are no usd amounts
+def get_token_entry_list(data, blockchain, category):
+    entry_list = data['chainTvls'][blockchain][category]
+
+    if len(entry_list) < 1:
+        entry_list = data['chainTvls'][blockchain]['tokens']
+
+    # # the wide builder blew up on an empty history too, our callers fall back on that
+    if len(entry_list) < 1:
+        raise KeyError(f"no {category} history for {blockchain}")
+
+    return entry_list
+
+# # long format version of get_historic_protocol_tvl_df, one row per (timestamp, token) with columns timestamp, token, token_amount
+# # fills preallocated numpy arrays straight from the payload instead of building a wide frame and melting it back down
+# # passing several entry lists (supply and borrow) adds them together the way add_dataframes did:
+# # a token one list never mentions counts as 0 on every one of that list's days, since those zeros can end up as a start_token_amount
+# # tokens are categorical with their categories sorted, so rows come back in the same (timestamp, token) order transpose_df gave us
+@instrumentation.instrument
+def build_long_token_df(entry_list_list):
+
+    token_code_dict = {}
+    # # most days list the same tokens in the same order, so we only look their codes up once per layout
+    token_layout_dict = {}
+    array_list = []
+
+    for entry_list in entry_list_list:
+        row_count = sum(len(entry['tokens']) for entry in entry_list)
+
+        timestamp_array = np.empty(row_count, dtype=np.int64)
+        token_code_array = np.empty(row_count, dtype=np.int64)
+        token_amount_array = np.empty(row_count, dtype=np.float64)
+
+        i = 0
+
+        for entry in entry_list:
+            tokens = entry['tokens']
+            j = i + len(tokens)
+
+            token_layout = tuple(tokens)
+
+            if token_layout not in token_layout_dict:
+                token_layout_dict[token_layout] = np.array([token_code_dict.setdefault(token, len(token_code_dict)) for token in token_layout], dtype=np.int64)
+
+            timestamp_array[i:j] = entry['date']
+            token_code_array[i:j] = token_layout_dict[token_layout]
+            token_amount_array[i:j] = list(tokens.values())
+
+            i = j
+
+        entry_timestamp_array = np.unique(np.array([entry['date'] for entry in entry_list], dtype=np.int64))
+
+        array_list.append((timestamp_array, token_code_array, token_amount_array, entry_timestamp_array))
+
+    token_count = len(token_code_dict)
+
+    timestamp_array_list = []
+    token_code_array_list = []
+    token_amount_array_list = []
+
+    for timestamp_array, token_code_array, token_amount_array, entry_timestamp_array in array_list:
+        timestamp_array_list.append(timestamp_array)
+        token_code_array_list.append(token_code_array)
+        token_amount_array_list.append(token_amount_array)
+
+        if len(array_list) < 2:
+            continue
+
+        missing_code_array = np.setdiff1d(np.arange(token_count), token_code_array)
+
+        timestamp_array_list.append(np.repeat(entry_timestamp_array, len(missing_code_array)))
+        token_code_array_list.append(np.tile(missing_code_array, len(entry_timestamp_array)))
+        token_amount_array_list.append(np.zeros(len(entry_timestamp_array) * len(missing_code_array)))
+
+    timestamp_array = np.concatenate(timestamp_array_list)
+    token_code_array = np.concatenate(token_code_array_list)
+    token_amount_array = np.concatenate(token_amount_array_list)
+
+    # # recodes our tokens so their codes follow alphabetical order
+    token_list = list(token_code_dict)
+    token_order = np.argsort(np.array(token_list, dtype=object), kind='stable')
+    recode_array = np.empty(token_count, dtype=np.int64)
+    recode_array[token_order] = np.arange(token_count)
+
+    token_code_array = recode_array[token_code_array]
+    sorted_token_list = [token_list[k] for k in token_order]
+
+    row_order = np.lexsort((token_code_array, timestamp_array))
+
+    timestamp_array = timestamp_array[row_order]
+    token_code_array = token_code_array[row_order]
+    token_amount_array = token_amount_array[row_order]
+
+    # # sums the rows that share a (timestamp, token), a pair with nothing but missing amounts stays NaN
+    if len(array_list) > 1 and len(timestamp_array) > 0:
+        is_group_start = np.r_[True, (np.diff(timestamp_array) != 0) | (np.diff(token_code_array) != 0)]
+        group_start_array = np.flatnonzero(is_group_start)
+
+        is_valid = ~np.isnan(token_amount_array)
+        token_amount_sum_array = np.add.reduceat(np.where(is_valid, token_amount_array, 0.0), group_start_array)
+        valid_count_array = np.add.reduceat(is_valid.astype(np.int64), group_start_array)
+
+        timestamp_array = timestamp_array[group_start_array]
+        token_code_array = token_code_array[group_start_array]
+        token_amount_array = np.where(valid_count_array > 0, token_amount_sum_array, np.nan)
+
+    df = pd.DataFrame({
+        'timestamp': timestamp_array,
+        'token': pd.Categorical.from_codes(token_code_array, categories=sorted_token_list),
+        'token_amount': token_amount_array
+    })
+
+    return df
+
+# # long format token history for a single chain
+def get_historic_protocol_tvl_long_df(data, blockchain, category):
+
+    entry_list = get_token_entry_list(data, blockchain, category)
+
+    df = build_long_token_df([entry_list])
+
+    return df
+
 # # makes a dataframe for our usd_supplied amounts
 def get_historic_dex_tvl_df(data):
     df = pd.DataFrame()
@@ -204,8 +361,6 @@ def get_historic_dex_tvl_df(data):
     
     # Reset the index to have a standard numeric index
     df = df.reset_index(drop=True)
-    
-    df.to_csv('test_test.csv',index=False)
 
     return df
 
@@ -244,8 +399,6 @@ def filter_start_timestamp(df, start_day):
     df['timestamp'] = df['timestamp'].astype(float)
 
     df = df.loc[df['timestamp'] >= start_day]
-    
-    df.to_csv('test_test.csv',index=False)
 
     return df
 
@@ -291,6 +444,7 @@ def run_all_apy():
 
 
 # # will manage pinging our api for us and making a subsequent df
+@instrumentation.instrument
 def get_pool_type_df(data, protocol_blockchain, pool_type):
 
     df = pd.DataFrame()
@@ -300,24 +454,32 @@ def get_pool_type_df(data, protocol_blockchain, pool_type):
         category = 'tokensInUsd'
         
         try:
-            df = get_historic_protocol_tvl_df(data, protocol_blockchain, category)
+            entry_list_list = [get_token_entry_list(data, protocol_blockchain, category)]
+
+            try:
+                entry_list_list.append(get_token_entry_list(data, protocol_blockchain + '-borrowed', category))
+            except:
+                print('could not add supply and borrow dataframes')
+
+            df = build_long_token_df(entry_list_list)
+
         except:
             df = get_historic_dex_tvl_df(data)
 
-        try:
-            pool_type = 'borrow'
-            protocol_blockchain += '-borrowed'
-            borrow_df = get_historic_protocol_tvl_df(data, protocol_blockchain, category)
+            try:
+                pool_type = 'borrow'
+                protocol_blockchain += '-borrowed'
+                borrow_df = get_historic_protocol_tvl_df(data, protocol_blockchain, category)
 
-            df = add_dataframes(df, borrow_df)
-        except:
-            print('could not add supply and borrow dataframes')
+                df = add_dataframes(df, borrow_df)
+            except:
+                print('could not add supply and borrow dataframes')
 
 
     elif pool_type == 'borrow':
         category = 'tokensInUsd'
         protocol_blockchain += '-borrowed'
-        df = get_historic_protocol_tvl_df(data, protocol_blockchain, category)
+        df = get_historic_protocol_tvl_long_df(data, protocol_blockchain, category)
     
 
     elif pool_type == 'AMM' or pool_type == 'Yield_Vault' or pool_type == 'Lending':
@@ -392,6 +554,7 @@ def add_dataframes(df1, df2):
 #     return result
 
 # # transposes our token columns
+@instrumentation.instrument
 def transpose_df(df):
     token_columns = [col for col in df.columns if col not in ['timestamp', 'pool_type']]
 
@@ -420,6 +583,7 @@ def first_valid(series):
     return series.dropna().iloc[0] if not series.dropna().empty else np.nan
 
 # # makes a new column for the starting_token_amount
+@instrumentation.instrument
 def add_start_token_amount_column(df):
 
     # Create the start_token_amount column
@@ -436,6 +600,7 @@ def add_start_token_amount_column(df):
 
     return df
 
+@instrumentation.instrument
 def add_change_in_token_amounts(df):
 
     df[['token_amount', 'start_token_amount']] = df[['token_amount', 'start_token_amount']].astype(float)
@@ -464,9 +629,10 @@ def find_token_prices(usd_df, data, protocol_blockchain):
     return df
 
 # # finds tvl over time for each asset supply and borrow side
+@instrumentation.instrument
 def find_tvl_over_time(df):
-    # Convert timestamp to datetime
-    df['date'] = pd.to_datetime(df['timestamp'], unit='s').dt.date
+    # Convert timestamp to a datetime64 day
+    df['date'] = pd.to_datetime(df['timestamp'], unit='s').dt.normalize()
 
     # Group by date and pool_type, then sum token_usd_amount
     grouped_df = df.groupby(['date', 'pool_type'])['token_usd_amount'].sum().reset_index()
@@ -483,31 +649,26 @@ def find_tvl_over_time(df):
 
 # # will only return rows for tokens specified in our protocol_pool.csv file for our desired protocol
 # # will onlry return pool_types that are specified in our protocol_pool.csv
-# # then drops duplicate dates
+# # semi-joins df against the (protocol_slug, token, pool_type) combos in our config with one MultiIndex lookup
+# # rows come back grouped by combo in config order (slug, then token, then pool_type) just like the old nested loops did
+@instrumentation.instrument
 def df_token_cleanup(protocol_df, df):
 
-    unique_slugs = protocol_df['protocol_slug'].unique()
-
-    df_list = []
-
-    for unique_slug in unique_slugs:
+    config_df = protocol_df[['protocol_slug', 'token', 'pool_type']].drop_duplicates()
 
-        temp_config_df = protocol_df.loc[protocol_df['protocol_slug'] == unique_slug]
+    # # orders our combos by first appearance of the slug, then the token within that slug, then the pool_type
+    slug_order = pd.factorize(config_df['protocol_slug'])[0]
+    token_order = pd.factorize(config_df['protocol_slug'] + '|' + config_df['token'])[0]
+    config_df = config_df.iloc[np.lexsort((token_order, slug_order))]
 
-        unique_tokens = temp_config_df['token'].unique()
+    config_index = pd.MultiIndex.from_frame(config_df)
+    df_index = pd.MultiIndex.from_frame(df[['protocol', 'token', 'pool_type']])
 
-        for token in unique_tokens:
-            temp_temp_config_df = temp_config_df.loc[temp_config_df['token'] == token]
+    combo_position = config_index.get_indexer(df_index)
+    matched = combo_position >= 0
 
-            unique_pool_types = temp_temp_config_df['pool_type'].unique()
-
-            for unique_pool in unique_pool_types:
-                temp_df = df.loc[(df['protocol'] == unique_slug) & (df['token'] == token)  & (df['pool_type'] == unique_pool)]
-
-                if len(temp_df) > 0:
-                    df_list.append(temp_df)
-
-    df = pd.concat(df_list)
+    df = df.loc[matched]
+    df = df.iloc[np.argsort(combo_position[matched], kind='stable')]
 
     return df
 
@@ -515,23 +676,31 @@ def df_token_cleanup(protocol_df, df):
 def get_protocol_incentives_df():
 
     df = pd.read_csv('protocol_incentive_history.csv')
+    df = tvl_schema.apply_schema(df)
     return df
 
-# Function to create new rows with incremented dates
-def expand_rows(row):
-    new_rows = [row.copy() for _ in range(7)]  # Create 7 copies (original + 6 new)
-    for i in range(1, 7):
-        new_rows[i]['date'] = row['date'] + pd.Timedelta(days=i)
-    return pd.DataFrame(new_rows)
+# # takes in a dataframe, and evenly distributes incentives accross the days of each epoch
+# # epochs are INCENTIVE_EPOCH_DAYS long unless the incentive history has an epoch_days column saying otherwise
+# # each row is repeated once per day of its epoch and shifted forward by a day offset instead of being copied row by row
+def fill_incentive_days(df, epoch_days=None):
+
+    if epoch_days is None:
+        epoch_days = INCENTIVE_EPOCH_DAYS
 
-# # takes in a dataframe, and evenly distributes incentives accross the next 7 days
-def fill_incentive_days(df):
-    df['incentives_per_day'] = df['epoch_token_incentives'] / 7
+    if 'epoch_days' in df.columns:
+        epoch_day_array = df['epoch_days'].fillna(epoch_days).astype(int).to_numpy()
+    else:
+        epoch_day_array = np.full(len(df), epoch_days, dtype=int)
+
+    df['incentives_per_day'] = df['epoch_token_incentives'] / epoch_day_array
 
     df['date'] = pd.to_datetime(df['date'])
 
-    # Apply the function to each row and concatenate the results
-    expanded_df = pd.concat([expand_rows(row) for _, row in df.iterrows()], ignore_index=True)
+    # # 0, 1, ... epoch_days - 1 for every original row
+    day_offset_array = np.arange(epoch_day_array.sum()) - np.repeat(np.cumsum(epoch_day_array) - epoch_day_array, epoch_day_array)
+
+    expanded_df = df.loc[df.index.repeat(epoch_day_array)].reset_index(drop=True)
+    expanded_df['date'] = expanded_df['date'] + pd.to_timedelta(day_offset_array, unit='D')
 
     # Sort the dataframe by date and other relevant columns if needed
     expanded_df = expanded_df.sort_values(['date', 'chain', 'platform', 'token', 'pool_type'])
@@ -550,18 +719,6 @@ def get_incentives_unix_timestamps(df):
     df['timestamp'] = df['timestamp'].astype(int)
     return df
 
-def make_dummy_cloud_price_df():
-
-    df = pd.DataFrame()
-
-    df['symbol'] = ['N/A']
-    df['timestamp'] = [1776]
-    df['date'] = ['2024-01-1']
-    df['price'] = [1.5]
-    df['token_address'] = ['N/A']
-
-    return df
-
 def parse_date(date_string):
     try:
         # Try parsing with microseconds
@@ -574,69 +731,97 @@ def parse_date(date_string):
             # If both fail, return the original string
             return str(date_string)
         
-# # will use the defillama price api to get the price of our token over time
-# # returns a list of jsons
-# # look here ** may need to remove the pricing functinoality that averages the two prices toghether
-def get_token_price_json_list(df, blockchain, token_address):
-    # url = "https://coins.llama.fi/batchHistorical?coins=%7B%22optimism:0x4200000000000000000000000000000000000042%22:%20%5B1666876743,%201666862343%5D%7D&searchWidth=600"
-    # url = "https://coins.llama.fi/batchHistorical?coins=%7B%22optimism:0x4200000000000000000000000000000000000042%22:%20%5B1686876743,%201686862343%5D%7D&searchWidth=600"
+# # packs our (coin, timestamps) pairs into as few batchHistorical urls as PRICE_BATCH_MAX_URL_LENGTH and PRICE_BATCH_MAX_TIMESTAMPS allow
+# # coin_timestamp_dict looks like {'optimism:0x42...': [1720569600, 1720584000], ...}
+def get_batch_historical_url_list(coin_timestamp_dict):
+
+    url_start = "https://coins.llama.fi/batchHistorical?coins="
+    url_end = "&searchWidth=600"
+
+    def make_url(batch_dict):
+        return url_start + quote(json.dumps(batch_dict, separators=(',', ':'))) + url_end
 
+    url_list = []
+    batch_dict = {}
+    batch_timestamp_count = 0
+
+    for coin, timestamp_list in coin_timestamp_dict.items():
+        for timestamp in timestamp_list:
+            candidate_dict = {key: list(value) for key, value in batch_dict.items()}
+            candidate_dict.setdefault(coin, []).append(int(timestamp))
+
+            # # starts a new batch once adding this pair would push us over either limit
+            if batch_timestamp_count > 0 and (batch_timestamp_count >= PRICE_BATCH_MAX_TIMESTAMPS or len(make_url(candidate_dict)) > PRICE_BATCH_MAX_URL_LENGTH):
+                url_list.append(make_url(batch_dict))
+                candidate_dict = {coin: [int(timestamp)]}
+                batch_timestamp_count = 0
+
+            batch_dict = candidate_dict
+            batch_timestamp_count += 1
+
+    if batch_timestamp_count > 0:
+        url_list.append(make_url(batch_dict))
+
+    return url_list
+
+# # sends one batchHistorical request, returns an empty coins dictionary if it failed
+def get_batch_historical_json(url):
+
+    # # a price gap shouldn't stop our refresh, we carry on with the prices we have
     try:
-        cloud_price_df = cs.read_zip_csv_from_cloud_storage(CLOUD_PRICE_FILENAME, CLOUD_BUCKET_NAME)
-    except:
-        cloud_price_df = make_dummy_cloud_price_df()
+        # Send a rate limited GET request to the URL
+        response = lc.rate_limited_get(url)
+    except lc.LlamaRequestError as e:
+        print(f"Request failed: {e}")
+        return {'coins': {}}
 
-    cloud_price_df = cloud_price_df.loc[cloud_price_df['token_address'].str.upper() == token_address.upper()]
+    # Check if the request was successful
+    if response.status_code == 200:
+        # Request was successful
+        data = response.json()  # Parse the JSON response
+    else:
+        # Request failed
+        print(f"Request failed with status code: {response.status_code}")
+        print(response.text)  # Print the response content for more info on the error
+        data = {'coins': {}}
 
-    if len(cloud_price_df) < 1:
-        cloud_price_df = make_dummy_cloud_price_df()
+    return data
 
-    # If you want it as a string in 'YYYY-MM-DD' format instead of a date object
-    cloud_price_df['date'] = pd.to_datetime(cloud_price_df['date']).dt.strftime('%Y-%m-%d')
-    df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+# # will use the defillama price api to get the price of our tokens over time
+# # token_df_dict maps each token address to the dataframe whose dates we need its price for
+# # every date missing from our cloud prices gets packed into as few batchHistorical requests as we can
+# # returns a list of jsons
+# # look here ** may need to remove the pricing functinoality that averages the two prices toghether
+def get_token_price_json_list(token_df_dict, blockchain):
 
-    # # finds any unique dates from the cloud
-    cloud_date_list = cloud_price_df['date'].unique()
-    # # finds all the unique dates from our defillama df
-    df_date_list = df['date'].unique()
+    # # only downloads token_prices.zip if it changed since our local price store last saw it
+    ps.sync_from_cloud(CLOUD_PRICE_FILENAME, CLOUD_BUCKET_NAME)
 
-    # unique_incentive_timestamps = [ts for ts in unique_incentive_timestamps if ts not in cloud_price_df['timestamp'].values]
+    coin_timestamp_dict = {}
 
-    # # finds the unique dates from defillama that are not present in the cloud
-    dates_to_check_list = [unique_date for unique_date in df_date_list if unique_date not in cloud_date_list]
-    # # turns these unique dates into unix timestamps
-    unique_timestamp_to_check = [date_to_unix_timestamp(str(unique_date)) for unique_date in dates_to_check_list]
+    for token_address, df in token_df_dict.items():
+        # # finds all the unique dates from our defillama df
+        df_date_list = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d').unique()
 
-    # # placeholder timestamp to use
-    if len(unique_timestamp_to_check) < 1:
-        unique_timestamp_to_check = [date_to_unix_timestamp(df_date_list[0])]
+        # # finds the unique dates from defillama that are not present in our price store
+        dates_to_check_list = ps.get_missing_dates(token_address, df_date_list)
 
+        # # asks for the start of the day and 4 hours in so we have a price even if one of them is missing
+        timestamp_list = []
 
-    data_list = []
-    for unique_timestamp in unique_timestamp_to_check:
+        for unique_date in dates_to_check_list:
+            start_timestamp = date_to_unix_timestamp(str(unique_date))
+            end_timestamp = start_timestamp + 14400
+            timestamp_list += [end_timestamp, start_timestamp]
 
-        start_timestamp = unique_timestamp
-        end_timestamp = start_timestamp + 14400
+        if len(timestamp_list) > 0:
+            coin_timestamp_dict[blockchain + ":" + token_address] = timestamp_list
 
-        url = "https://coins.llama.fi/batchHistorical?coins=%7B%22" + blockchain + ":" + token_address + "%22:%20%5B" + str(end_timestamp) + ",%20" + str(start_timestamp) + "%5D%7D&searchWidth=600"
-        # Send a GET request to the URL
-        response = requests.get(url)
+    url_list = get_batch_historical_url_list(coin_timestamp_dict)
 
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Request was successful
-            data = response.json()  # Parse the JSON response
-            if len(data['coins']) > 0:
-                data_list.append(data)
-            else:
-                unique_timestamp_to_check.append(1720569600)
-                pass
-        else:
-            # Request failed
-            print(f"Request failed with status code: {response.status_code}")
-            print(response.text)  # Print the response content for more info on the error
+    data_dict = lc.fetch_all(url_list, get_batch_historical_json)
 
-        time.sleep(COOLDOWN_TIME)
+    data_list = [data for data in data_dict.values() if len(data.get('coins', {})) > 0]
 
     return data_list
 
@@ -671,27 +856,23 @@ def make_prices_df(data_list):
 
                 df_list.append(df)
 
-    # # will try combining our dataframe with our existing cloud one and dropping duplicates
-    try:
-        cloud_df = cs.read_zip_csv_from_cloud_storage(CLOUD_PRICE_FILENAME, CLOUD_BUCKET_NAME)
-    except:
-        cloud_df = make_dummy_cloud_price_df()
-
+    # # adds our new prices to our price store, they replace any stored price for the same symbol and timestamp
+    # # the bucket copy only gets rewritten when we actually found something new
     if len(df_list) > 0:
         df = pd.concat(df_list, ignore_index=True)
-
-        df = pd.concat([df, cloud_df])
         df = df.drop_duplicates(subset=['symbol', 'timestamp'])
 
+        ps.add_prices(df[['symbol', 'token_address', 'timestamp', 'date', 'price']])
+        ps.publish_to_cloud(CLOUD_PRICE_FILENAME, CLOUD_BUCKET_NAME)
+
+    df = ps.get_prices_df()
 
     if len(df) > 0:
         df['timestamp'] = df['timestamp'].astype(int)
         df['date'] = df['timestamp'].apply(unix_timestamp_to_date)
         df = df[['symbol', 'token_address', 'timestamp', 'date','price']]
-        cs.df_write_to_cloud_storage_as_zip(df, CLOUD_PRICE_FILENAME, CLOUD_BUCKET_NAME)
-        return df
-    else:
-        return pd.DataFrame()  # Return an empty DataFrame if no valid data
+
+    return df
 
 # # takes in our incentives_per_day_df + incentives_timeseries_price_df
 # # returns incentives_per_day_df with a new incentives_per_day_usd column that is the incentives_per day quantity * price
@@ -717,20 +898,42 @@ def find_daily_incentives_usd(incentives_per_day_df, incentives_timeseries_price
 
     return incentives_per_day_df
 
-# # runs all of our incentive data gathering functions and returns a dataframe of the info
-def get_incentive_df():
+# # fetches any prices we are missing and returns our whole price history
+# # token_df_dict maps each token address to the dataframe whose dates we need its price for
+@instrumentation.instrument
+def get_token_prices_df(token_df_dict):
+
+    data_list = get_token_price_json_list(token_df_dict, PRICE_BLOCKCHAIN)
+    df = make_prices_df(data_list)
+
+    return df
+
+# # spreads our incentive history out into one row per day
+def get_incentive_days_df():
 
     df = get_protocol_incentives_df()
     df = fill_incentive_days(df)
     df = get_incentives_unix_timestamps(df)
-    data_list = get_token_price_json_list(df, PRICE_BLOCKCHAIN, OPTIMISM_TOKEN_ADDRESS)
-    incentives_timeseries_price_df = make_prices_df(data_list)
-    incentives_timeseries_price_df = incentives_timeseries_price_df.loc[incentives_timeseries_price_df['symbol'] == 'op']
+
+    return df
+
+# # runs all of our incentive data gathering functions and returns a dataframe of the info
+# # prices_df can be passed in when the incentive prices were already fetched alongside our other tokens
+def get_incentive_df(df=None, prices_df=None):
+
+    if df is None:
+        df = get_incentive_days_df()
+
+    if prices_df is None:
+        prices_df = get_token_prices_df({token_address: df for token_address in INCENTIVE_TOKEN_ADDRESS_LIST})
+
+    incentives_timeseries_price_df = prices_df.loc[prices_df['symbol'] == 'op']
     df = find_daily_incentives_usd(df, incentives_timeseries_price_df)
 
     return df
 
 # # merges our two dataframes together
+@instrumentation.instrument
 def combine_incentives_with_tvl(tvl_df, incentive_df):
     # Ensure 'date' columns are in the same format in both dataframes
     tvl_df['date'] = pd.to_datetime(tvl_df['date'])
@@ -755,12 +958,12 @@ def combine_incentives_with_tvl(tvl_df, incentive_df):
 # # returns a dataframe of weth's price over time
 def get_weth_price_over_time(df):
 
-    data_list = get_token_price_json_list(df, PRICE_BLOCKCHAIN, WETH_TOKEN_ADDRESS)
-    df = make_prices_df(data_list)
+    df = get_token_prices_df({WETH_TOKEN_ADDRESS: df})
 
     return df
 
 # # finds our start price, change in price usd, and change in price percentage per day relative to the start price
+@instrumentation.instrument
 def get_weth_price_change_since_start(df):
     df[['timestamp']] = df[['timestamp']].astype(int)
     df['price'] = df['price'].astype(float)
@@ -786,6 +989,9 @@ def get_weth_price_change_since_start(df):
     
     df = df.sort_values(by='timestamp')
 
+    # # our tvl rows are keyed by datetime64 days
+    df['date'] = pd.to_datetime(df['date'])
+
     return df
 
 # # converts a unix into a date
@@ -799,6 +1005,7 @@ def unix_timestamp_to_date(unix_timestamp):
     return date_string
 
 # # merges those dataframes as the name implies
+@instrumentation.instrument
 def merge_tvl_and_weth_dfs(tvl_df, weth_df):
 
     tvl_df = tvl_df.rename(columns={'price': 'op_price'})
@@ -825,10 +1032,12 @@ def merge_tvl_and_weth_dfs(tvl_df, weth_df):
 
 
 # # makes our top level aggreagate dafarame
-def get_aggregate_top_level_df(df):
+# # start_token_usd_amount and cumulative_incentives_usd_offset let an incremental refresh carry forward what we have already published
+@instrumentation.instrument
+def get_aggregate_top_level_df(df, start_token_usd_amount=None, cumulative_incentives_usd_offset=0):
     
-    df[['token_usd_amount', 'start_token_usd_amount', 'raw_change_in_usd', 'daily_tvl', 'epoch_token_incentives', 'incentives_per_day', 'op_price', 'incentives_per_day_usd', 'weth_price', 'weth_start_price', 'weth_change_in_price_usd', 'weth_change_in_price_percentage']] = df[['token_usd_amount', 'start_token_usd_amount', 'raw_change_in_usd', 'daily_tvl', 'epoch_token_incentives', 'incentives_per_day', 'op_price', 'incentives_per_day_usd', 'weth_price', 'weth_start_price', 'weth_change_in_price_usd', 'weth_change_in_price_percentage']].astype(float)
-    df['date'] = pd.to_datetime(df['date'])
+    # # published rows read back in from the bucket are typed by the schema as well, so this is a no-op for most columns
+    df = tvl_schema.apply_schema(df)
 
     # Group by day and aggregate the specified columns
     aggregated_df = df.groupby(df['date']).agg({
@@ -848,14 +1057,17 @@ def get_aggregate_top_level_df(df):
     }).reset_index()
     
     # # tried changing this one
-    min_start_tvl = aggregated_df['token_usd_amount'].tolist()[0]
+    if start_token_usd_amount is None:
+        min_start_tvl = aggregated_df['token_usd_amount'].tolist()[0]
+    else:
+        min_start_tvl = start_token_usd_amount
 
     aggregated_df['start_token_usd_amount'] = min_start_tvl
     aggregated_df['raw_change_in_usd'] = aggregated_df['token_usd_amount'] - aggregated_df['start_token_usd_amount']
 
     aggregated_df['percentage_change_in_usd'] = (aggregated_df['token_usd_amount'] / aggregated_df['start_token_usd_amount'] - 1)
 
-    aggregated_df['cumulative_incentives_usd'] = aggregated_df['incentives_per_day_usd'].cumsum()
+    aggregated_df['cumulative_incentives_usd'] = aggregated_df['incentives_per_day_usd'].cumsum() + cumulative_incentives_usd_offset
 
     aggregated_df['tvl_to_incentive_roi_percentage'] = aggregated_df['raw_change_in_usd'] / aggregated_df['cumulative_incentives_usd']
 
@@ -869,7 +1081,9 @@ def clean_up_bad_data_protocols(df):
     return df
 
 # # does same calculation as our aggregate for each pool
-def calculate_individual_protocol_incentive_roi(df):
+# # cumulative_incentives_df holds the cumulative incentives already published per pool for an incremental refresh
+@instrumentation.instrument
+def calculate_individual_protocol_incentive_roi(df, cumulative_incentives_df=None):
 
     # df_list = []
 
@@ -904,13 +1118,19 @@ def calculate_individual_protocol_incentive_roi(df):
     df = df.sort_values(['protocol', 'token', 'pool_type', 'chain', 'date'])  # Assuming you have a 'date' column
     df['cumulative_incentives_usd'] = df.groupby(['protocol', 'token', 'pool_type', 'chain'])['incentives_per_day_usd'].cumsum()
 
+    if cumulative_incentives_df is not None:
+        df = df.merge(cumulative_incentives_df, on=['protocol', 'token', 'pool_type', 'chain'], how='left')
+        df['cumulative_incentives_usd'] = df['cumulative_incentives_usd'] + df['published_cumulative_incentives_usd'].fillna(0)
+        df = df.drop(['published_cumulative_incentives_usd'], axis=1)
+
     df['tvl_to_incentive_roi_percentage'] = df['raw_change_in_usd'] / df['cumulative_incentives_usd']
 
     return df
 
 # # will make a dataframe that is WETH price adjusted
+@instrumentation.instrument
 def get_weth_adjusted_df(df):
-    df[['token_usd_amount', 'start_token_usd_amount', 'raw_change_in_usd', 'percentage_change_in_usd', 'daily_tvl', 'op_price', 'incentives_per_day_usd', 'weth_price', 'weth_start_price', 'weth_change_in_price_usd', 'weth_change_in_price_percentage', 'cumulative_incentives_usd', 'tvl_to_incentive_roi_percentage']] = df[['token_usd_amount', 'start_token_usd_amount', 'raw_change_in_usd', 'percentage_change_in_usd', 'daily_tvl', 'op_price', 'incentives_per_day_usd', 'weth_price', 'weth_start_price', 'weth_change_in_price_usd', 'weth_change_in_price_percentage', 'cumulative_incentives_usd', 'tvl_to_incentive_roi_percentage']].astype(float)
+    df = tvl_schema.apply_schema(df)
     
     # # if ETH went up in price then we make the adjustment negative
     # # if ETH went down in price then we make the adjustment positive
@@ -936,9 +1156,188 @@ def get_weth_adjusted_df(df):
 
     return df
 
-# @app.route('/api/update_data', methods=['GET'])
-# @limiter.limit("100 per hour")  # Adjust this limit as needed
-def run_all():
+# # reads what the last run published, returns None if there is nothing to build on yet
+def get_published_dfs(protocol_df):
+
+    try:
+        published_df = cs.read_from_cloud_storage_in_format(CLOUD_DATA_FILENAME, CLOUD_BUCKET_NAME, dtype=tvl_schema.get_csv_dtype_dict())
+        published_aggregate_df = cs.read_from_cloud_storage_in_format(CLOUD_AGGREGATE_FILENAME, CLOUD_BUCKET_NAME, dtype=tvl_schema.get_csv_dtype_dict())
+    except:
+        return None, None
+
+    if len(published_df) < 1 or len(published_aggregate_df) < 1:
+        return None, None
+
+    published_df = tvl_schema.apply_schema(published_df)
+    published_aggregate_df = tvl_schema.apply_schema(published_aggregate_df)
+
+    # # only keeps pools that are still in our protocol_pool.csv, same as a full refresh would
+    config_df = protocol_df[['protocol_slug', 'token', 'pool_type']].drop_duplicates().rename(columns={'protocol_slug': 'protocol'})
+    published_df = published_df.merge(config_df, on=['protocol', 'token', 'pool_type'], how='inner')
+
+    return published_df, published_aggregate_df
+
+# # finds the last published date for each pool along with the values we carry forward from it
+# # we recompute the last published day as well since DefiLlama's latest datapoint for a day can still change
+def get_refresh_from_date_df(published_df):
+
+    published_df = published_df.sort_values('date')
+
+    # # published keys come back as categories, observed=True keeps us to the combinations that exist (pandas 2 defaults to all of them)
+    refresh_df = published_df.groupby(['protocol', 'chain', 'token', 'pool_type'], observed=True).agg(
+        refresh_from_date=('date', 'max'),
+        published_start_token_usd_amount=('start_token_usd_amount', 'first')
+    ).reset_index()
+
+    refresh_df['published_start_token_usd_amount'] = refresh_df['published_start_token_usd_amount'].astype(float)
+
+    return refresh_df
+
+# # returns the unix timestamp a config row needs to start from, or our START_DATE if we have never published it
+def get_row_start_unix(refresh_df, protocol_slug, chain, token, pool_type, start_unix):
+
+    temp_df = refresh_df.loc[(refresh_df['protocol'] == protocol_slug) & (refresh_df['chain'] == chain) & (refresh_df['token'] == token) & (refresh_df['pool_type'] == pool_type)]
+
+    if len(temp_df) < 1:
+        return start_unix
+
+    refresh_from_unix = int(pd.Timestamp(temp_df['refresh_from_date'].min()).timestamp())
+
+    return max(start_unix, refresh_from_unix)
+
+# # swaps in the start_token_amount we already published so an incremental window doesn't restart the pool at its own first day
+def carry_forward_start_token_amount(df, refresh_df, protocol_slug, chain):
+
+    temp_df = refresh_df.loc[(refresh_df['protocol'] == protocol_slug) & (refresh_df['chain'] == chain), ['token', 'pool_type', 'published_start_token_usd_amount']]
+
+    df = df.merge(temp_df, on=['token', 'pool_type'], how='left')
+
+    df['start_token_amount'] = df['published_start_token_usd_amount'].fillna(df['start_token_amount'])
+
+    df = df.drop(['published_start_token_usd_amount'], axis=1)
+
+    return df
+
+# # splits our published rows into what we keep and the cumulative incentives each pool has built up so far
+# # new_df only keeps the days at or after each pool's refresh_from_date
+def split_published_and_new_rows(published_df, new_df, refresh_df):
+
+    key_list = ['protocol', 'chain', 'token', 'pool_type']
+
+    published_df = published_df.merge(refresh_df[key_list + ['refresh_from_date']], on=key_list, how='left')
+    published_df = published_df.loc[published_df['date'] < published_df['refresh_from_date']].drop(['refresh_from_date'], axis=1)
+
+    new_df['date'] = pd.to_datetime(new_df['date'])
+    new_df = new_df.merge(refresh_df[key_list + ['refresh_from_date']], on=key_list, how='left')
+    new_df = new_df.loc[new_df['refresh_from_date'].isna() | (new_df['date'] >= new_df['refresh_from_date'])].drop(['refresh_from_date'], axis=1)
+
+    published_df['incentives_per_day_usd'] = published_df['incentives_per_day_usd'].astype(float)
+    cumulative_incentives_df = published_df.groupby(key_list, observed=True)['incentives_per_day_usd'].sum().reset_index()
+    cumulative_incentives_df = cumulative_incentives_df.rename(columns={'incentives_per_day_usd': 'published_cumulative_incentives_usd'})
+
+    return published_df, new_df, cumulative_incentives_df
+
+# # rebuilds the aggregate only for the days our new rows touch, carrying the start tvl and cumulative incentives forward
+def get_incremental_aggregate_df(published_df, published_aggregate_df, merged_df):
+
+    aggregate_from_date = merged_df['date'].min()
+
+    earlier_df = published_df.loc[published_df['date'] < aggregate_from_date]
+    later_df = published_df.loc[published_df['date'] >= aggregate_from_date]
+
+    published_aggregate_df = published_aggregate_df.loc[published_aggregate_df['date'] < aggregate_from_date]
+
+    if len(earlier_df) < 1:
+        aggregate_df = get_aggregate_top_level_df(pd.concat([later_df, merged_df]))
+    else:
+        first_day_df = earlier_df.loc[earlier_df['date'] == earlier_df['date'].min()]
+        start_token_usd_amount = first_day_df['token_usd_amount'].astype(float).sum()
+        cumulative_incentives_usd_offset = earlier_df['incentives_per_day_usd'].astype(float).sum()
+
+        aggregate_df = get_aggregate_top_level_df(pd.concat([later_df, merged_df]), start_token_usd_amount, cumulative_incentives_usd_offset)
+
+    return published_aggregate_df, aggregate_df
+
+# # works out which DefiLlama payload a config row needs
+# # AMM pools live on the yields api under their pool_id, everything else is a protocol slug
+def get_fetch_key(protocol_slug, pool_type):
+
+    if pool_type == 'AMM':
+        fetch_key = ('dex', get_dex_pool_pool_id(protocol_slug))
+    else:
+        fetch_key = ('protocol', protocol_slug)
+
+    return fetch_key
+
+# # downloads the payload behind a fetch key
+def get_fetch_key_json(fetch_key, chain_list=None):
+
+    endpoint, fetch_id = fetch_key
+
+    if endpoint == 'dex':
+        data = get_historic_dex_tvl_json(fetch_id)
+    else:
+        data = get_historic_protocol_tvl_json(fetch_id, chain_list)
+
+    return data
+
+# # plans our downloads up front so each unique (endpoint, slug/pool_id) is only fetched once no matter how protocol_pool.csv is ordered
+# # returns the fetch key for every config row and a dictionary of fetch key -> payload
+def fetch_protocol_pool_data(protocol_df):
+
+    fetch_key_list = [get_fetch_key(protocol_slug, pool_type) for protocol_slug, pool_type in zip(protocol_df['protocol_slug'], protocol_df['pool_type'])]
+
+    unique_fetch_key_list = list(dict.fromkeys(fetch_key_list))
+
+    # # the chains each payload is read for, supply and borrow rows also read the '-borrowed' chain
+    chain_dict = {}
+
+    for fetch_key, chain in zip(fetch_key_list, protocol_df['chain']):
+        chain_dict.setdefault(fetch_key, []).extend([chain, chain + '-borrowed'])
+
+    data_dict = lc.fetch_all(unique_fetch_key_list, lambda fetch_key: get_fetch_key_json(fetch_key, chain_dict[fetch_key]))
+
+    return fetch_key_list, data_dict
+
+# # times a stage of our refresh, a stage that runs more than once (e.g. once per pool) adds up to one total
+@contextmanager
+def time_stage(stage):
+
+    start_time = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        STAGE_TIME_DICT[stage] = STAGE_TIME_DICT.get(stage, 0) + time.perf_counter() - start_time
+
+def reset_stage_times():
+
+    STAGE_TIME_DICT.clear()
+
+    return
+
+# # seconds spent in each stage in the order they first ran, plus the total
+def get_stage_time_summary():
+
+    summary_dict = {stage: round(seconds, 3) for stage, seconds in STAGE_TIME_DICT.items()}
+    summary_dict['total'] = round(sum(STAGE_TIME_DICT.values()), 3)
+
+    return summary_dict
+
+def print_stage_times():
+
+    total_seconds = sum(STAGE_TIME_DICT.values())
+
+    for stage, seconds in STAGE_TIME_DICT.items():
+        percentage = seconds / total_seconds * 100 if total_seconds > 0 else 0
+        print(f"{stage:<18}{seconds:>10.2f}s{percentage:>8.1f}%")
+
+    print(f"{'total':<18}{total_seconds:>10.2f}s")
+
+    return
+
+# # builds our merged and aggregate dataframes without publishing them, returns None, None if no pool had any data
+def compute_tvl_dfs(incremental=INCREMENTAL_REFRESH):
     protocol_df = get_protocol_pool_config_df()
 
     # # Here **
@@ -954,9 +1353,24 @@ def run_all():
 
     start_unix = int(date_to_unix_timestamp(START_DATE))
 
-    last_slug = ''
-    last_token = ''
-    last_pool_type = ''
+    # # bounds how long this run can spend waiting on DefiLlama
+    lc.start_run_deadline()
+    lc.reset_request_metrics()
+
+    # # an incremental refresh builds on top of what we last published, falling back to a full refresh if there is nothing yet
+    published_df = None
+
+    if incremental:
+        with time_stage('read_published'):
+            published_df, published_aggregate_df = get_published_dfs(protocol_df)
+
+            if published_df is not None:
+                refresh_df = get_refresh_from_date_df(published_df)
+
+    # # every payload is downloaded once and shared by all of the rows that need it
+    with time_stage('fetch'):
+        fetch_key_list, data_dict = fetch_protocol_pool_data(protocol_df)
+
     i = 0
 
     while i < len(protocol_slug_list):
@@ -966,124 +1380,237 @@ def run_all():
         pool_type = pool_type_list[i]
         token = token_list[i]
         chain = chain_list[i]
-        
-        # # we will only send another api ping if we are using a new slug
-        if last_slug != protocol_slug:
-            if pool_type == 'AMM':
-                old_protocol_slug = protocol_slug
-                protocol_slug = get_dex_pool_pool_id(protocol_slug)
-                data = get_historic_dex_tvl_json(protocol_slug)
-                protocol_slug = old_protocol_slug
-            else:
-                data = get_historic_protocol_tvl_json(protocol_slug)
-            time.sleep(COOLDOWN_TIME)
-        
-        elif pool_type != last_pool_type:
-            if pool_type == 'AMM':
-                old_protocol_slug = protocol_slug
-                protocol_slug = get_dex_pool_pool_id(protocol_slug)
-                data = get_historic_dex_tvl_json(protocol_slug)
-                protocol_slug = old_protocol_slug
-            else:
-                data = get_historic_protocol_tvl_json(protocol_slug)
-            time.sleep(COOLDOWN_TIME)
-        # print(data)
-        # Write the API response to a JSON file
-        # with open('contango_api_response.json', 'w') as file:
-        #     json.dump(data, file, indent=4)
 
-        else:
-            pass
-        
+        data = data_dict[fetch_key_list[i]]
 
-        # if last_pool_type != pool_type:
-        df = get_pool_type_df(data, protocol_blockchain, pool_type)
-        
-        df = filter_start_timestamp(df, start_unix)
-        df['pool_type'] = pool_type
-        if pool_type != 'AMM':
-            df = transpose_df(df)
-        elif pool_type == 'AMM':
-            df['token'] = token
-            df = df.rename(columns={'tvlUsd': 'token_amount'})
-            df = df[['timestamp', 'token', 'token_amount', 'pool_type']]
+        # # turning each payload into one row per token per timestamp
+        with time_stage('transpose'):
+            # if last_pool_type != pool_type:
+            df = get_pool_type_df(data, protocol_blockchain, pool_type)
 
-        df = add_start_token_amount_column(df)
-        df = add_change_in_token_amounts(df)
+            row_start_unix = start_unix
 
-        df.rename(columns = {'token_amount':'token_usd_amount', 'start_token_amount': 'start_token_usd_amount'}, inplace = True)
+            if published_df is not None:
+                row_start_unix = get_row_start_unix(refresh_df, protocol_slug, chain, token, pool_type, start_unix)
 
-        df = find_tvl_over_time(df)
-        df.to_csv('test_test.csv', index=False)
+            df = filter_start_timestamp(df, row_start_unix)
 
-        df['protocol'] = protocol_slug
-        df['chain'] = chain
+            # # nothing new for this pool yet
+            if len(df) < 1:
+                i += 1
+                continue
 
-        # # trying to cleanup token dataframes closer to the source
-        df = df_token_cleanup(protocol_df, df)
-        
-        # # tries to thin out data where each day only has one datapoint for this combo
-        df = df.drop_duplicates(subset=['date', 'chain', 'token', 'pool_type', 'protocol'], keep='last')
+            df['pool_type'] = pool_type
+            # # supply and borrow histories come back long already, only the wide dex frames still need melting
+            if pool_type != 'AMM' and 'token' not in df.columns:
+                df = transpose_df(df)
+            elif pool_type == 'AMM':
+                df['token'] = token
+                df = df.rename(columns={'tvlUsd': 'token_amount'})
+                df = df[['timestamp', 'token', 'token_amount', 'pool_type']]
 
-        df_list.append(df)
-        
-        # else:
-        #     pass
+        with time_stage('cleanup'):
+            df = add_start_token_amount_column(df)
+
+            if published_df is not None:
+                df = carry_forward_start_token_amount(df, refresh_df, protocol_slug, chain)
+
+            df = add_change_in_token_amounts(df)
+
+            df.rename(columns = {'token_amount':'token_usd_amount', 'start_token_amount': 'start_token_usd_amount'}, inplace = True)
+
+            df = find_tvl_over_time(df)
+
+            df['protocol'] = protocol_slug
+            df['chain'] = chain
 
-        # # updates our last known values to reduce api calls and computation needs
-        last_slug = protocol_slug
-        last_pool_type = pool_type
+            # # trying to cleanup token dataframes closer to the source
+            df = df_token_cleanup(protocol_df, df)
+            
+            # # tries to thin out data where each day only has one datapoint for this combo
+            df = df.drop_duplicates(subset=['date', 'chain', 'token', 'pool_type', 'protocol'], keep='last')
+
+        df_list.append(df)
 
         i += 1
 
-    df = pd.concat(df_list)
+    if len(df_list) < 1:
+        return None, None
+
+    with time_stage('cleanup'):
+        df = pd.concat(df_list)
+
+        # # every row's frame had its own tokens, this puts the combined one back on our schema
+        df = tvl_schema.apply_schema(df)
+
+        # # tries to thin out data where each day only has one datapoint for this combo
+        df = df.drop_duplicates(subset=['date', 'chain', 'token', 'pool_type', 'protocol'], keep='last')
 
-    # # tries to thin out data where each day only has one datapoint for this combo
-    df = df.drop_duplicates(subset=['date', 'chain', 'token', 'pool_type', 'protocol'], keep='last')
+        cumulative_incentives_df = None
+
+        if published_df is not None:
+            published_df, df, cumulative_incentives_df = split_published_and_new_rows(published_df, df, refresh_df)
 
     # df = df_token_cleanup(protocol_df, df)
-    incentive_df = get_incentive_df()
-    df = combine_incentives_with_tvl(df, incentive_df)
+    with time_stage('prices'):
+        incentive_df = get_incentive_days_df()
+
+        # # one batched price backfill covers our incentive tokens on incentive days and weth on tvl days
+        token_df_dict = {token_address: incentive_df for token_address in INCENTIVE_TOKEN_ADDRESS_LIST}
+        token_df_dict[WETH_TOKEN_ADDRESS] = df
+        prices_df = get_token_prices_df(token_df_dict)
 
-    tvl_df = df
-    df = get_weth_price_over_time(df)
+    with time_stage('incentives_merge'):
+        incentive_df = get_incentive_df(incentive_df, prices_df)
+        df = combine_incentives_with_tvl(df, incentive_df)
 
-    df = get_weth_price_change_since_start(df)
+    with time_stage('weth_merge'):
+        tvl_df = df
+        df = get_weth_price_change_since_start(prices_df)
 
-    merged_df = merge_tvl_and_weth_dfs(tvl_df, df)
+        merged_df = merge_tvl_and_weth_dfs(tvl_df, df)
 
-    merged_df = merged_df.drop_duplicates(subset=['date', 'chain', 'token', 'pool_type', 'protocol'])
+        merged_df = merged_df.drop_duplicates(subset=['date', 'chain', 'token', 'pool_type', 'protocol'])
 
-    merged_df = clean_up_bad_data_protocols(merged_df)
+        merged_df = clean_up_bad_data_protocols(merged_df)
 
     # merged_df = fix_protocol_segments(merged_df)
 
-    aggregate_df = get_aggregate_top_level_df(merged_df)
+    with time_stage('aggregate'):
+        if published_df is not None:
+            published_aggregate_df, aggregate_df = get_incremental_aggregate_df(published_df, published_aggregate_df, merged_df)
+        else:
+            aggregate_df = get_aggregate_top_level_df(merged_df)
 
-    merged_df = calculate_individual_protocol_incentive_roi(merged_df)
+        merged_df = calculate_individual_protocol_incentive_roi(merged_df, cumulative_incentives_df)
 
-    aggregate_df = aggregate_df.fillna(0)
-    
-    merged_df = merged_df.fillna(0)
+        aggregate_df = aggregate_df.fillna(0)
+        
+        merged_df = merged_df.fillna(0)
+
+        aggregate_df = aggregate_df.replace([np.inf, -np.inf], 0)
+        merged_df = merged_df.replace([np.inf, -np.inf], 0)
+
+        # # adds columns for our weth_price_adjustment
+        aggregate_df = get_weth_adjusted_df(aggregate_df)
+        merged_df = get_weth_adjusted_df(merged_df)
+
+        # # to help weed out the any days that haven't been indexed yet
+        aggregate_df = aggregate_df.loc[aggregate_df['raw_change_in_usd'] >= 0]
+
+        # # appends our new days onto what we already published
+        if published_df is not None:
+            merged_df = pd.concat([published_df, merged_df])
+            aggregate_df = pd.concat([published_aggregate_df, aggregate_df])
+
+        merged_df = tvl_schema.apply_schema(merged_df)
+        aggregate_df = tvl_schema.apply_schema(aggregate_df)
+        # aggregate_df = aggregate_df.loc[aggregate_df['date'] <= '2024-10-07']
+        # merged_df = merged_df.loc[merged_df['timestamp'] <= 1728345600]
+
+    return merged_df, aggregate_df
 
-    aggregate_df = aggregate_df.replace([np.inf, -np.inf], 0)
-    merged_df = merged_df.replace([np.inf, -np.inf], 0)
+# # uploads what compute_tvl_dfs built, zipped csv or parquet depending on cs.STORAGE_FORMAT
+def publish_tvl_dfs(merged_df, aggregate_df):
 
-    # # adds columns for our weth_price_adjustment
-    aggregate_df = get_weth_adjusted_df(aggregate_df)
-    merged_df = get_weth_adjusted_df(merged_df)
+    with time_stage('upload'):
+        cs.df_write_to_cloud_storage_in_format(merged_df, CLOUD_DATA_FILENAME, CLOUD_BUCKET_NAME)
 
-    # # to help weed out the any days that haven't been indexed yet
-    aggregate_df = aggregate_df.loc[aggregate_df['raw_change_in_usd'] >= 0]
-    # aggregate_df = aggregate_df.loc[aggregate_df['date'] <= '2024-10-07']
-    # merged_df = merged_df.loc[merged_df['timestamp'] <= 1728345600]
+        cs.df_write_to_cloud_storage_in_format(aggregate_df, CLOUD_AGGREGATE_FILENAME, CLOUD_BUCKET_NAME)
 
-    cs.df_write_to_cloud_storage_as_zip(merged_df, CLOUD_DATA_FILENAME, CLOUD_BUCKET_NAME)
+    with time_stage('api_payloads'):
+        publish_api_payloads()
 
-    cs.df_write_to_cloud_storage_as_zip(aggregate_df, CLOUD_AGGREGATE_FILENAME, CLOUD_BUCKET_NAME)
+    return
+
+# @app.route('/api/update_data', methods=['GET'])
+# @limiter.limit("100 per hour")  # Adjust this limit as needed
+def run_all(incremental=INCREMENTAL_REFRESH):
+
+    reset_stage_times()
+    instrumentation.reset_calls()
+
+    merged_df, aggregate_df = compute_tvl_dfs(incremental)
+
+    if merged_df is None:
+        return jsonify({"status": 200}), 200
+
+    publish_tvl_dfs(merged_df, aggregate_df)
+
+    logging.info('DefiLlama requests: %s', json.dumps(lc.get_request_metrics_summary()))
+    log_run_report('refresh')
     
     return jsonify({"status": 200}), 200
 
+# # logs where this run spent its time and writes it to instrumentation.RUN_REPORT_PATH (if set) so runs can be compared
+def log_run_report(command):
+
+    section_dict = {
+        'command': command,
+        'stages': get_stage_time_summary(),
+        'requests': lc.get_request_metrics_summary()
+    }
+
+    logging.info('Stage timings: %s', json.dumps(section_dict['stages']))
+    logging.info('Function timings: %s', json.dumps(instrumentation.get_call_summary()))
+
+    report_path = instrumentation.write_run_report(section_dict=section_dict)
+
+    if report_path is not None:
+        logging.info('Run report written to %s', report_path)
+
+    return
+
+# # downloads every payload our protocol_pool.csv needs, with the response cache on a later compute can run offline from them
+def fetch_all_payloads():
+
+    protocol_df = get_protocol_pool_config_df()
+
+    lc.start_run_deadline()
+    lc.reset_request_metrics()
+
+    with time_stage('fetch'):
+        fetch_key_list, data_dict = fetch_protocol_pool_data(protocol_df)
+
+    logging.info('DefiLlama requests: %s', json.dumps(lc.get_request_metrics_summary()))
+
+    return data_dict
+
+# # backfills weth and our incentive token prices for every day since START_DATE into our price store and token_prices.zip
+def backfill_prices():
+
+    lc.start_run_deadline()
+
+    with time_stage('prices'):
+        incentive_df = get_incentive_days_df()
+
+        date_df = pd.DataFrame({'date': pd.date_range(START_DATE, dt.now(timezone.utc).strftime('%Y-%m-%d'))})
+
+        token_df_dict = {token_address: incentive_df for token_address in INCENTIVE_TOKEN_ADDRESS_LIST}
+        token_df_dict[WETH_TOKEN_ADDRESS] = date_df
+        prices_df = get_token_prices_df(token_df_dict)
+
+    return prices_df
+
+# # where compute leaves its outputs for publish to pick up
+def get_output_path(output_dir, filename):
+    return os.path.join(output_dir, os.path.splitext(filename)[0] + '.csv')
+
+def write_output_dfs(merged_df, aggregate_df, output_dir):
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    merged_df.to_csv(get_output_path(output_dir, CLOUD_DATA_FILENAME), index=False)
+    aggregate_df.to_csv(get_output_path(output_dir, CLOUD_AGGREGATE_FILENAME), index=False)
+
+    return
+
+def read_output_dfs(output_dir):
+
+    merged_df = pd.read_csv(get_output_path(output_dir, CLOUD_DATA_FILENAME), dtype=tvl_schema.get_csv_dtype_dict())
+    aggregate_df = pd.read_csv(get_output_path(output_dir, CLOUD_AGGREGATE_FILENAME), dtype=tvl_schema.get_csv_dtype_dict())
+
+    return tvl_schema.apply_schema(merged_df), tvl_schema.apply_schema(aggregate_df)
 
 @lru_cache(maxsize=1)
 def get_incentive_combo_list() -> List[str]:
@@ -1096,49 +1623,272 @@ def get_incentive_combo_list() -> List[str]:
     )
     return incentive_history_df['combo_name'].unique().tolist()
 
-@lru_cache(maxsize=100)
-def cached_read_zip_csv_from_cloud_storage(filename, bucket_name):
-    print(f"Reading {filename} from {bucket_name}")  # To show when it's actually reading
-    return cs.read_zip_csv_from_cloud_storage(filename, bucket_name)
+# # the datasets and api payloads we serve, checked against their generation in storage and reloaded in the background when a refresh publishes new ones
+DATASET_CACHE = dataset_cache.DatasetCache()
 
+# # columns is a tuple so it can be part of our cache key, with parquet only those columns get read
+# # every caller gets its own shallow copy (copy on write), so nobody can change the cached frame under anyone else
+def cached_read_zip_csv_from_cloud_storage(filename, bucket_name, columns=None):
 
-# does as the name implies
-# @app.route('/api/pool_tvl_incentives_and_change_in_weth_price', methods=['GET'])
-# @limiter.limit("100 per hour")  # Adjust this limit as needed
-def get_pool_tvl_incentives_and_change_in_weth_price():
-    # df = cs.read_zip_csv_from_cloud_storage(CLOUD_DATA_FILENAME, CLOUD_BUCKET_NAME)
-    df = cached_read_zip_csv_from_cloud_storage(CLOUD_DATA_FILENAME, CLOUD_BUCKET_NAME)
+    def load_df():
+        print(f"Reading {filename} from {bucket_name}")  # To show when it's actually reading
+
+        return cs.read_from_cloud_storage_in_format(filename, bucket_name, columns=None if columns is None else list(columns))
+
+    def get_generation():
+        return cs.get_blob_generation(cs.get_format_filename(filename), bucket_name)
+
+    df = DATASET_CACHE.get(('dataset', filename, bucket_name, columns), load_df, get_generation)
+
+    # # only safe with copy on write, which pandas 3 always has (hence pandas>=3 in requirements.txt)
+    # # on pandas 2 writes through a shallow copy would land in the cached frame
+    return df.copy(deep=False)
+
+
+# # the columns our pool tvl endpoint serves
+POOL_TVL_COLUMN_LIST = ['date', 'chain', 'protocol', 'token', 'pool_type', 'token_usd_amount', 'raw_change_in_usd', 'percentage_change_in_usd', 'incentives_per_day_usd', 'weth_change_in_price_percentage', 'tvl_to_incentive_roi_percentage',
+    'adjusted_token_usd_amount', 'adjusted_raw_change_in_usd', 'adjusted_incentives_per_day_usd', 'adjusted_percentage_change_in_usd', 'adjusted_tvl_to_incentive_roi_percentage']
+
+# # the keys a pool tvl series is grouped by, in the order get_pool_tvl_series_key takes them
+POOL_TVL_GROUP_COLUMN_LIST = ['protocol', 'token', 'pool_type', 'chain']
+
+# # what a series is called in our pool tvl responses
+def get_pool_tvl_series_key(protocol, token, pool_type, chain):
+    return f"{protocol.capitalize()} {chain.capitalize()}: {token.upper()} {pool_type.capitalize()}"
+
+# # the rows of super_fest our pool tvl endpoint serves, only pools with incentives and with a datetime date
+def get_incentive_pool_tvl_df(df):
+    columns_to_keep = POOL_TVL_COLUMN_LIST
+
+    df = df.copy()
+
+    # # parquet gives our keys back as categories
+    df[['chain', 'protocol', 'token', 'pool_type']] = df[['chain', 'protocol', 'token', 'pool_type']].astype(str)
     df['combo_name'] = df['chain'] + df['protocol'] + df['token'] + df['pool_type']
     
     incentive_combo_list = get_incentive_combo_list()
     df = df[df['combo_name'].isin(incentive_combo_list)]
     
-    columns_to_keep = ['date', 'chain', 'protocol', 'token', 'pool_type', 'token_usd_amount', 'raw_change_in_usd', 'percentage_change_in_usd', 'incentives_per_day_usd', 'weth_change_in_price_percentage', 'tvl_to_incentive_roi_percentage',
-    'adjusted_token_usd_amount', 'adjusted_raw_change_in_usd', 'adjusted_incentives_per_day_usd', 'adjusted_percentage_change_in_usd', 'adjusted_tvl_to_incentive_roi_percentage']
     df = df[columns_to_keep]
     
-    # Convert 'date' column to datetime, sort, and format to ISO 8601
     df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date')
-    df['date'] = df['date'].dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-    
-    result: Dict[str, List[Dict]] = {}
-    for name, group in df.groupby(['protocol', 'token', 'pool_type', 'chain']):
-        key = f"{name[0].capitalize()} {name[3].capitalize()}: {name[1].upper()} {name[2].capitalize()}"  # Create a string key
-        result[key] = group.drop(['protocol', 'token', 'pool_type', 'chain'], axis=1).to_dict('records')
-    
-    return jsonify(result)
+
+    return df
+
+# # the columns of every record in a pool tvl series
+POOL_TVL_VALUE_COLUMN_LIST = [column for column in POOL_TVL_COLUMN_LIST if column not in POOL_TVL_GROUP_COLUMN_LIST]
+
+# # every series our pool tvl endpoint serves as (key value dictionary, series key, json of its records sorted by date, first day, last day)
+def get_pool_tvl_series_list(df):
+    df = get_incentive_pool_tvl_df(df)
+
+    df = df.sort_values(POOL_TVL_GROUP_COLUMN_LIST + ['date'], kind='stable').reset_index(drop=True)
+
+    # # every row serialized at once, a column at a time, so a series is just its rows joined
+    record_json_list = fast_json.get_record_json_list(df[POOL_TVL_VALUE_COLUMN_LIST], pool_query.DATE_FORMAT)
+    day_series = df['date'].dt.strftime('%Y-%m-%d')
+
+    series_list = []
+    for name, position_array in sorted(df.groupby(POOL_TVL_GROUP_COLUMN_LIST, sort=False).indices.items()):
+        start, stop = int(position_array[0]), int(position_array[-1]) + 1
+        key = get_pool_tvl_series_key(*name)  # Create a string key
+        series_list.append((dict(zip(POOL_TVL_GROUP_COLUMN_LIST, name)), key, b'[' + b','.join(record_json_list[start:stop]) + b']', day_series.iloc[start], day_series.iloc[stop - 1]))
+
+    return series_list
+
+def get_pool_tvl_series_index(df):
+    return pool_query.build_series_index(get_pool_tvl_series_list(df), POOL_TVL_VALUE_COLUMN_LIST)
+
+# # builds the response json of our pool tvl endpoint from super_fest as it reads back from our bucket, every series of the index in one object
+def get_pool_tvl_response_json(df):
+    return get_pool_tvl_series_index(df).query()
+
+# # our aggregate endpoint serves dates as 'YYYY-MM-DD' like the csv did, parquet gives them back as datetimes
+AGGREGATE_DATE_FORMAT = '%Y-%m-%d'
+
+# # builds the response json of our aggregate endpoint from super_fest_aggregate as it reads back from our bucket
+def get_aggregate_response_json(df):
+    return fast_json.dumps_records(df, AGGREGATE_DATE_FORMAT)
+
+POOL_TVL_PAYLOAD_NAME = 'pool_tvl_incentives_and_change_in_weth_price'
+AGGREGATE_PAYLOAD_NAME = 'aggregate_data'
+
+# # payload name -> (published file it is built from, columns it reads, function that turns them into our response json)
+API_PAYLOAD_SOURCE_DICT = {
+    POOL_TVL_PAYLOAD_NAME: (CLOUD_DATA_FILENAME, tuple(POOL_TVL_COLUMN_LIST), get_pool_tvl_response_json),
+    AGGREGATE_PAYLOAD_NAME: (CLOUD_AGGREGATE_FILENAME, None, get_aggregate_response_json)
+}
+
+# # builds and compresses one of our api payloads, read_function reads the published file it comes from
+def build_api_payload(payload_name, read_function=cs.read_from_cloud_storage_in_format):
+
+    filename, columns, response_function = API_PAYLOAD_SOURCE_DICT[payload_name]
+
+    if columns is not None:
+        columns = list(columns)
+
+    df = read_function(filename, CLOUD_BUCKET_NAME, columns=columns)
+
+    # # with the trailing newline jsonify always ended with
+    return api_payload.encode_payload(response_function(df) + b'\n')
+
+# # runs at the end of publish so our endpoints only ever hand out bytes
+# # built from the files we just wrote, read back the same way the endpoints used to read them
+def publish_api_payloads():
+
+    # # the pool tvl payload is every series of the index, so super_fest is only read and serialized once
+    series_index = build_pool_tvl_series_index()
+
+    payload_dict = {payload_name: build_api_payload(payload_name) for payload_name in API_PAYLOAD_SOURCE_DICT if payload_name != POOL_TVL_PAYLOAD_NAME}
+    payload_dict[POOL_TVL_PAYLOAD_NAME] = api_payload.encode_payload(series_index.query() + b'\n')
+
+    # # before the manifest, so whoever sees the new payloads finds the index that goes with them
+    pool_query.write_series_index_to_cloud_storage(series_index, POOL_TVL_SERIES_INDEX_FILENAME, CLOUD_BUCKET_NAME)
+
+    api_payload.write_payloads_to_cloud_storage(payload_dict, CLOUD_BUCKET_NAME)
+
+    # # a process that both refreshes and serves shouldn't wait for its next generation check to answer with them
+    DATASET_CACHE.invalidate()
+
+    return payload_dict
+
+# # our published payload, or if nothing was published yet one built from super_fest like the endpoints used to
+# # a new manifest (or a new super_fest while we are still building them ourselves) gets it reloaded in the background
+def get_api_payload(payload_name):
+
+    filename = API_PAYLOAD_SOURCE_DICT[payload_name][0]
+
+    def load_payload():
+
+        try:
+            payload = api_payload.read_payload_from_cloud_storage(payload_name, CLOUD_BUCKET_NAME)
+        except cs.StorageNotFoundError:
+            payload = build_api_payload(payload_name, lambda filename, bucket_name, columns: cached_read_zip_csv_from_cloud_storage(filename, bucket_name, None if columns is None else tuple(columns)))
+
+        return payload
+
+    def get_generation():
+        return cs.get_blob_generation(api_payload.API_MANIFEST_FILENAME, CLOUD_BUCKET_NAME), cs.get_blob_generation(cs.get_format_filename(filename), CLOUD_BUCKET_NAME)
+
+    return DATASET_CACHE.get(('api_payload', payload_name), load_payload, get_generation)
+
+# # answers with a payload as is, in the best encoding the client accepts and with a 304 if their etag still matches
+def serve_api_payload(payload_name):
+
+    payload = get_api_payload(payload_name)
+
+    # # called outside of a request (e.g. from a script) there are no headers to negotiate with
+    if not has_request_context():
+        return app.response_class(payload.get_body('identity'), mimetype='application/json')
+
+    if request.if_none_match.contains_weak(payload.etag):
+        response = app.response_class(status=304, mimetype='application/json')
+    else:
+        encoding = payload.choose_encoding(request.accept_encodings)
+        response = app.response_class(payload.get_body(encoding), mimetype='application/json')
+
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    # # every encoding is the same json, so they share one weak etag
+    response.set_etag(payload.etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+
+    return response
+
+# # the pool tvl series one by one, with the index our queries use, published next to the api payloads
+POOL_TVL_SERIES_INDEX_FILENAME = api_payload.API_PAYLOAD_PREFIX + 'pool_tvl_series_index.gz'
+
+# # read_function reads super_fest like in build_api_payload
+def build_pool_tvl_series_index(read_function=cs.read_from_cloud_storage_in_format):
+
+    df = read_function(CLOUD_DATA_FILENAME, CLOUD_BUCKET_NAME, columns=POOL_TVL_COLUMN_LIST)
+
+    return get_pool_tvl_series_index(df)
+
+# # our published series index, or if nothing was published yet one built from super_fest, reloaded like get_api_payload
+def get_pool_tvl_index():
+
+    def load_index():
+
+        try:
+            index = pool_query.read_series_index_from_cloud_storage(POOL_TVL_SERIES_INDEX_FILENAME, CLOUD_BUCKET_NAME)
+        except cs.StorageNotFoundError:
+            index = build_pool_tvl_series_index(lambda filename, bucket_name, columns: cached_read_zip_csv_from_cloud_storage(filename, bucket_name, tuple(columns)))
+
+        return index
+
+    def get_generation():
+        return cs.get_blob_generation(POOL_TVL_SERIES_INDEX_FILENAME, CLOUD_BUCKET_NAME), cs.get_blob_generation(cs.get_format_filename(CLOUD_DATA_FILENAME), CLOUD_BUCKET_NAME)
+
+    return DATASET_CACHE.get(('pool_tvl_index',), load_index, get_generation)
+
+# # answers a filtered pool tvl request, e.g. ?chain=base&protocol=aave-v3&start_date=2024-06-01&columns=token_usd_amount&limit=50
+# # the body has the same shape as the full payload, with limit or cursor it is wrapped as {"data": ..., "next_cursor": ...}, with format=ndjson it is a line per series
+def serve_pool_tvl_query(args):
+
+    index = get_pool_tvl_index()
+
+    try:
+        query_dict = pool_query.parse_query(args, index.value_column_list)
+    except pool_query.QueryError as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+
+    etag = index.get_query_etag(query_dict)
+
+    mimetype = 'application/x-ndjson' if query_dict.get('ndjson') else 'application/json'
+
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304, mimetype=mimetype)
+    else:
+        # # streamed a series at a time, so the first bytes go out right away and nothing holds the whole answer
+        # # json ends with the same trailing newline jsonify does
+        def generate():
+            yield from index.iter_query(**query_dict)
+
+            if not query_dict.get('ndjson'):
+                yield b'\n'
+
+        response = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+
+    response.set_etag(etag, weak=True)
+
+    return response
+
+# # rows of super_fest_aggregate serialized per line of our ndjson responses at a time
+NDJSON_CHUNK_ROWS = int(os.environ.get('NDJSON_CHUNK_ROWS', 1000))
+
+# # our aggregate data as one json record per line, streamed NDJSON_CHUNK_ROWS rows at a time
+def serve_aggregate_ndjson():
+
+    df = cached_read_zip_csv_from_cloud_storage(CLOUD_AGGREGATE_FILENAME, CLOUD_BUCKET_NAME)
+
+    def generate():
+        for start in range(0, len(df), NDJSON_CHUNK_ROWS):
+            yield b''.join(record_json + b'\n' for record_json in fast_json.get_record_json_list(df.iloc[start:start + NDJSON_CHUNK_ROWS], AGGREGATE_DATE_FORMAT))
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# does as the name implies
+# @app.route('/api/pool_tvl_incentives_and_change_in_weth_price', methods=['GET'])
+# @limiter.limit("100 per hour")  # Adjust this limit as needed
+def get_pool_tvl_incentives_and_change_in_weth_price():
+
+    # # any query parameter means the client wants part of the payload, see serve_pool_tvl_query
+    if has_request_context() and len(request.args) > 0:
+        return serve_pool_tvl_query(request.args)
+
+    return serve_api_payload(POOL_TVL_PAYLOAD_NAME)
 
 # # returns our cloud aggregate data
 # @app.route('/api/aggregate_data', methods=['GET'])
 # @limiter.limit("100 per hour")  # Adjust this limit as needed
 def get_aggregate_summary_data():
 
-    df = cached_read_zip_csv_from_cloud_storage(CLOUD_AGGREGATE_FILENAME, CLOUD_BUCKET_NAME)
-
-    data = df.to_dict(orient='records')
+    if has_request_context() and request.args.get('format') == 'ndjson':
+        return serve_aggregate_ndjson()
 
-    return jsonify(data)
+    return serve_api_payload(AGGREGATE_PAYLOAD_NAME)
 
 
 # # does as the name implies
@@ -1175,14 +1925,93 @@ def get_dex_pool_pool_id(protocol_slug):
 # if __name__ == '__main__':
 #     app.run(use_reloader=True, port=8000, threaded=True, DEBUG=True)
 
-start_time = time.time()
-# run_all()
-try:
-    run_all()
-except:
-    pass
-end_time = time.time()
-print('Finished in: ', end_time - start_time)
+def get_arg_parser():
+
+    parser = argparse.ArgumentParser(prog='defillama_tvl', description='Refreshes our published DefiLlama tvl, incentive and weth price data')
+    parser.add_argument('--report', default=instrumentation.RUN_REPORT_PATH, help='write a json report of stage and function timings here (RUN_REPORT_PATH)')
+    parser.add_argument('--trace-memory', action='store_true', default=instrumentation.TRACE_MEMORY, help='also record the peak memory of every instrumented call, a few times slower')
+    subparsers = parser.add_subparsers(dest='command')
+
+    refresh_parser = subparsers.add_parser('refresh', help='fetch, compute and publish in one go (the default)')
+    refresh_parser.add_argument('--incremental', action='store_true', default=INCREMENTAL_REFRESH, help='only recompute the days after what we already published')
+
+    subparsers.add_parser('fetch', help='download every DefiLlama payload into the response cache')
+
+    compute_parser = subparsers.add_parser('compute', help="build the merged and aggregate data into --output-dir without publishing it")
+    compute_parser.add_argument('--incremental', action='store_true', default=INCREMENTAL_REFRESH, help='only recompute the days after what we already published')
+    compute_parser.add_argument('--offline', action='store_true', help='only read DefiLlama payloads from the response cache, e.g. after a fetch')
+    compute_parser.add_argument('--output-dir', default=COMPUTE_OUTPUT_DIR)
+
+    publish_parser = subparsers.add_parser('publish', help='upload what compute left in --output-dir to our bucket')
+    publish_parser.add_argument('--output-dir', default=COMPUTE_OUTPUT_DIR)
+
+    subparsers.add_parser('prices', help='backfill weth and incentive token prices since START_DATE')
+
+    return parser
+
+# # python main.py [refresh|fetch|compute|publish|prices] or python -m defillama_tvl ..., with no command we run a full refresh
+# # importing main.py (e.g. to serve our api) never kicks one off
+def main(argv=None):
+
+    args = get_arg_parser().parse_args(argv)
+
+    command = args.command
+
+    if command is None:
+        command = 'refresh'
+        args.incremental = INCREMENTAL_REFRESH
+
+    instrumentation.RUN_REPORT_PATH = args.report
+    instrumentation.set_trace_memory(args.trace_memory)
+
+    start_time = time.time()
+
+    reset_stage_times()
+    instrumentation.reset_calls()
+
+    # # run_all answers with jsonify, which needs an app context outside of a request
+    with app.app_context():
+        if command == 'refresh':
+            run_all(args.incremental)
+
+        elif command == 'fetch':
+            data_dict = fetch_all_payloads()
+            print(f"Fetched {len(data_dict)} payloads")
+
+        elif command == 'compute':
+            if args.offline:
+                lc.response_cache.CACHE_OFFLINE = True
+
+            merged_df, aggregate_df = compute_tvl_dfs(args.incremental)
+
+            if merged_df is None:
+                print('No pool had any data, nothing to write')
+            else:
+                write_output_dfs(merged_df, aggregate_df, args.output_dir)
+                print(f"Wrote {len(merged_df)} merged and {len(aggregate_df)} aggregate rows to {args.output_dir}")
+
+        elif command == 'publish':
+            merged_df, aggregate_df = read_output_dfs(args.output_dir)
+            publish_tvl_dfs(merged_df, aggregate_df)
+            print(f"Published {len(merged_df)} merged and {len(aggregate_df)} aggregate rows")
+
+        elif command == 'prices':
+            prices_df = backfill_prices()
+            print(f"Price store has {len(prices_df)} prices")
+
+        # # run_all already reported on its refresh
+        if command != 'refresh':
+            log_run_report(command)
+
+    print_stage_times()
+
+    end_time = time.time()
+    print('Finished in: ', end_time - start_time)
+
+    return
+
+if __name__ == '__main__':
+    main()
 
 # df = cs.read_zip_csv_from_cloud_storage(CLOUD_DATA_FILENAME, CLOUD_BUCKET_NAME)
 # df = get_aggregate_top_level_df(df)
@@ -0,0 +1,271 @@
+import base64
+import binascii
+import bisect
+import gzip
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from cloud_storage import cloud_storage as cs
+from fast_json import fast_json
+
+# # the columns a query can filter on, each takes a comma separated list of values
+FILTER_COLUMN_LIST = ['chain', 'protocol', 'token', 'pool_type']
+# # most series a single page can hold
+MAX_LIMIT = int(os.environ.get('POOL_QUERY_MAX_LIMIT', 1000))
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+GZIP_LEVEL = 6
+
+class QueryError(ValueError):
+    pass
+
+# # every series of an endpoint already serialized, one after the other in body, with a small index of where each one starts and stops
+# # built once when we publish and read back whole by whoever serves it, so answering a query only touches the series it returns
+class SeriesIndex:
+
+    # # entry_list is [series key, key value dictionary, start, stop, first date, last date] per series, sorted by series key
+    def __init__(self, entry_list, body, value_column_list, etag):
+
+        self.body = body
+        self.value_column_list = value_column_list
+        self.etag = etag
+
+        self.series_key_list = [entry[0] for entry in entry_list]
+        # # series key -> (start, stop, first date, last date)
+        self.entry_dict = {entry[0]: tuple(entry[2:]) for entry in entry_list}
+        # # filter column -> lower cased value -> series keys with it
+        self.filter_dict = {}
+
+        for series_key, key_value_dict, *_ in entry_list:
+            for column, value in key_value_dict.items():
+                self.filter_dict.setdefault(column, {}).setdefault(str(value).lower(), set()).add(series_key)
+
+        self._entry_list = entry_list
+
+    # # for dataset_cache's size accounting, the index itself is tiny next to the series
+    def get_size(self):
+        return len(self.body) + 200 * len(self.series_key_list)
+
+    # # header line with the index, then the series json, gzipped as one object so the two can never disagree
+    def to_bytes(self):
+
+        header = fast_json.dumps({'etag': self.etag, 'value_column_list': self.value_column_list, 'entries': self._entry_list})
+
+        return gzip.compress(header + b'\n' + self.body, compresslevel=GZIP_LEVEL, mtime=0)
+
+    @classmethod
+    def from_bytes(cls, content):
+
+        header, body = gzip.decompress(content).split(b'\n', 1)
+        header_dict = fast_json.loads(header)
+
+        return cls(header_dict['entries'], body, header_dict['value_column_list'], header_dict['etag'])
+
+    def get_query_etag(self, query_dict):
+        return hashlib.sha256((self.etag + json.dumps(query_dict, sort_keys=True, default=str)).encode()).hexdigest()[:32]
+
+    def _get_series_json(self, series_key, start_date, end_date, column_list):
+
+        start, stop, first_date, last_date = self.entry_dict[series_key]
+
+        # # the whole series is outside the date range
+        if (start_date is not None and last_date < start_date) or (end_date is not None and first_date > end_date):
+            return None
+
+        series_json = self.body[start:stop]
+
+        if start_date is None and end_date is None and column_list is None:
+            return series_json
+
+        record_list = fast_json.loads(series_json)
+
+        # # records are sorted by date, so the range is found by bisecting on the day
+        if start_date is not None or end_date is not None:
+            start_position = 0 if start_date is None else bisect.bisect_left(record_list, start_date, key=lambda record: record['date'][:10])
+            stop_position = len(record_list) if end_date is None else bisect.bisect_right(record_list, end_date, key=lambda record: record['date'][:10])
+            record_list = record_list[start_position:stop_position]
+
+        if len(record_list) == 0:
+            return None
+
+        if column_list is not None:
+            record_list = [{column: record[column] for column in column_list} for record in record_list]
+
+        return fast_json.dumps(record_list)
+
+    # # yields the json of {series key: [records]} for every matching series a series at a time, so nothing holds the whole answer
+    # # with limit or cursor it is wrapped as {"data": ..., "next_cursor": ...}, next_cursor being null on the last page
+    # # with ndjson every series is its own {"data": [records], "series": series key} line instead, and a page ends with a {"next_cursor": ...} line
+    def iter_query(self, filter_dict=None, start_date=None, end_date=None, column_list=None, limit=None, cursor=None, ndjson=False):
+
+        series_key_list = self.series_key_list
+
+        for column, value_list in (filter_dict or {}).items():
+            matching_key_set = set()
+
+            for value in value_list:
+                matching_key_set |= self.filter_dict.get(column, {}).get(value.lower(), set())
+
+            series_key_list = [series_key for series_key in series_key_list if series_key in matching_key_set]
+
+        # # keyset pagination, a page starts right after the last series of the previous one
+        if cursor is not None:
+            series_key_list = series_key_list[bisect.bisect_right(series_key_list, cursor):]
+
+        next_cursor = None
+
+        if limit is not None and len(series_key_list) > limit:
+            series_key_list = series_key_list[:limit]
+            next_cursor = series_key_list[-1]
+
+        if column_list is not None:
+            column_list = ['date'] + [column for column in column_list if column != 'date']
+
+        paginated = limit is not None or cursor is not None
+
+        if not ndjson:
+            yield b'{"data":{' if paginated else b'{'
+
+        separator = b''
+
+        for series_key in series_key_list:
+            series_json = self._get_series_json(series_key, start_date, end_date, column_list)
+
+            if series_json is None:
+                continue
+
+            if ndjson:
+                yield b'{"data":' + series_json + b',"series":' + fast_json.dumps(series_key) + b'}\n'
+            else:
+                yield separator + fast_json.dumps(series_key) + b':' + series_json
+                separator = b','
+
+        if ndjson:
+            if paginated:
+                yield fast_json.dumps({'next_cursor': encode_cursor(next_cursor)}) + b'\n'
+        else:
+            yield b'},"next_cursor":' + fast_json.dumps(encode_cursor(next_cursor)) + b'}' if paginated else b'}'
+
+    def query(self, **query_dict):
+        return b''.join(self.iter_query(**query_dict))
+
+# # series_list is (key value dictionary, series key, json of its records sorted by date, first day, last day) per series
+# # a later series with the same key replaces an earlier one
+def build_series_index(series_list, value_column_list):
+
+    series_dict = {}
+
+    for key_value_dict, series_key, series_json, first_date, last_date in series_list:
+        series_dict[series_key] = (key_value_dict, series_json, first_date, last_date)
+
+    entry_list = []
+    part_list = []
+    position = 0
+
+    for series_key in sorted(series_dict):
+        key_value_dict, series_json, first_date, last_date = series_dict[series_key]
+
+        entry_list.append([series_key, key_value_dict, position, position + len(series_json), first_date, last_date])
+        part_list.append(series_json)
+        position += len(series_json)
+
+    body = b''.join(part_list)
+
+    return SeriesIndex(entry_list, body, value_column_list, hashlib.sha256(body).hexdigest()[:32])
+
+def write_series_index_to_cloud_storage(index, filename, bucketname):
+    return cs.write_bytes_to_cloud_storage(index.to_bytes(), filename, bucketname, content_type='application/gzip')
+
+# # raises cs.StorageNotFoundError if it was never published
+def read_series_index_from_cloud_storage(filename, bucketname):
+    return SeriesIndex.from_bytes(cs.read_bytes_from_cloud_storage(filename, bucketname))
+
+def encode_cursor(series_key):
+
+    if series_key is None:
+        return None
+
+    return base64.urlsafe_b64encode(json.dumps({'after': series_key}).encode()).decode()
+
+def decode_cursor(cursor):
+
+    try:
+        series_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))['after']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise QueryError(f"invalid cursor {cursor}")
+
+    # # we stream our answers, so anything that would only fail halfway through the query has to fail here
+    if not isinstance(series_key, str):
+        raise QueryError(f"invalid cursor {cursor}")
+
+    return series_key
+
+def _parse_date(args, name):
+
+    if name not in args:
+        return None
+
+    try:
+        return pd.Timestamp(args[name]).strftime('%Y-%m-%d')
+    except ValueError:
+        raise QueryError(f"{name} should look like YYYY-MM-DD, got {args[name]}")
+
+def _split_values(value):
+    return [item.strip() for item in value.split(',') if item.strip() != '']
+
+# # turns request args into SeriesIndex.query keyword arguments, raises QueryError for anything we can't answer
+# # chain, protocol, token, pool_type and columns take comma separated lists, start_date/end_date are inclusive YYYY-MM-DD
+# # limit (series per page) and cursor (from the previous page) paginate, format=ndjson streams a line per series
+def parse_query(args, value_column_list):
+
+    query_dict = {}
+
+    unknown_list = sorted(set(args) - set(FILTER_COLUMN_LIST) - {'start_date', 'end_date', 'columns', 'limit', 'cursor', 'format'})
+
+    if len(unknown_list) > 0:
+        raise QueryError(f"unknown query parameter(s) {unknown_list}")
+
+    filter_dict = {column: _split_values(args[column]) for column in FILTER_COLUMN_LIST if column in args}
+
+    if len(filter_dict) > 0:
+        query_dict['filter_dict'] = filter_dict
+
+    query_dict['start_date'] = _parse_date(args, 'start_date')
+    query_dict['end_date'] = _parse_date(args, 'end_date')
+
+    if 'columns' in args:
+        column_list = _split_values(args['columns'])
+        unknown_column_list = sorted(set(column_list) - set(value_column_list))
+
+        if len(unknown_column_list) > 0:
+            raise QueryError(f"unknown column(s) {unknown_column_list}, expected some of {value_column_list}")
+
+        query_dict['column_list'] = column_list
+
+    if 'limit' in args:
+        try:
+            limit = int(args['limit'])
+        except ValueError:
+            raise QueryError(f"limit should be a number, got {args['limit']}")
+
+        if limit < 1 or limit > MAX_LIMIT:
+            raise QueryError(f"limit should be between 1 and {MAX_LIMIT}")
+
+        query_dict['limit'] = limit
+
+    if 'cursor' in args:
+        query_dict['cursor'] = decode_cursor(args['cursor'])
+
+    if 'format' in args:
+        if args['format'] not in ['json', 'ndjson']:
+            raise QueryError(f"format should be json or ndjson, got {args['format']}")
+
+        # # only set when asked for, so plain json queries keep their etags
+        if args['format'] == 'ndjson':
+            query_dict['ndjson'] = True
+
+    return query_dict
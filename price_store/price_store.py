@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from cloud_storage import cloud_storage as cs
+
+# # local sqlite copy of our token_prices.zip so we don't download and parse the whole price history every time we need a price
+# # the bucket copy stays the source of truth, we only re-download it when its generation changes
+HOME_DIR = os.path.expanduser('~')
+PRICE_STORE_PATH = os.environ.get('PRICE_STORE_PATH', os.path.join(HOME_DIR, '.cache', 'defillama_tvl', 'token_prices.sqlite'))
+
+PRICE_COLUMN_LIST = ['symbol', 'token_address', 'timestamp', 'date', 'price']
+
+_STORE_LOCK = threading.Lock()
+
+def get_connection():
+
+    os.makedirs(os.path.dirname(PRICE_STORE_PATH), exist_ok=True)
+
+    connection = sqlite3.connect(PRICE_STORE_PATH)
+
+    # # (symbol, timestamp) is what we have always de-duplicated our prices on
+    # # token_key is the upper cased token address so lookups don't need to upper case every row
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS prices (
+            symbol TEXT NOT NULL,
+            token_address TEXT NOT NULL,
+            token_key TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            price REAL,
+            PRIMARY KEY (symbol, timestamp)
+        )
+    """)
+    connection.execute("CREATE INDEX IF NOT EXISTS prices_token_date ON prices (token_key, date)")
+    connection.execute("CREATE TABLE IF NOT EXISTS sync_state (filename TEXT PRIMARY KEY, generation TEXT)")
+
+    return connection
+
+def _get_row_list(df):
+
+    df = df[PRICE_COLUMN_LIST]
+
+    return list(zip(
+        df['symbol'].astype(str),
+        df['token_address'].astype(str),
+        df['token_address'].astype(str).str.upper(),
+        df['timestamp'].astype(float).astype(int),
+        df['date'].astype(str),
+        df['price'].astype(float)
+    ))
+
+def _get_stored_generation(connection, filename):
+
+    row = connection.execute("SELECT generation FROM sync_state WHERE filename = ?", (filename,)).fetchone()
+
+    if row is None:
+        return None
+
+    return row[0]
+
+def _set_stored_generation(connection, filename, generation):
+    connection.execute("INSERT OR REPLACE INTO sync_state (filename, generation) VALUES (?, ?)", (filename, str(generation)))
+
+    return
+
+# # makes our local store match the bucket copy, only downloading it if it changed since we last looked
+def sync_from_cloud(filename, bucketname):
+
+    try:
+        generation = cs.get_blob_generation(filename, bucketname)
+    except Exception as e:
+        print(f"Could not check {filename} in {bucketname}, using our local prices: {e}")
+        return
+
+    if generation is None:
+        return
+
+    with _STORE_LOCK:
+        connection = get_connection()
+
+        try:
+            if _get_stored_generation(connection, filename) == str(generation):
+                return
+
+            cloud_df = cs.read_zip_csv_from_cloud_storage(filename, bucketname)
+
+            with connection:
+                connection.execute("DELETE FROM prices")
+                connection.executemany("INSERT OR IGNORE INTO prices VALUES (?, ?, ?, ?, ?, ?)", _get_row_list(cloud_df))
+                _set_stored_generation(connection, filename, generation)
+        finally:
+            connection.close()
+
+    return
+
+# # returns the dates in date_list we have no price for, each check is an index probe on (token_key, date)
+def get_missing_dates(token_address, date_list):
+
+    date_list = [str(unique_date) for unique_date in date_list]
+
+    if len(date_list) < 1:
+        return []
+
+    connection = get_connection()
+
+    try:
+        row_list = connection.execute(
+            "SELECT DISTINCT date FROM prices WHERE token_key = ? AND date BETWEEN ? AND ?",
+            (token_address.upper(), min(date_list), max(date_list))
+        ).fetchall()
+    finally:
+        connection.close()
+
+    stored_date_set = set(row[0] for row in row_list)
+
+    return [unique_date for unique_date in date_list if unique_date not in stored_date_set]
+
+# # adds newly fetched prices, they replace anything we already had for the same symbol and timestamp
+def add_prices(df):
+
+    if len(df) < 1:
+        return
+
+    with _STORE_LOCK:
+        connection = get_connection()
+
+        try:
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?)", _get_row_list(df))
+        finally:
+            connection.close()
+
+    return
+
+# # returns every stored price in the order they were added
+def get_prices_df():
+
+    connection = get_connection()
+
+    try:
+        df = pd.read_sql_query("SELECT symbol, token_address, timestamp, date, price FROM prices ORDER BY rowid", connection)
+    finally:
+        connection.close()
+
+    return df
+
+# # uploads our local prices to the bucket and remembers the generation we wrote so the next sync doesn't download it again
+def publish_to_cloud(filename, bucketname):
+
+    df = get_prices_df()
+
+    cs.df_write_to_cloud_storage_as_zip(df, filename, bucketname)
+
+    generation = cs.get_blob_generation(filename, bucketname)
+
+    with _STORE_LOCK:
+        connection = get_connection()
+
+        try:
+            with connection:
+                _set_stored_generation(connection, filename, generation)
+        finally:
+            connection.close()
+
+    return df
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# # our helper packages are imported from the repo root, e.g. from dataset_cache import dataset_cache
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
@@ -0,0 +1,175 @@
+import threading
+import time
+
+import pandas as pd
+
+from dataset_cache import dataset_cache
+
+# # a dataset in storage, load returns its current version and generation says which one that is
+class FakeDataset:
+
+    def __init__(self):
+        self.generation = 1
+        self.load_count = 0
+        self.fail_generation = False
+
+    def load(self):
+        self.load_count += 1
+        return f"v{self.generation}"
+
+    def get_generation(self):
+        if self.fail_generation:
+            raise OSError('storage is down')
+
+        return self.generation
+
+def make_cache(**kwargs):
+    kwargs.setdefault('check_interval_seconds', 0)
+    kwargs.setdefault('ttl_seconds', 60)
+    kwargs.setdefault('max_bytes', 1024 * 1024)
+    kwargs.setdefault('background_refresh', False)
+
+    return dataset_cache.DatasetCache(**kwargs)
+
+def test_get_loads_once():
+    cache = make_cache(check_interval_seconds=60)
+    dataset = FakeDataset()
+
+    assert cache.get('a', dataset.load, dataset.get_generation) == 'v1'
+    assert cache.get('a', dataset.load, dataset.get_generation) == 'v1'
+
+    assert dataset.load_count == 1
+    assert cache.get_stats()['hits'] == 1
+    assert cache.get_stats()['misses'] == 1
+
+def test_new_generation_is_reloaded():
+    cache = make_cache()
+    dataset = FakeDataset()
+
+    cache.get('a', dataset.load, dataset.get_generation)
+    dataset.generation = 2
+
+    assert cache.get('a', dataset.load, dataset.get_generation) == 'v2'
+    assert cache.get_stats()['reloads'] == 1
+
+def test_same_generation_is_not_reloaded():
+    cache = make_cache()
+    dataset = FakeDataset()
+
+    cache.get('a', dataset.load, dataset.get_generation)
+    cache.get('a', dataset.load, dataset.get_generation)
+
+    assert dataset.load_count == 1
+
+def test_background_reload_serves_old_snapshot_until_swapped():
+    cache = make_cache(background_refresh=True)
+    dataset = FakeDataset()
+
+    cache.get('a', dataset.load, dataset.get_generation)
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_load():
+        started.set()
+        release.wait(5)
+        return dataset.load()
+
+    dataset.generation = 2
+
+    # # kicks off the reload and answers straight away with what we have
+    assert cache.get('a', slow_load, dataset.get_generation) == 'v1'
+    assert started.wait(5)
+    assert cache.get('a', slow_load, dataset.get_generation) == 'v1'
+
+    release.set()
+
+    deadline = time.time() + 5
+    while cache.entry_dict['a'].refreshing and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert cache.get('a', slow_load, dataset.get_generation) == 'v2'
+
+def test_failed_check_keeps_serving():
+    cache = make_cache()
+    dataset = FakeDataset()
+
+    cache.get('a', dataset.load, dataset.get_generation)
+    dataset.fail_generation = True
+
+    assert cache.get('a', dataset.load, dataset.get_generation) == 'v1'
+    assert cache.get_stats()['check_errors'] == 1
+
+    # # and picks up the new generation once storage is back
+    dataset.fail_generation = False
+    dataset.generation = 2
+
+    assert cache.get('a', dataset.load, dataset.get_generation) == 'v2'
+
+def test_entry_past_ttl_is_a_miss():
+    cache = make_cache(check_interval_seconds=60, ttl_seconds=0.05)
+    dataset = FakeDataset()
+
+    cache.get('a', dataset.load)
+    time.sleep(0.1)
+    cache.get('a', dataset.load)
+
+    assert dataset.load_count == 2
+    assert cache.get_stats()['evictions'] == 1
+
+def test_get_sweeps_idle_entries():
+    cache = make_cache(check_interval_seconds=0.05, ttl_seconds=0.05)
+    dataset = FakeDataset()
+
+    cache.get('idle', dataset.load)
+    cache.get('busy', dataset.load)
+    time.sleep(0.1)
+
+    # # nothing loads here, the sweep in get alone has to drop the idle dataset
+    cache.entry_dict['busy'].last_access = time.time()
+    cache.get('busy', dataset.load)
+
+    assert 'idle' not in cache.entry_dict
+    assert 'busy' in cache.entry_dict
+
+def test_size_eviction_drops_least_recently_used():
+    cache = make_cache(check_interval_seconds=60)
+    df = pd.DataFrame({'value': range(1000)})
+    cache.max_bytes = dataset_cache.get_value_size(df) * 2 + 1
+
+    cache.get('a', lambda: df.copy())
+    cache.get('b', lambda: df.copy())
+    cache.get('a', lambda: df.copy())
+    cache.get('c', lambda: df.copy())
+
+    assert sorted(cache.entry_dict) == ['a', 'c']
+
+def test_a_dataset_bigger_than_max_bytes_still_stays():
+    cache = make_cache(check_interval_seconds=60, max_bytes=1)
+
+    assert cache.get('a', lambda: pd.DataFrame({'value': range(1000)}))['value'].sum() == 499500
+    assert 'a' in cache.entry_dict
+
+def test_invalidate():
+    cache = make_cache(check_interval_seconds=60)
+    dataset = FakeDataset()
+
+    cache.get('a', dataset.load)
+    cache.get('b', dataset.load)
+
+    cache.invalidate('a')
+    assert sorted(cache.entry_dict) == ['b']
+
+    cache.invalidate()
+    assert cache.entry_dict == {}
+
+def test_get_value_size():
+
+    class Sized:
+        def get_size(self):
+            return 123
+
+    df = pd.DataFrame({'value': range(10)})
+
+    assert dataset_cache.get_value_size(df) == int(df.memory_usage(deep=True).sum())
+    assert dataset_cache.get_value_size(Sized()) == 123
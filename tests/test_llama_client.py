@@ -0,0 +1,112 @@
+import time
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from llama_client import llama_client as lc
+
+URL = 'https://api.llama.fi/protocol/aave-v3'
+
+# # answers every request with whatever the test queued up next, a status code or an exception to raise
+class ScriptedAdapter(BaseAdapter):
+
+    def __init__(self):
+        super().__init__()
+        self.outcome_list = []
+        self.request_count = 0
+
+    def send(self, request, **kwargs):
+        self.request_count += 1
+        outcome = self.outcome_list.pop(0)
+
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        response = requests.Response()
+        response.status_code = outcome
+        response._content = b'{}'
+        response.url = request.url
+        response.request = request
+
+        return response
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def adapter(monkeypatch):
+
+    monkeypatch.setattr(lc, 'MAX_ATTEMPTS', 1)
+    monkeypatch.setattr(lc, 'CIRCUIT_BREAKER_THRESHOLD', 2)
+    monkeypatch.setattr(lc, 'CIRCUIT_BREAKER_COOLDOWN_SECONDS', 0.05)
+    lc.configure_rate_limit(1000, 1000)
+    lc.start_run_deadline(60)
+
+    adapter = ScriptedAdapter()
+    lc.get_session().mount('https://', adapter)
+
+    yield adapter
+
+    lc.get_session().mount('https://', HTTPAdapter())
+    lc.start_run_deadline(60)
+
+def open_breaker(adapter):
+
+    adapter.outcome_list += [503, 503]
+
+    for _ in range(2):
+        assert lc.rate_limited_get(URL).status_code == 503
+
+    with pytest.raises(lc.CircuitOpenError):
+        lc.rate_limited_get(URL)
+
+    time.sleep(0.1)
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ChunkedEncodingError('connection broken'),
+    requests.exceptions.ContentDecodingError('bad gzip'),
+    requests.exceptions.TooManyRedirects('redirect loop')
+])
+def test_failed_trial_doesnt_leave_the_breaker_open(adapter, error):
+
+    open_breaker(adapter)
+
+    # # the half open trial blows up with something other than a connection error or timeout
+    adapter.outcome_list.append(error)
+
+    # # broken bodies are retried until we run out of attempts, anything else is raised as is
+    with pytest.raises((requests.RequestException, lc.LlamaRequestError)):
+        lc.rate_limited_get(URL)
+
+    # # the host gets its next trial after the cooldown and, now healthy, closes the breaker
+    time.sleep(0.1)
+    adapter.outcome_list += [200, 200]
+
+    assert lc.rate_limited_get(URL).status_code == 200
+    assert lc.rate_limited_get(URL).status_code == 200
+
+def test_broken_body_is_retried(adapter, monkeypatch):
+
+    monkeypatch.setattr(lc, 'MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(lc, 'BACKOFF_BASE_SECONDS', 0)
+
+    adapter.outcome_list += [requests.exceptions.ChunkedEncodingError('connection broken'), 200]
+
+    assert lc.rate_limited_get(URL).status_code == 200
+    assert adapter.request_count == 2
+
+def test_open_breaker_fails_fast_during_cooldown(adapter, monkeypatch):
+
+    monkeypatch.setattr(lc, 'CIRCUIT_BREAKER_COOLDOWN_SECONDS', 60)
+    lc.start_run_deadline(60)
+
+    adapter.outcome_list += [503, 503]
+
+    for _ in range(2):
+        lc.rate_limited_get(URL)
+
+    with pytest.raises(lc.CircuitOpenError):
+        lc.rate_limited_get(URL)
+
+    assert adapter.request_count == 2
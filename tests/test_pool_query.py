@@ -0,0 +1,209 @@
+import base64
+import json
+
+import pytest
+
+from fast_json import fast_json
+from pool_query import pool_query
+
+VALUE_COLUMN_LIST = ['date', 'token_usd_amount', 'incentives_per_day_usd']
+
+# # (protocol, chain, token, pool_type, days in january 2024)
+SERIES_LIST = [
+    ('aave-v3', 'Base', 'WETH', 'supply', range(1, 11)),
+    ('aave-v3', 'Base', 'USDC', 'supply', range(1, 11)),
+    ('aave-v3', 'Optimism', 'WETH', 'borrow', range(5, 8)),
+    ('moonwell', 'Base', 'WETH', 'supply', range(20, 25))
+]
+
+def get_series_key(protocol, chain, token, pool_type):
+    return f"{protocol.capitalize()} {chain.capitalize()}: {token.upper()} {pool_type.capitalize()}"
+
+def make_record_list(day_range):
+    return [{'date': f"2024-01-{day:02d}T00:00:00.000000Z", 'token_usd_amount': day * 100.0, 'incentives_per_day_usd': day * 1.5} for day in day_range]
+
+@pytest.fixture
+def index():
+
+    series_list = []
+
+    for protocol, chain, token, pool_type, day_range in SERIES_LIST:
+        record_list = make_record_list(day_range)
+        key_value_dict = {'protocol': protocol, 'chain': chain, 'token': token, 'pool_type': pool_type}
+
+        series_list.append((key_value_dict, get_series_key(protocol, chain, token, pool_type), fast_json.dumps(record_list), record_list[0]['date'][:10], record_list[-1]['date'][:10]))
+
+    return pool_query.build_series_index(series_list, VALUE_COLUMN_LIST)
+
+def run_query(index, **query_dict):
+    return json.loads(index.query(**query_dict))
+
+def encode(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+def test_unfiltered_query_is_every_series(index):
+
+    result = run_query(index)
+
+    assert list(result) == sorted(get_series_key(*series[:4]) for series in SERIES_LIST)
+    assert result['Aave-v3 Base: WETH Supply'] == make_record_list(range(1, 11))
+
+def test_filters_are_case_insensitive_and_combine(index):
+
+    assert sorted(run_query(index, filter_dict={'chain': ['base']})) == ['Aave-v3 Base: USDC Supply', 'Aave-v3 Base: WETH Supply', 'Moonwell Base: WETH Supply']
+
+    # # values of one column are or-ed, columns are and-ed
+    assert sorted(run_query(index, filter_dict={'chain': ['base', 'optimism'], 'token': ['weth'], 'protocol': ['AAVE-V3']})) == ['Aave-v3 Base: WETH Supply', 'Aave-v3 Optimism: WETH Borrow']
+
+    assert run_query(index, filter_dict={'chain': ['arbitrum']}) == {}
+
+def test_date_range_is_inclusive(index):
+
+    result = run_query(index, start_date='2024-01-03', end_date='2024-01-06')
+
+    assert [record['date'][:10] for record in result['Aave-v3 Base: WETH Supply']] == ['2024-01-03', '2024-01-04', '2024-01-05', '2024-01-06']
+    assert [record['date'][:10] for record in result['Aave-v3 Optimism: WETH Borrow']] == ['2024-01-05', '2024-01-06']
+
+    # # series with nothing in the range are left out
+    assert 'Moonwell Base: WETH Supply' not in result
+
+def test_open_ended_date_range(index):
+
+    assert sorted(run_query(index, start_date='2024-01-11')) == ['Moonwell Base: WETH Supply']
+    assert len(run_query(index, end_date='2024-01-05')['Aave-v3 Base: USDC Supply']) == 5
+
+def test_columns_keep_date(index):
+
+    result = run_query(index, column_list=['incentives_per_day_usd'])
+
+    assert result['Moonwell Base: WETH Supply'][0] == {'date': '2024-01-20T00:00:00.000000Z', 'incentives_per_day_usd': 30.0}
+
+def test_keyset_pagination_walks_every_series(index):
+
+    series_key_list = []
+    cursor = None
+
+    while True:
+        page = run_query(index, limit=3, cursor=cursor)
+        assert len(page['data']) <= 3
+
+        series_key_list += list(page['data'])
+
+        if page['next_cursor'] is None:
+            break
+
+        cursor = pool_query.decode_cursor(page['next_cursor'])
+
+    assert series_key_list == index.series_key_list
+
+def test_pagination_applies_after_filters(index):
+
+    page = run_query(index, filter_dict={'chain': ['base']}, limit=2)
+
+    assert list(page['data']) == ['Aave-v3 Base: USDC Supply', 'Aave-v3 Base: WETH Supply']
+    assert list(run_query(index, filter_dict={'chain': ['base']}, limit=2, cursor=pool_query.decode_cursor(page['next_cursor']))['data']) == ['Moonwell Base: WETH Supply']
+
+def test_round_trip_through_bytes(index):
+
+    loaded_index = pool_query.SeriesIndex.from_bytes(index.to_bytes())
+
+    assert loaded_index.query() == index.query()
+    assert loaded_index.etag == index.etag
+    assert loaded_index.value_column_list == VALUE_COLUMN_LIST
+
+def test_query_etag_depends_on_query(index):
+
+    assert index.get_query_etag({'filter_dict': {'chain': ['base']}}) == index.get_query_etag({'filter_dict': {'chain': ['base']}})
+    assert index.get_query_etag({'filter_dict': {'chain': ['base']}}) != index.get_query_etag({'filter_dict': {'chain': ['optimism']}})
+
+def test_parse_query():
+
+    query_dict = pool_query.parse_query({'chain': 'base, optimism', 'start_date': '2024-01-03', 'columns': 'token_usd_amount', 'limit': '10', 'cursor': pool_query.encode_cursor('Aave-v3 Base: WETH Supply')}, VALUE_COLUMN_LIST)
+
+    assert query_dict == {
+        'filter_dict': {'chain': ['base', 'optimism']},
+        'start_date': '2024-01-03',
+        'end_date': None,
+        'column_list': ['token_usd_amount'],
+        'limit': 10,
+        'cursor': 'Aave-v3 Base: WETH Supply'
+    }
+
+@pytest.mark.parametrize('args', [
+    {'foo': '1'},
+    {'start_date': 'yesterday'},
+    {'columns': 'token_usd_amount,nope'},
+    {'limit': 'ten'},
+    {'limit': '0'},
+    {'limit': str(pool_query.MAX_LIMIT + 1)},
+    {'cursor': '!!'},
+    {'cursor': encode([1])},
+    {'cursor': encode({'before': 'x'})},
+    # # valid json, but not something we can page from
+    {'cursor': encode({'after': 5})},
+    {'cursor': encode({'after': None})}
+])
+def test_parse_query_rejects(args):
+
+    with pytest.raises(pool_query.QueryError):
+        pool_query.parse_query(args, VALUE_COLUMN_LIST)
+
+def read_ndjson(content):
+    return [json.loads(line) for line in content.decode().splitlines()]
+
+def test_ndjson_is_a_line_per_series(index):
+
+    content = index.query(ndjson=True)
+
+    assert content.endswith(b'\n')
+
+    line_list = read_ndjson(content)
+
+    assert [line['series'] for line in line_list] == index.series_key_list
+    assert {line['series']: line['data'] for line in line_list} == run_query(index)
+
+def test_ndjson_filters_and_dates(index):
+
+    line_list = read_ndjson(index.query(filter_dict={'token': ['weth']}, start_date='2024-01-06', end_date='2024-01-09', ndjson=True))
+
+    assert [line['series'] for line in line_list] == ['Aave-v3 Base: WETH Supply', 'Aave-v3 Optimism: WETH Borrow']
+    assert len(line_list[0]['data']) == 4
+
+def test_ndjson_page_ends_with_cursor_line(index):
+
+    line_list = read_ndjson(index.query(limit=3, ndjson=True))
+
+    assert len(line_list) == 4
+    assert pool_query.decode_cursor(line_list[-1]['next_cursor']) == index.series_key_list[2]
+
+    last_line_list = read_ndjson(index.query(limit=3, cursor=index.series_key_list[2], ndjson=True))
+
+    assert [line['series'] for line in last_line_list[:-1]] == index.series_key_list[3:]
+    assert last_line_list[-1] == {'next_cursor': None}
+
+def test_unpaginated_ndjson_has_no_cursor_line(index):
+    assert all('series' in line for line in read_ndjson(index.query(ndjson=True)))
+
+def test_iter_query_yields_a_series_at_a_time(index):
+
+    # # opening, one chunk per series, closing
+    chunk_list = list(index.iter_query())
+
+    assert len(chunk_list) == len(index.series_key_list) + 2
+    assert b''.join(chunk_list) == index.query()
+    assert len(list(index.iter_query(ndjson=True))) == len(index.series_key_list)
+
+def test_paginated_json_stream_is_valid_json(index):
+
+    page = json.loads(b''.join(index.iter_query(filter_dict={'chain': ['optimism']}, limit=5)))
+
+    assert page == {'data': {'Aave-v3 Optimism: WETH Borrow': make_record_list(range(5, 8))}, 'next_cursor': None}
+
+def test_parse_query_format():
+
+    assert pool_query.parse_query({'format': 'ndjson'}, VALUE_COLUMN_LIST)['ndjson'] is True
+    # # plain json keeps the query (and its etag) as it was
+    assert 'ndjson' not in pool_query.parse_query({'format': 'json'}, VALUE_COLUMN_LIST)
+
+    with pytest.raises(pool_query.QueryError):
+        pool_query.parse_query({'format': 'xml'}, VALUE_COLUMN_LIST)
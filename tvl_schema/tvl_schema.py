@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# # the column types our tvl, incentive and aggregate dataframes share from ingest until they are published
+# # apply_schema only touches columns that are present and not already the right type, so calling it on a typed frame is cheap
+
+# # the pool keys we group, merge and filter on, every pool repeats them on every day so they are stored once as categories
+# # symbol and token_address stay strings, they can be missing before our forward fill and categories can't be filled with 0
+KEY_COLUMN_LIST = ['protocol', 'protocol_slug', 'chain', 'token', 'pool_type']
+
+# # unix seconds
+TIMESTAMP_COLUMN_LIST = ['timestamp', 'timestamp_weth']
+
+DATE_COLUMN_LIST = ['date']
+
+METRIC_COLUMN_LIST = [
+    'token_usd_amount', 'start_token_usd_amount', 'raw_change_in_usd', 'percentage_change_in_usd', 'daily_tvl',
+    'epoch_token_incentives', 'incentives_per_day', 'price', 'op_price', 'incentives_per_day_usd',
+    'weth_price', 'weth_start_price', 'weth_change_in_price_usd', 'weth_change_in_price_percentage',
+    'cumulative_incentives_usd', 'tvl_to_incentive_roi_percentage',
+    'adjusted_token_usd_amount', 'adjusted_raw_change_in_usd', 'adjusted_incentives_per_day_usd',
+    'adjusted_weth_change_in_price_percentage', 'adjusted_percentage_change_in_usd', 'adjusted_tvl_to_incentive_roi_percentage'
+]
+
+# # float32 halves the memory our metrics take up, at the cost of ~7 significant digits, so it is opt in
+USE_FLOAT32 = os.environ.get('TVL_FLOAT32', '0') == '1'
+METRIC_DTYPE = np.float32 if USE_FLOAT32 else np.float64
+
+# # dtypes to hand pd.read_csv so our published csvs come back typed instead of as strings
+# # timestamps are parsed as floats since older files wrote them as 1720396800.0, apply_schema makes them int64 afterwards
+def get_csv_dtype_dict():
+
+    dtype_dict = {column: 'category' for column in KEY_COLUMN_LIST}
+    dtype_dict.update({column: np.float64 for column in TIMESTAMP_COLUMN_LIST})
+    dtype_dict.update({column: METRIC_DTYPE for column in METRIC_COLUMN_LIST})
+
+    return dtype_dict
+
+# # categories in alphabetical order, so sorting and grouping on a key gives the same order plain strings did
+def _to_category(series):
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        category_list = list(series.cat.categories)
+
+        if category_list == sorted(category_list):
+            return series
+
+        return series.cat.reorder_categories(sorted(category_list))
+
+    return series.astype(pd.CategoricalDtype(sorted(series.dropna().unique())))
+
+# # casts whatever columns of df our schema knows about, other columns are left alone
+def apply_schema(df):
+
+    for column in df.columns:
+        if column in KEY_COLUMN_LIST:
+            df[column] = _to_category(df[column])
+
+        elif column in TIMESTAMP_COLUMN_LIST:
+            if df[column].dtype != np.int64:
+                timestamp_series = pd.to_numeric(df[column])
+
+                # # a missing timestamp can't be stored as an int64, those stay floats until they are filled
+                if not timestamp_series.isna().any():
+                    timestamp_series = timestamp_series.astype(np.int64)
+
+                df[column] = timestamp_series
+
+        elif column in DATE_COLUMN_LIST:
+            if not pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = pd.to_datetime(df[column])
+
+        elif column in METRIC_COLUMN_LIST:
+            if df[column].dtype != METRIC_DTYPE:
+                df[column] = df[column].astype(METRIC_DTYPE)
+
+    return df